@@ -1,20 +1,75 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.http import QueryDict
 
 # Register your models here.
-from .models import Author, Genre, Book, BookInstance, Language
+from .models import Author, Genre, Book, BookInstance, Language, PageVisits
+from .pagination import EstimatedCountPaginator
 
 admin.site.register(Genre)
 admin.site.register(Language)
 
+@admin.register(PageVisits)
+class PageVisitsAdmin(admin.ModelAdmin):
+    # Written by catalog.visits
+    list_display = ('page', 'count')
+    readonly_fields = ('page', 'count')
+
+# Inlines show one page of the related objects at a time, so that an author with
+# thousands of books or a book with thousands of copies still opens quickly
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Inline formset editing one page of the related objects, chosen by ?<prefix>-page=."""
+    per_page = 20
+    request = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Pages are sliced by ordering, so it ends in the pk: rows that tie on the ordering
+        # (copies with the same due_back) would otherwise shift between pages
+        queryset = self.queryset
+        ordering = queryset.query.order_by or (queryset.query.default_ordering and queryset.model._meta.ordering) or ()
+        queryset = queryset.order_by(*ordering, 'pk')
+        self.paginator = Paginator(queryset, self.per_page)
+        page_number = self.request.GET.get(f'{self.prefix}-page') if self.request else None
+        self.page = self.paginator.get_page(page_number)
+        self.queryset = self.page.object_list
+
+    def page_query(self, number):
+        """The current query string with this formset's page set to number, keeping the filters and other pages."""
+        query = self.request.GET.copy() if self.request else QueryDict(mutable=True)
+        query[f'{self.prefix}-page'] = number
+        return query.urlencode()
+
+    def previous_page_query(self):
+        return self.page_query(self.page.previous_page_number()) if self.page.has_previous() else ''
+
+    def next_page_query(self):
+        return self.page_query(self.page.next_page_number()) if self.page.has_next() else ''
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    formset = PaginatedInlineFormSet
+    template = 'admin/catalog/paginated_tabular.html'
+    per_page = 20
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.request = request
+        formset.per_page = self.per_page
+        return formset
+
 # Define the admin class
 
-class BooksInline(admin.TabularInline):
+class BooksInline(PaginatedTabularInline):
     model = Book
     extra = 0
 
 class AuthorAdmin(admin.ModelAdmin):
     list_display = ('last_name', 'first_name', 'date_of_birth', 'date_of_death')
     fields = ['first_name', 'last_name', ('date_of_birth', 'date_of_death')]
+    search_fields = ('last_name', 'first_name')
     inlines = [BooksInline]
 
 # Register the admin class with the associated model
@@ -22,20 +77,38 @@ admin.site.register(Author, AuthorAdmin)
 
 # Register the Admin classes for Book using the decorator
 
-class BooksInstanceInline(admin.TabularInline):
+class BooksInstanceInline(PaginatedTabularInline):
     model = BookInstance
     extra = 0
+    raw_id_fields = ('borrower',)
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'display_genre', 'language')
+    # The rows' foreign keys and genres are fetched with the page, not once per row
+    list_select_related = ('author', 'language')
+    search_fields = ('title', '=isbn')
+    autocomplete_fields = ('author',)
+    # Large changelists are not counted, see EstimatedCountPaginator
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [BooksInstanceInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('genre')
+
 # Register the Admin classes for BookInstance using the decorator
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
     list_display = ('book', 'status', 'borrower', 'due_back', 'id')
     list_filter = ('status', 'due_back')
+    list_select_related = ('book', 'borrower')
+    # The model's ordering, with the primary key so that the changelist can read a page off an index
+    ordering = ('due_back', 'id')
+    autocomplete_fields = ('book',)
+    raw_id_fields = ('borrower',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         (None, {
@@ -45,4 +118,3 @@ class BookInstanceAdmin(admin.ModelAdmin):
             'fields': ('status', 'due_back', 'borrower')
         }),
     )
-
@@ -0,0 +1,316 @@
+"""Read-only JSON API for the catalog: books, authors, copies and loans.
+
+Rows are read with .values() and written out as they come, without building
+model instances. Lists are paged with CursorPaginator (?cursor=, ?limit=) and
+?fields= selects a subset of the fields. Every response carries a strong ETag
+and a Last-Modified header made from the versions of the models it is built
+from (see catalog.caching), so a client revalidating with If-None-Match or
+If-Modified-Since gets a 304 without the database being queried. Response
+bodies are also cached under their ETag, for the clients that don't have one.
+"""
+import datetime
+import functools
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+
+from catalog.caching import get_version, get_versions, model_version_name
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.pagination import CursorPaginator, InvalidCursor
+from catalog.querybudget import query_budget
+from catalog.routers import use_primary
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Genre names are keyed on the Genre version, the timeout only expires copies no longer used
+GENRE_NAMES_TIMEOUT = 60 * 60
+
+
+class Resource:
+    """A model exposed by the API.
+
+    fields maps the API field names to the lookups passed to .values(), except
+    for the names in computed, which are filled in for each page of rows.
+    Resources with fields computed against today's date set depends_on_date,
+    so that their responses change with the date as well as the models.
+    """
+    depends_on_date = False
+
+    def __init__(self, name, model, fields, ordering, depends_on, permission=None, computed=()):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.ordering = ordering
+        self.depends_on = depends_on
+        self.permission = permission
+        self.computed = computed
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def add_computed(self, rows, fields):
+        """Fill the computed fields of a page of rows in place."""
+        pass
+
+
+def today():
+    """The date the resources depending on it are computed against."""
+    return datetime.date.today()
+
+
+def genre_names():
+    """Return {genre id: name}, cached for as long as no genre changes."""
+    key = f'catalog:api:genres:{get_version(model_version_name(Genre))}'
+    names = cache.get(key)
+    if names is None:
+        names = dict(Genre.objects.values_list('id', 'name'))
+        cache.set(key, names, GENRE_NAMES_TIMEOUT)
+    return names
+
+
+class BookResource(Resource):
+    def add_computed(self, rows, fields):
+        if 'genres' in fields:
+            # One query for the genres of the whole page, without a join: the names come from the cache
+            genres = defaultdict(list)
+            names = genre_names()
+            through = Book.genre.through.objects.filter(book_id__in=[row['id'] for row in rows])
+            for book_id, genre_id in through.values_list('book_id', 'genre_id'):
+                genres[book_id].append(names.get(genre_id, ''))
+            for row in rows:
+                row['genres'] = sorted(genres[row['id']])
+
+
+class LoanResource(Resource):
+    # Whether a loan is overdue changes at midnight
+    depends_on_date = True
+
+    def get_queryset(self):
+        return BookInstance.objects.on_loan().with_overdue(today())
+
+
+RESOURCES = {resource.name: resource for resource in [
+    BookResource(
+        'books', Book,
+        fields={
+            'id': 'id',
+            'title': 'title',
+            'isbn': 'isbn',
+            'summary': 'summary',
+            'author_id': 'author_id',
+            'author_first_name': 'author__first_name',
+            'author_last_name': 'author__last_name',
+            'language': 'language__name',
+            'genres': None,
+            'copies_total': 'copies_total',
+            'copies_available': 'copies_available',
+            'copies_on_loan': 'copies_on_loan',
+        },
+        ordering=('title', 'id'),
+        depends_on=(Book, Author, Genre, Language, BookInstance),
+        computed=('genres',),
+    ),
+    Resource(
+        'authors', Author,
+        fields={
+            'id': 'id',
+            'first_name': 'first_name',
+            'last_name': 'last_name',
+            'date_of_birth': 'date_of_birth',
+            'date_of_death': 'date_of_death',
+        },
+        ordering=('last_name', 'first_name', 'id'),
+        depends_on=(Author,),
+    ),
+    Resource(
+        'copies', BookInstance,
+        fields={
+            'id': 'id',
+            'book_id': 'book_id',
+            'title': 'book__title',
+            'imprint': 'imprint',
+            'status': 'status',
+            'due_back': 'due_back',
+        },
+        ordering=('id',),
+        depends_on=(BookInstance, Book),
+    ),
+    # Who has borrowed what is only shown to librarians
+    LoanResource(
+        'loans', BookInstance,
+        fields={
+            'id': 'id',
+            'book_id': 'book_id',
+            'title': 'book__title',
+            'due_back': 'due_back',
+            'overdue': 'overdue',
+            'borrower': 'borrower__username',
+        },
+        ordering=('due_back', 'id'),
+        depends_on=(BookInstance, Book, User),
+        permission='catalog.can_mark_returned',
+    ),
+]}
+
+
+def error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_view(view):
+    """Look up the resource named in the URL and check the permission it needs before calling view."""
+    @require_safe
+    @functools.wraps(view)
+    def wrapper(request, resource, **kwargs):
+        if resource not in RESOURCES:
+            return error(f'Unknown resource "{resource}".', 404)
+        resource = RESOURCES[resource]
+        if resource.permission and not request.user.has_perm(resource.permission):
+            return error('You do not have permission to read this resource.', 403)
+        response = view(request, resource, **kwargs)
+        # Responses may be stored, but have to be revalidated before they are used again
+        patch_cache_control(response, no_cache=True, private=bool(resource.permission))
+        return response
+    return wrapper
+
+
+def _versions(request, resource):
+    """Return the versions of the models the resource depends on, read from the cache once per request."""
+    if not hasattr(request, '_api_versions'):
+        names = [model_version_name(model) for model in resource.depends_on]
+        request._api_versions = [version for name, version in sorted(get_versions(*names).items())]
+    return request._api_versions
+
+
+def resource_etag(request, resource, pk=None):
+    """The same versions and the same query (on the same date, if it matters) always produce the same response body."""
+    date = today().isoformat() if resource.depends_on_date else None
+    key = repr((resource.name, pk, sorted(request.GET.lists()), _versions(request, resource), date))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def resource_last_modified(request, resource, pk=None):
+    # Versions are nanoseconds since the epoch
+    timestamp = max(_versions(request, resource)) / 1e9
+    if resource.depends_on_date:
+        timestamp = max(timestamp, datetime.datetime.combine(today(), datetime.time()).timestamp())
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def cached_by_etag(view):
+    """Keep the bodies of successful responses in the cache, keyed on their ETag.
+
+    The ETag changes whenever the body would, so a body found under it is
+    current and no query is needed to serve it again, to any client. How long
+    bodies are kept is set by CATALOG_API_CACHE_TIMEOUT (0 disables this).
+    """
+    @functools.wraps(view)
+    def wrapper(request, resource, **kwargs):
+        timeout = getattr(settings, 'CATALOG_API_CACHE_TIMEOUT', 300)
+        if not timeout:
+            return view(request, resource, **kwargs)
+        key = f'catalog:api:response:{resource_etag(request, resource, **kwargs)}'
+        body = cache.get(key)
+        if body is not None:
+            return HttpResponse(body, content_type='application/json')
+        # Read from the primary, which has the changes the versions in the ETag were bumped for
+        with use_primary():
+            response = view(request, resource, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.content, timeout)
+        return response
+    return wrapper
+
+
+def _selected_fields(request, resource):
+    """Return the API fields asked for with ?fields=, all of them by default."""
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(resource.fields)
+    fields = [field for field in fields.split(',') if field]
+    unknown = [field for field in fields if field not in resource.fields]
+    if unknown:
+        raise ValueError('Unknown field(s): %s.' % ', '.join(unknown))
+    return fields
+
+
+def _values(queryset, resource, fields):
+    """Return the queryset as .values() with the lookups needed for fields and the ordering."""
+    lookups = {resource.fields[field] for field in fields if field not in resource.computed}
+    lookups.update(resource.ordering)
+    if any(field in resource.computed for field in fields):
+        lookups.add('id')
+    return queryset.values(*lookups)
+
+
+def _serialize(rows, resource, fields):
+    resource.add_computed(rows, fields)
+    return [
+        {field: row[field] if field in resource.computed else row[resource.fields[field]] for field in fields}
+        for row in rows
+    ]
+
+
+def _page_url(request, token):
+    query = request.GET.copy()
+    query['cursor'] = token
+    return f'{request.path}?{query.urlencode()}'
+
+
+@query_budget(5)
+@api_view
+@condition(etag_func=resource_etag, last_modified_func=resource_last_modified)
+@cached_by_etag
+def resource_list(request, resource):
+    """List a resource a page at a time, in the resource's ordering."""
+    try:
+        fields = _selected_fields(request, resource)
+    except ValueError as e:
+        return error(str(e), 400)
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        return error(f'limit must be a number from 1 to {MAX_LIMIT}.', 400)
+
+    paginator = CursorPaginator(_values(resource.get_queryset(), resource, fields), limit, resource.ordering)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return error(str(e), 400)
+
+    return JsonResponse({
+        'results': _serialize(list(page.object_list), resource, fields),
+        'next': _page_url(request, page.next_page_number()) if page.has_next() else None,
+        'previous': _page_url(request, page.previous_page_number()) if page.has_previous() else None,
+    })
+
+
+@query_budget(5)
+@api_view
+@condition(etag_func=resource_etag, last_modified_func=resource_last_modified)
+@cached_by_etag
+def resource_detail(request, resource, pk):
+    """Return one row of a resource."""
+    try:
+        fields = _selected_fields(request, resource)
+    except ValueError as e:
+        return error(str(e), 400)
+    try:
+        pk = resource.model._meta.pk.to_python(pk)
+    except ValidationError:
+        return error('Not found.', 404)
+
+    rows = list(_values(resource.get_queryset().filter(pk=pk), resource, fields)[:1])
+    if not rows:
+        return error('Not found.', 404)
+    return JsonResponse(_serialize(rows, resource, fields)[0])
@@ -2,3 +2,13 @@ from django.apps import AppConfig
 
 class CatalogConfig(AppConfig):
     name = 'catalog'
+
+    def ready(self):
+        # Connect the signal handlers that keep the catalog caches up to date,
+        # the one tuning new database connections and the one writing visit counts,
+        # and register the system checks
+        from catalog import checks, db, signals, visits  # noqa: F401
+
+        # Compile the templates now rather than during the first requests, if configured to
+        from catalog.template_backend import preload_templates
+        preload_templates()
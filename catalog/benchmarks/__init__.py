@@ -0,0 +1,54 @@
+"""Benchmarks for the catalog, run with ``manage.py bench <suite>``.
+
+Each suite is a module in this package with a ``run(options)`` function that
+returns a JSON-serializable dict of results. The bench command runs suites
+against a throwaway copy of the database, the same way the test runner does,
+and records what was run with the results, so that two runs saved with
+--output can be compared.
+"""
+import math
+import statistics
+import time
+
+# Suite name -> module in this package
+SUITES = {
+    'api': 'catalog.benchmarks.api',
+    'asgi': 'catalog.benchmarks.asgi',
+    'database': 'catalog.benchmarks.database',
+    'import': 'catalog.benchmarks.importing',
+    'overdue': 'catalog.benchmarks.overdue',
+    'pagination': 'catalog.benchmarks.pagination',
+    'search': 'catalog.benchmarks.search',
+    'sessions': 'catalog.benchmarks.sessions',
+    'site': 'catalog.benchmarks.site',
+    'stampede': 'catalog.benchmarks.stampede',
+    'templates': 'catalog.benchmarks.templates',
+}
+
+
+def time_call(func, repeat=5):
+    """Call func repeat times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(timings, percent):
+    """Return the timing that percent % of the timings are at or below (nearest rank)."""
+    ordered = sorted(timings)
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def summarize(timings):
+    """Summarize a list of timings in milliseconds."""
+    return {
+        'runs': len(timings),
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+    }
@@ -0,0 +1,70 @@
+"""Requests per second served by the JSON API: built from the database, from the response cache, and 304s.
+
+Requests go straight to Django's WSGI handler, as they would in a worker
+process, rather than through the test client and its instrumentation.
+"""
+import time
+from urllib.parse import urlencode
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from catalog.benchmarks.search import create_books
+
+REQUESTS = 2000
+
+
+class Worker:
+    """Call the WSGI application like a server would, and keep the status and headers of the last response."""
+
+    def __init__(self):
+        self.application = WSGIHandler()
+        self.factory = RequestFactory()
+
+    def start_response(self, status, headers, exc_info=None):
+        self.status = int(status.split()[0])
+        self.headers = dict(headers)
+
+    def get(self, url, params, headers=None):
+        environ = self.factory._base_environ(
+            PATH_INFO=url, QUERY_STRING=urlencode(params), REQUEST_METHOD='GET', **(headers or {}))
+        response = self.application(environ, self.start_response)
+        b''.join(response)
+        response.close()
+        return self.status
+
+
+def requests_per_second(worker, url, params, headers, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        status = worker.get(url, params, headers)
+    elapsed = time.perf_counter() - start
+    return {'status': status, 'requests_per_second': round(count / elapsed)}
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+def run(options):
+    with transaction.atomic():
+        create_books(min(options['books'], 10000))
+
+    worker = Worker()
+    count = max(options['repeat'], 1) * REQUESTS // 5
+    results = {}
+    for name, url, params in [
+        ('book_list', reverse('api-list', kwargs={'resource': 'books'}), {}),
+        ('book_list_sparse', reverse('api-list', kwargs={'resource': 'books'}), {'fields': 'id,title', 'limit': 100}),
+        ('author_detail', reverse('api-detail', kwargs={'resource': 'authors', 'pk': 1}), {}),
+    ]:
+        worker.get(url, params)
+        etag = worker.headers['ETag']
+        with override_settings(CATALOG_API_CACHE_TIMEOUT=0):
+            uncached = requests_per_second(worker, url, params, {}, count)
+        results[name] = {
+            'uncached': uncached,
+            'cached': requests_per_second(worker, url, params, {}, count),
+            'not_modified': requests_per_second(worker, url, params, {'HTTP_IF_NONE_MATCH': etag}, count),
+        }
+    return {'requests': count, 'results': results}
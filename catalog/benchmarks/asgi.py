@@ -0,0 +1,143 @@
+"""Throughput of the catalog's pages under WSGI and ASGI, with concurrent clients.
+
+The same requests are made, by --concurrency clients at once, to:
+* the WSGI handler, one thread per client, as a threaded WSGI server would;
+* Django's ASGIHandler, one asyncio task per client, as an ASGI server would.
+
+Django 3.0 runs every view synchronously under ASGI too, each request handed
+to sync_to_async on the one thread they share, so ASGI serves a request at a
+time. Giving each request a thread of its own was measured slower than that
+on a single core; async views (Django 3.1) and the async ORM (4.1) are what
+would let the views await their queries instead.
+
+The clients request the home page, the book and author lists and details,
+and the loan lists, signed in as a librarian so that the page cache is
+bypassed. The applications are called directly, without a server, on a copy
+of the benchmark database under the production profile: the in-memory test
+database fails concurrent writes, such as saving sessions, at
+once instead of waiting for them.
+"""
+import asyncio
+import itertools
+import os
+import tempfile
+import threading
+import time
+
+import django
+from django.contrib.auth.models import Permission, User
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from catalog.benchmarks import summarize
+from catalog.benchmarks.api import Worker
+from catalog.benchmarks.data import generate_catalog
+from catalog.benchmarks.database import database_profile
+from catalog.models import Book
+
+# Copies in the generated catalog, at most
+MAX_INSTANCES = 100000
+
+
+def catalog_urls():
+    book = Book.objects.order_by('-copies_on_loan', 'pk').first()
+    return [
+        reverse('index'), reverse('books'), reverse('book-detail', args=[book.pk]), reverse('authors'),
+        reverse('author-detail', args=[book.author_id]), reverse('my-borrowed'), reverse('all-borrowed'),
+    ]
+
+
+def report(timings, statuses, elapsed):
+    return {
+        'status': sorted(statuses),
+        **summarize(timings),
+        'requests_per_second': round(len(timings) / elapsed),
+    }
+
+
+def run_wsgi(urls, count, concurrency, cookie):
+    timings, statuses = [], set()
+    lock = threading.Lock()
+
+    def client(urls):
+        worker = Worker()
+        try:
+            for url in itertools.islice(itertools.cycle(urls), count):
+                start = time.perf_counter()
+                status = worker.get(url, {}, {'HTTP_COOKIE': cookie})
+                with lock:
+                    timings.append((time.perf_counter() - start) * 1000)
+                    statuses.add(status)
+        finally:
+            connection.close()
+
+    # Each client starts at a different page
+    threads = [threading.Thread(target=client, args=(urls[i % len(urls):] + urls[:i % len(urls)],))
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return report(timings, statuses, time.perf_counter() - start)
+
+
+async def asgi_get(application, url, cookie):
+    """Make a GET request to an ASGI application and return the status."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': url, 'root_path': '', 'query_string': b'', 'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+        'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]['status']
+
+
+def run_asgi(application, urls, count, concurrency, cookie):
+    timings, statuses = [], set()
+
+    async def client(urls):
+        for url in itertools.islice(itertools.cycle(urls), count):
+            start = time.perf_counter()
+            statuses.add(await asgi_get(application, url, cookie))
+            timings.append((time.perf_counter() - start) * 1000)
+
+    async def clients():
+        await asyncio.gather(*(client(urls[i % len(urls):] + urls[:i % len(urls)]) for i in range(concurrency)))
+
+    start = time.perf_counter()
+    asyncio.run(clients())
+    return report(timings, statuses, time.perf_counter() - start)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+def run(options):
+    catalog = generate_catalog(min(options['instances'], MAX_INSTANCES))
+    librarian = User.objects.create_user(username='benchmark-librarian', password='benchmark')
+    librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+    client = Client()
+    client.force_login(librarian)
+    cookie = f'sessionid={client.cookies["sessionid"].value}'
+
+    urls = catalog_urls()
+    count, concurrency = options['requests'], options['concurrency']
+    results = {'catalog': catalog, 'concurrency': concurrency, 'requests_per_client': count}
+    with tempfile.TemporaryDirectory() as directory:
+        with database_profile('production', os.path.join(directory, 'asgi.sqlite3')):
+            results['wsgi'] = run_wsgi(urls, count, concurrency, cookie)
+            results['asgi'] = run_asgi(ASGIHandler(), urls, count, concurrency, cookie)
+    results['native_async'] = {
+        'skipped': f'the catalog views are synchronous, async views need Django 3.1 (this is {django.get_version()})',
+    }
+    return results
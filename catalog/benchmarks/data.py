@@ -0,0 +1,154 @@
+"""Synthetic catalogs for the benchmarks, from ten thousand to tens of millions of copies.
+
+Everything is sized from the number of copies (BookInstance rows), with
+distributions closer to a real library than uniform ones:
+
+* Books have 1 + a geometric number of copies, 3 on average.
+* Authors' output follows a Zipf distribution: a few authors wrote many
+  books, most wrote one or two. There is one author for every 8 books.
+* Books have one to three genres, popular genres much more often than rare
+  ones, and most books are in English.
+* 70% of the copies are available, 20% on loan, 5% in maintenance and 5%
+  reserved. A fifth of the loans are overdue.
+* There is a borrower for every 5 loans, some borrowing many more books
+  than others.
+
+Rows are written with bulk_create in batches, with explicit primary keys and
+the copy counters already filled in, so memory stays flat at any scale and
+no signal handler runs. The generator does what those handlers would do
+afterwards: it rebuilds the search index and gives the models new versions.
+The same seed always produces the same catalog.
+"""
+import datetime
+import random
+import uuid
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from catalog.caching import bump_model_versions
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.search import get_search_backend
+from catalog.stats import invalidate_catalog_stats
+
+BATCH_SIZE = 5000
+
+COPIES_PER_BOOK = 3
+
+BOOKS_PER_AUTHOR = 8
+
+LOANS_PER_BORROWER = 5
+
+GENRES = (
+    'Fiction', 'Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'Thriller', 'History', 'Biography',
+    'Horror', 'Poetry', 'Philosophy', 'Travel', 'Cooking', 'Science', 'Art', 'Drama', 'Humour', 'Religion',
+    'Children', 'Graphic Novel',
+)
+
+LANGUAGES = {'English': 70, 'French': 8, 'German': 6, 'Spanish': 6, 'Italian': 3, 'Japanese': 3, 'Farsi': 2, 'Russian': 2}
+
+STATUSES = {'a': 70, 'o': 20, 'm': 5, 'r': 5}
+
+WORDS = (
+    'shadow night river winter garden stone light empire house fire secret island city king queen '
+    'storm silver iron glass crown mountain sea war peace heart road dream ghost forest star'
+).split()
+
+
+def zipf_weights(count, exponent=1.1):
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def _copy_count(rng):
+    # 1 + geometric with mean COPIES_PER_BOOK - 1
+    count = 1
+    while rng.random() < 1 - 1 / COPIES_PER_BOOK:
+        count += 1
+    return count
+
+
+def _title(rng, number):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title() + f' {number}'
+
+
+def generate_catalog(copies, seed=0):
+    """Fill the database with a catalog of about copies copies, and return how many rows of each kind it has."""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    books = max(copies // COPIES_PER_BOOK, 1)
+    authors = max(books // BOOKS_PER_AUTHOR, 1)
+    borrowers = max(int(copies * STATUSES['o'] / 100) // LOANS_PER_BORROWER, 1)
+    totals = {'authors': authors, 'books': 0, 'copies': 0, 'loans': 0, 'borrowers': borrowers}
+
+    with transaction.atomic():
+        Genre.objects.bulk_create(Genre(name=name) for name in GENRES)
+        Language.objects.bulk_create(Language(name=name) for name in LANGUAGES)
+        genre_ids = list(Genre.objects.filter(name__in=GENRES).order_by('pk').values_list('pk', flat=True))
+        language_ids = list(Language.objects.filter(name__in=LANGUAGES).order_by('pk').values_list('pk', flat=True))
+
+        first_author = (Author.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        for start in range(0, authors, BATCH_SIZE):
+            Author.objects.bulk_create(
+                Author(id=first_author + i, first_name=rng.choice(WORDS).title(), last_name=f'{rng.choice(WORDS).title()} {i}')
+                for i in range(start, min(start + BATCH_SIZE, authors))
+            )
+
+        # One hashed password shared by all borrowers keeps this fast
+        password = make_password('benchmark')
+        first_borrower = (User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        for start in range(0, borrowers, BATCH_SIZE):
+            User.objects.bulk_create(
+                User(id=first_borrower + i, username=f'borrower{first_borrower + i}', password=password,
+                     email=f'borrower{first_borrower + i}@example.com')
+                for i in range(start, min(start + BATCH_SIZE, borrowers))
+            )
+
+        author_weights = zipf_weights(authors)
+        genre_weights = zipf_weights(len(genre_ids))
+        borrower_weights = zipf_weights(borrowers, exponent=0.8)
+        statuses, status_weights = list(STATUSES), list(accumulate(STATUSES.values()))
+        language_weights = list(accumulate(LANGUAGES.values()))
+
+        first_book = (Book.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        book_id = first_book
+        while totals['copies'] < copies:
+            batch_books, batch_genres, batch_copies = [], [], []
+            while len(batch_copies) < BATCH_SIZE and totals['copies'] + len(batch_copies) < copies:
+                book = Book(
+                    id=book_id,
+                    title=_title(rng, book_id),
+                    summary=' '.join(rng.choice(WORDS) for _ in range(30)),
+                    isbn=f'{book_id:013}',
+                    author_id=first_author + rng.choices(range(authors), cum_weights=author_weights)[0],
+                    language_id=rng.choices(language_ids, cum_weights=language_weights)[0],
+                )
+                for genre_id in set(rng.choices(genre_ids, cum_weights=genre_weights, k=rng.randint(1, 3))):
+                    batch_genres.append(Book.genre.through(book_id=book_id, genre_id=genre_id))
+                for _ in range(min(_copy_count(rng), copies - totals['copies'] - len(batch_copies))):
+                    status = rng.choices(statuses, cum_weights=status_weights)[0]
+                    copy = BookInstance(id=uuid.UUID(int=rng.getrandbits(128)), book_id=book_id,
+                                        imprint=f'{rng.choice(WORDS).title()} Press', status=status)
+                    if status == 'o':
+                        copy.borrower_id = first_borrower + rng.choices(range(borrowers), cum_weights=borrower_weights)[0]
+                        # A fifth of the loans are overdue
+                        copy.due_back = today + datetime.timedelta(days=rng.randint(-30, 120))
+                        totals['loans'] += 1
+                    batch_copies.append(copy)
+                    book.copies_total += 1
+                    book.copies_available += status == 'a'
+                    book.copies_on_loan += status == 'o'
+                batch_books.append(book)
+                book_id += 1
+            Book.objects.bulk_create(batch_books)
+            Book.genre.through.objects.bulk_create(batch_genres)
+            BookInstance.objects.bulk_create(batch_copies)
+            totals['books'] += len(batch_books)
+            totals['copies'] += len(batch_copies)
+
+    # Bulk writes send no signals, so do what the signal handlers would have done
+    get_search_backend().rebuild()
+    bump_model_versions(Author, Book, BookInstance, Genre, Language, User)
+    invalidate_catalog_stats()
+    return totals
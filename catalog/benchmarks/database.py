@@ -0,0 +1,155 @@
+"""Mixed read/write throughput of the catalog under each database profile (see DATABASE_PROFILES).
+
+The benchmark database is copied to a file for each profile, since WAL needs
+one. Reader threads then request the book list and book detail pages through
+the WSGI handler, with the page cache off, while writer threads check copies
+out and return them, each write ending like a request does by closing the
+connection unless CONN_MAX_AGE keeps it. Requests failing with "database is
+locked" are counted as errors.
+"""
+import itertools
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, close_old_connections, connection, connections, transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from catalog.benchmarks.api import Worker
+from catalog.benchmarks.search import create_books
+from catalog.models import Book, BookInstance, LoanStateError
+
+# Seconds each profile is run for
+DURATION = 5
+
+READERS = 8
+
+WRITERS = 4
+
+MAX_BOOKS = 20000
+
+
+def create_copies(book_ids):
+    BookInstance.objects.bulk_create(
+        BookInstance(id=uuid.uuid4(), book_id=book_id, imprint='Benchmark Imprint', status='a')
+        for book_id in book_ids
+    )
+
+
+def copy_database(path):
+    """Copy the benchmark database, wherever it is, to a file at path."""
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    connection.connection.backup(target)
+    target.close()
+
+
+class Totals:
+    """Counts shared by the reader and writer threads."""
+
+    def __init__(self):
+        self.counts = {'reads': 0, 'read_errors': 0, 'writes': 0, 'write_errors': 0}
+        self.lock = threading.Lock()
+
+    def add(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+def read(urls, deadline, totals):
+    worker = Worker()
+    for url in itertools.cycle(urls):
+        if time.monotonic() >= deadline:
+            break
+        totals.add('reads' if worker.get(url, {}) == 200 else 'read_errors')
+
+
+def write(copies, borrower, deadline, totals):
+    for copy in itertools.cycle(copies):
+        if time.monotonic() >= deadline:
+            break
+        for action in (lambda: copy.checkout(borrower), copy.mark_returned):
+            try:
+                action()
+                totals.add('writes')
+            except (DatabaseError, LoanStateError):
+                totals.add('write_errors')
+                copy.refresh_from_db()
+            close_old_connections()
+
+
+def run_thread(target, *args):
+    try:
+        target(*args)
+    finally:
+        connection.close()
+
+
+@contextmanager
+def database_profile(name, path, **overrides):
+    """Run the block against a copy of the benchmark database at path, configured by the named profile."""
+    database = connections.databases['default']
+    original = dict(database)
+    copy_database(path)
+    database.update({'NAME': path, 'CONN_MAX_AGE': 0, 'OPTIONS': {}, 'PRAGMAS': None})
+    database.update(settings.DATABASE_PROFILES[name], **overrides)
+    try:
+        yield
+    finally:
+        database.clear()
+        database.update(original)
+
+
+def run_profile(name, path, urls, copies, borrower):
+    totals = Totals()
+    deadline = time.monotonic() + DURATION
+    threads = [threading.Thread(target=run_thread, args=(read, urls, deadline, totals)) for _ in range(READERS)]
+    threads += [
+        threading.Thread(target=run_thread, args=(write, copies[i::WRITERS], borrower, deadline, totals))
+        for i in range(WRITERS)
+    ]
+    with database_profile(name, path):
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    result = dict(totals.counts)
+    result['reads_per_second'] = round(result['reads'] / elapsed)
+    result['writes_per_second'] = round(result['writes'] / elapsed)
+    return result
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], CATALOG_PAGE_CACHE_TIMEOUT=0)
+def run(options):
+    books = min(options['books'], MAX_BOOKS)
+    with transaction.atomic():
+        create_books(books)
+        book_ids = list(Book.objects.order_by('pk').values_list('pk', flat=True)[:200])
+        create_copies(book_ids)
+        borrower = User.objects.create_user(username='benchmark-reader')
+    copies = list(BookInstance.objects.all())
+    urls = [reverse('books')] + [reverse('book-detail', args=[book_id]) for book_id in book_ids[:20]]
+
+    # Failed requests are counted, not logged
+    logger = logging.getLogger('django.request')
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    results = {'books': books, 'readers': READERS, 'writers': WRITERS, 'seconds': DURATION}
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for name in settings.DATABASE_PROFILES:
+                results[name] = run_profile(name, os.path.join(directory, f'{name}.sqlite3'), urls, copies, borrower)
+    finally:
+        logger.setLevel(level)
+    return results
@@ -0,0 +1,47 @@
+"""Time manage.py import_catalog on a generated CSV file."""
+import csv
+import os
+import random
+import tempfile
+import time
+from io import StringIO
+
+from django.core.management import call_command
+
+COPIES_PER_BOOK = 5
+
+
+def write_catalog(path, copies, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['isbn', 'title', 'summary', 'author_first_name', 'author_last_name', 'language', 'genres', 'imprint', 'status'])
+        for i in range(copies):
+            book = i // COPIES_PER_BOOK
+            writer.writerow([
+                f'{book:013}',
+                f'Title {book}',
+                'A generated summary.',
+                f'First {book % 1000}',
+                f'Surname {book % 5000}',
+                rng.choice(('English', 'French', 'German')),
+                ';'.join(rng.sample(('Fantasy', 'Horror', 'Romance', 'Science Fiction', 'History'), 2)),
+                f'Imprint {i % 50}',
+                rng.choice('aaaom'),
+            ])
+
+
+def run(options):
+    copies = options['copies']
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'catalog.csv')
+        write_catalog(path, copies)
+        start = time.perf_counter()
+        call_command('import_catalog', path, stdout=StringIO())
+        elapsed = time.perf_counter() - start
+    return {
+        'copies': copies,
+        'books': copies // COPIES_PER_BOOK,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(copies / elapsed),
+    }
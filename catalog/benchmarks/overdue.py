@@ -0,0 +1,69 @@
+"""Time a full overdue sweep over a large number of loans."""
+import datetime
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from catalog.models import Book, BookInstance
+from catalog.overdue import Checkpoint, sweep_overdue
+
+BATCH_SIZE = 5000
+
+LOANS_PER_BORROWER = 4
+
+
+def create_loans(count):
+    borrowers = max(count // LOANS_PER_BORROWER, 1)
+    for start in range(0, borrowers, BATCH_SIZE):
+        User.objects.bulk_create(
+            User(username=f'reader{i}', email=f'reader{i}@example.com')
+            for i in range(start, min(start + BATCH_SIZE, borrowers))
+        )
+    borrower_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+    book = Book.objects.create(title='Benchmark Book', summary='Benchmark summary.', isbn='0000000000000')
+    today = datetime.date.today()
+    for start in range(0, count, BATCH_SIZE):
+        BookInstance.objects.bulk_create(
+            BookInstance(
+                id=uuid.uuid4(),
+                book=book,
+                imprint='Benchmark Imprint',
+                status='o',
+                borrower_id=borrower_ids[i % len(borrower_ids)],
+                # Half of the loans are overdue
+                due_back=today + datetime.timedelta(days=i % 60 - 30),
+            )
+            for i in range(start, min(start + BATCH_SIZE, count))
+        )
+
+
+def run(options):
+    count = options['loans']
+    today = datetime.date.today()
+    with transaction.atomic():
+        create_loans(count)
+
+    queryset = BookInstance.objects.filter(status='o', due_back__lt=today, borrower__isnull=False).order_by(
+        'borrower_id', 'due_back', 'id')
+    sql, params = queryset.values_list('borrower_id', 'due_back').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        plan = [row[-1] for row in cursor.fetchall()]
+
+    # The dummy backend discards the emails, so this times the sweep itself
+    with override_settings(EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend'):
+        start = time.perf_counter()
+        totals = sweep_overdue(today, Checkpoint(None, today), workers=4, batch_size=100)
+        elapsed = time.perf_counter() - start
+
+    return {
+        'loans': count,
+        'query_plan': plan,
+        'totals': totals,
+        'seconds': round(elapsed, 3),
+        'overdue_loans_per_second': round(totals['loans'] / elapsed) if elapsed else None,
+    }
@@ -0,0 +1,78 @@
+"""Compare OFFSET pagination with cursor pagination on shallow and deep pages."""
+import datetime
+import uuid
+
+from django.core.paginator import Paginator
+from django.db import transaction
+
+from catalog.benchmarks import summarize, time_call
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import FORWARD, CursorPaginator
+
+PAGE_SIZE = 10
+
+BATCH_SIZE = 5000
+
+
+def create_authors(count):
+    for start in range(0, count, BATCH_SIZE):
+        Author.objects.bulk_create(
+            Author(first_name=f'First {i % 97}', last_name=f'Surname {i % 1013}')
+            for i in range(start, min(start + BATCH_SIZE, count))
+        )
+
+
+def create_loans(count):
+    book = Book.objects.create(title='Benchmark Book', summary='Benchmark summary.', isbn='0000000000000')
+    today = datetime.date.today()
+    for start in range(0, count, BATCH_SIZE):
+        BookInstance.objects.bulk_create(
+            BookInstance(
+                id=uuid.uuid4(),
+                book=book,
+                imprint='Benchmark Imprint',
+                status='o',
+                due_back=today + datetime.timedelta(days=i % 365),
+            )
+            for i in range(start, min(start + BATCH_SIZE, count))
+        )
+
+
+def compare(queryset, ordering, deep_page, repeat):
+    """Time page 1 and deep_page with both paginators."""
+    queryset = queryset.order_by(*ordering)
+
+    def offset_page(number):
+        return lambda: list(Paginator(queryset, PAGE_SIZE).page(number))
+
+    # The cursor for deep_page points after the last row of the page before it
+    paginator = CursorPaginator(queryset, PAGE_SIZE, ordering)
+    previous_row = queryset[(deep_page - 1) * PAGE_SIZE - 1]
+    deep_token = paginator.encode_cursor(FORWARD, deep_page, previous_row)
+
+    def cursor_page(token):
+        return lambda: list(paginator.page(token))
+
+    return {
+        'offset_page_1': summarize(time_call(offset_page(1), repeat)),
+        f'offset_page_{deep_page}': summarize(time_call(offset_page(deep_page), repeat)),
+        'cursor_page_1': summarize(time_call(cursor_page(None), repeat)),
+        f'cursor_page_{deep_page}': summarize(time_call(cursor_page(deep_token), repeat)),
+    }
+
+
+def run(options):
+    deep_page = options['deep_page']
+    rows = deep_page * PAGE_SIZE
+    repeat = options['repeat']
+
+    with transaction.atomic():
+        create_authors(rows)
+        create_loans(rows)
+
+    return {
+        'rows': rows,
+        'page_size': PAGE_SIZE,
+        'authors': compare(Author.objects.all(), ('last_name', 'first_name', 'id'), deep_page, repeat),
+        'loans': compare(BookInstance.objects.filter(status__exact='o'), ('due_back', 'id'), deep_page, repeat),
+    }
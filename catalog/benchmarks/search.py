@@ -0,0 +1,63 @@
+"""Time full-text search queries against a synthetic catalog."""
+import random
+
+from django.db import transaction
+
+from catalog.benchmarks import summarize, time_call
+from catalog.models import Author, Book
+from catalog.search import get_search_backend
+
+BATCH_SIZE = 5000
+
+SYLLABLES = 'ka lo mi ne ra su ti vo ze da fe gi ho ju ly'.split()
+
+# A vocabulary of made-up words, drawn with a Zipf-like distribution like words in real text
+VOCABULARY = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+WEIGHTS = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+
+QUERIES = (
+    VOCABULARY[0],  # the most common word
+    VOCABULARY[100],
+    VOCABULARY[3000],  # a rare word
+    f'{VOCABULARY[10]} {VOCABULARY[500]}',
+    'kalo*',
+    'mystery4*',
+    '0000000004*',
+)
+
+
+def create_books(count, seed=0):
+    rng = random.Random(seed)
+    Author.objects.bulk_create(
+        Author(first_name=f'First{i}', last_name=f'Mystery{i}') for i in range(max(count // 20, 1))
+    )
+    author_ids = list(Author.objects.values_list('pk', flat=True))
+    for start in range(0, count, BATCH_SIZE):
+        Book.objects.bulk_create(
+            Book(
+                title=' '.join(rng.choices(VOCABULARY, WEIGHTS, k=3)).title(),
+                summary=' '.join(rng.choices(VOCABULARY, WEIGHTS, k=40)),
+                isbn=f'{i:013}',
+                author_id=rng.choice(author_ids),
+            )
+            for i in range(start, min(start + BATCH_SIZE, count))
+        )
+
+
+def run(options):
+    books = options['books']
+    with transaction.atomic():
+        create_books(books)
+    backend = get_search_backend()
+
+    # Bulk creation sends no signals, so index everything in one go
+    rebuild_ms = time_call(backend.rebuild, repeat=1)[0]
+    results = {
+        'books': books,
+        'backend': type(backend).__name__,
+        'rebuild_ms': round(rebuild_ms, 3),
+        'queries': {},
+    }
+    for query in QUERIES:
+        results['queries'][query] = summarize(time_call(lambda: backend.search(query), options['repeat']))
+    return results
@@ -0,0 +1,81 @@
+"""Database writes made by counting home page visits, in the session and in cookies (catalog.visits).
+
+The home page is requested by a crawler, which never sends cookies back, and
+by returning visitors, who do. It is requested as it is, counting visits in
+a cookie and in PageVisits, and through a view counting them in the session
+the way the home page used to. Writes are the INSERT, UPDATE and DELETE
+statements made, including the flushes of the visit counts.
+"""
+import itertools
+import time
+
+from django.contrib.sessions.models import Session
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import include, path, reverse
+
+from catalog import views
+from catalog.benchmarks.search import create_books
+from catalog.visits import page_visits
+
+RETURNING_VISITORS = 20
+
+
+def session_counted_index(request):
+    """The home page, counting visits in the session as it did before catalog.visits."""
+    num_visits = request.session.get('num_visits', 0)
+    request.session['num_visits'] = num_visits + 1
+    return views.index(request)
+
+
+urlpatterns = [
+    path('session-index/', session_counted_index, name='session-index'),
+    path('', include('locallibrary.urls')),
+]
+
+
+class WriteCounter:
+    """Execute wrapper counting the statements that write."""
+
+    def __init__(self):
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().split(' ', 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def measure(url, count, crawler):
+    clients = [Client() for _ in range(1 if crawler else RETURNING_VISITORS)]
+    sessions = Session.objects.count()
+    counter = WriteCounter()
+    start = time.perf_counter()
+    with connection.execute_wrapper(counter):
+        for client in itertools.islice(itertools.cycle(clients), count):
+            if crawler:
+                client.cookies.clear()
+            client.get(url)
+        page_visits.flush()
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': count,
+        'writes': counter.writes,
+        'writes_per_1000_requests': round(counter.writes * 1000 / count, 1),
+        'sessions_created': Session.objects.count() - sessions,
+        'requests_per_second': round(count / elapsed),
+    }
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], ROOT_URLCONF=__name__)
+def run(options):
+    create_books(min(options['books'], 10000))
+    count = max(options['requests'], 1) * 20
+    results = {}
+    for name, url in (('session', reverse('session-index')), ('cookie', reverse('index'))):
+        results[name] = {
+            'crawler': measure(url, count, crawler=True),
+            'returning_visitors': measure(url, count, crawler=False),
+        }
+    return results
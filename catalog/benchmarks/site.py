@@ -0,0 +1,210 @@
+"""Latency, throughput and queries of every URL in catalog.urls, on a generated catalog.
+
+Every URL is requested by an anonymous user and by a librarian holding all
+the catalog permissions, first through the Django test client, one request
+at a time, which also gives the queries each request made (see
+catalog.querybudget), then through a real server with concurrent clients:
+the standard library's WSGI server, or uvicorn with --server asgi when it is
+installed. Latencies are reported as percentiles in milliseconds.
+"""
+import http.client
+import threading
+import time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.contrib.auth.models import Permission, User
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import URLPattern, reverse
+
+from catalog import urls
+from catalog.api import RESOURCES
+from catalog.benchmarks import summarize
+from catalog.benchmarks.data import generate_catalog
+from catalog.export import EXPORTS
+from catalog.models import Author, Book, BookInstance
+
+LIBRARIAN_PERMISSIONS = ('can_mark_returned', 'can_edit_authors', 'can_edit_books')
+
+
+def sample_urls():
+    """Return [(name, method, url, body)] covering every URL pattern in catalog.urls."""
+    # The most borrowed book, its author and one of its copies on loan
+    book = Book.objects.order_by('-copies_on_loan', 'pk').first()
+    copy = BookInstance.objects.filter(book=book, status='o').first() or BookInstance.objects.first()
+    author_id = book.author_id or Author.objects.values_list('pk', flat=True).first()
+
+    arguments = {
+        'book-detail': [{'pk': book.pk}],
+        'author-detail': [{'pk': author_id}],
+        'renew-book-librarian': [{'pk': copy.pk}],
+        'export-catalog': [{'name': name} for name in EXPORTS],
+        'api-list': [{'resource': name} for name in RESOURCES],
+        'api-detail': [{'resource': 'books', 'pk': book.pk}, {'resource': 'authors', 'pk': author_id},
+                       {'resource': 'copies', 'pk': copy.pk}],
+        'author_update': [{'pk': author_id}],
+        'author_delete': [{'pk': author_id}],
+        'book_update': [{'pk': book.pk}],
+        'book_delete': [{'pk': book.pk}],
+    }
+    queries = {'search': '?q=shadow', 'all-borrowed': '?overdue=1'}
+    # Renewing a copy on loan leaves the catalog as it was, so it can be repeated
+    posts = {'circulation-batch': '{"action": "renew", "copies": ["%s"]}' % copy.pk}
+
+    samples = []
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        for kwargs in arguments.get(pattern.name, [{}]):
+            url = reverse(pattern.name, kwargs=kwargs) + queries.get(pattern.name, '')
+            # Patterns sampled more than once are told apart by their arguments
+            label = pattern.name
+            if len(arguments.get(pattern.name, [])) > 1:
+                label = '/'.join([pattern.name, *map(str, kwargs.values())])
+            if pattern.name in posts:
+                samples.append((label, 'POST', url, posts[pattern.name]))
+            else:
+                samples.append((label, 'GET', url, None))
+    return samples
+
+
+def client_request(client, method, url, body):
+    if method == 'POST':
+        response = client.post(url, body, content_type='application/json')
+    else:
+        response = client.get(url)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure_client(client, samples, count):
+    results = {}
+    for label, method, url, body in samples:
+        # The first request warms up the caches
+        response = client_request(client, method, url, body)
+        timings, queries = [], []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client_request(client, method, url, body)
+            timings.append((time.perf_counter() - start) * 1000)
+            metrics = getattr(response, 'query_metrics', None)
+            queries.append(metrics.queries if metrics else None)
+        results[label] = {
+            'status': response.status_code,
+            **summarize(timings),
+            'requests_per_second': round(count / (sum(timings) / 1000)),
+            'queries': max(queries, key=lambda q: q or 0),
+        }
+    return results
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # The default backlog of 5 makes concurrent clients wait a second to reconnect
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_wsgi_server():
+    """Serve the site on a free local port from a background thread, return (stop, port)."""
+    server = make_server('127.0.0.1', 0, WSGIHandler(), server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown, server.server_port
+
+
+def start_asgi_server():
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+
+    config = uvicorn.Config(get_asgi_application(), host='127.0.0.1', port=0, log_level='error', lifespan='off')
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    def stop():
+        server.should_exit = True
+    return stop, port
+
+
+def measure_server(port, samples, count, concurrency, cookie):
+    """Request each GET sample count times from concurrency threads, over a new connection each time."""
+    headers = {'Host': 'testserver'}
+    if cookie:
+        headers['Cookie'] = cookie
+    results = {}
+    for label, method, url, body in samples:
+        if method != 'GET':
+            # Would need a CSRF token, the test client covers it
+            continue
+        timings, statuses = [], set()
+        lock = threading.Lock()
+
+        def client(requests):
+            for _ in range(requests):
+                start = time.perf_counter()
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                connection.request('GET', url, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                connection.close()
+                with lock:
+                    timings.append((time.perf_counter() - start) * 1000)
+                    statuses.add(response.status)
+
+        threads = [threading.Thread(target=client, args=(count // concurrency or 1,)) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        results[label] = {
+            'status': sorted(statuses),
+            **summarize(timings),
+            'requests_per_second': round(len(timings) / elapsed),
+        }
+    return results
+
+
+@override_settings(ALLOWED_HOSTS=['testserver', '127.0.0.1'])
+def run(options):
+    start = time.perf_counter()
+    catalog = generate_catalog(options['instances'])
+    catalog['seconds'] = round(time.perf_counter() - start, 3)
+
+    # Staff too, for the metrics endpoint
+    librarian = User.objects.create_user(username='benchmark-librarian', password='benchmark', is_staff=True)
+    librarian.user_permissions.add(*Permission.objects.filter(codename__in=LIBRARIAN_PERMISSIONS))
+    clients = {'anonymous': Client(), 'librarian': Client()}
+    clients['librarian'].force_login(librarian)
+
+    samples = sample_urls()
+    count = options['requests']
+    results = {'catalog': catalog, 'requests': count, 'concurrency': options['concurrency'], 'test_client': {}}
+    for name, client in clients.items():
+        results['test_client'][name] = measure_client(client, samples, count)
+
+    server = options['server']
+    try:
+        stop, port = start_asgi_server() if server == 'asgi' else start_wsgi_server()
+    except ImportError as e:
+        results[server] = {'skipped': str(e)}
+        return results
+    try:
+        results[server] = {
+            name: measure_server(port, samples, count, options['concurrency'],
+                                 f'sessionid={client.cookies["sessionid"].value}' if 'sessionid' in client.cookies else None)
+            for name, client in clients.items()
+        }
+    finally:
+        stop()
+    return results
@@ -0,0 +1,86 @@
+"""Database queries made when a hot cache entry expires under many concurrent clients.
+
+Every client starts at the same moment, after the home page counts or a
+book's page have been dropped from the cache (cold) or have expired but are
+still within their stale grace period (expired). Without stampede protection
+each client recomputes the entry; with it the queries stay flat.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from catalog.benchmarks.api import Worker
+from catalog.benchmarks.search import create_books
+from catalog.caching import bump_version, instance_version_name
+from catalog.models import Book
+from catalog.stats import STATS_CACHE_KEY, compute_catalog_stats, get_catalog_stats
+
+
+def unprotected_catalog_stats():
+    """The home page counts read the naive way: whoever misses recomputes."""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_catalog_stats()
+        cache.set(STATS_CACHE_KEY, stats)
+    return stats
+
+
+def stampede(func, clients):
+    """Call func from clients threads released at once, return the queries they made and the time taken."""
+    barrier = threading.Barrier(clients + 1)
+    lock = threading.Lock()
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        with lock:
+            queries += 1
+        return execute(sql, params, many, context)
+
+    def client():
+        try:
+            with connection.execute_wrapper(count_queries):
+                barrier.wait()
+                func()
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return {'queries': queries, 'seconds': round(time.perf_counter() - start, 3)}
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+def run(options):
+    clients = options['clients']
+    with transaction.atomic():
+        create_books(options['books'])
+    results = {'clients': clients, 'books': options['books']}
+
+    cache.delete(STATS_CACHE_KEY)
+    results['stats_cold_unprotected'] = stampede(unprotected_catalog_stats, clients)
+    cache.delete(STATS_CACHE_KEY)
+    results['stats_cold'] = stampede(get_catalog_stats, clients)
+
+    book = Book.objects.order_by('pk').first()
+    url = reverse('book-detail', args=[book.pk])
+    with override_settings(CATALOG_PAGE_CACHE_TIMEOUT=0):
+        results['book_page_uncached'] = stampede(lambda: Worker().get(url, {}), clients)
+    # A new version for the book is the same as a cache miss
+    bump_version(instance_version_name(Book, book.pk))
+    results['book_page_cold'] = stampede(lambda: Worker().get(url, {}), clients)
+    with override_settings(CATALOG_PAGE_CACHE_TIMEOUT=3):
+        bump_version(instance_version_name(Book, book.pk))
+        Worker().get(url, {})
+        time.sleep(3.1)
+        results['book_page_expired'] = stampede(lambda: Worker().get(url, {}), clients)
+    return results
@@ -0,0 +1,81 @@
+"""Render cost of the catalog's pages per request, with and without cached compiled templates.
+
+Each page is rendered as a view renders it, getting the template then
+rendering it, with backends configured as:
+* uncached: templates read and compiled for every request, as with DEBUG on;
+* cached: the cached loader, compiling each template on its first request;
+* preloaded: the cached loader, with every template compiled at startup
+  (TEMPLATE_MODE 'production').
+
+The data is loaded before timing, so that only the templates are measured.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Prefetch
+from django.test import RequestFactory
+
+from catalog.benchmarks import summarize, time_call
+from catalog.benchmarks.search import create_books
+from catalog.models import Book, BookInstance
+from catalog.stats import get_catalog_stats
+from catalog.template_backend import DjangoTemplates
+
+FILE_LOADERS = ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+
+MODES = {
+    'uncached': {'loaders': FILE_LOADERS},
+    'cached': {'loaders': [('django.template.loaders.cached.Loader', FILE_LOADERS)]},
+    'preloaded': {'loaders': [('django.template.loaders.cached.Loader', FILE_LOADERS)], 'preload': True},
+}
+
+
+def create_backend(options):
+    params = {key: value for key, value in settings.TEMPLATES[0].items() if key != 'BACKEND'}
+    return DjangoTemplates({
+        **params,
+        'NAME': 'benchmark',
+        'APP_DIRS': False,
+        'OPTIONS': {**params['OPTIONS'], 'preload': False, **options},
+    })
+
+
+def page_contexts():
+    """Return {template name: context} for a few of the site's pages."""
+    books = list(Book.objects.select_related('author').order_by('title', 'id')[:10])
+    book = (
+        Book.objects.select_related('author', 'language')
+        .prefetch_related('genre', Prefetch('bookinstance_set', queryset=BookInstance.objects.all()))
+        .order_by('pk').first()
+    )
+    return {
+        'index.html': {**get_catalog_stats(), 'num_visits': 3},
+        'catalog/book_list.html': {'book_list': books, 'is_paginated': False},
+        'catalog/book_detail.html': {'book': book, 'copies': list(book.bookinstance_set.all()), 'copies_version': 1},
+        'registration/login.html': {'form': AuthenticationForm()},
+    }
+
+
+def run(options):
+    create_books(min(options['books'], 1000))
+    request = RequestFactory().get('/')
+    request.user = AnonymousUser()
+    contexts = page_contexts()
+    repeat = max(options['repeat'], 1) * 20
+
+    results = {}
+    for mode, mode_options in MODES.items():
+        backend = create_backend(mode_options)
+        result = results[mode] = {}
+        if backend.preload:
+            start = time.perf_counter()
+            result['preloaded_templates'] = len(backend.preload_templates())
+            result['startup_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        for name, context in contexts.items():
+            def render():
+                backend.get_template(name).render(context, request)
+            first = time_call(render, repeat=1)[0]
+            result[name] = {'first_request_ms': round(first, 3), **summarize(time_call(render, repeat))}
+    return results
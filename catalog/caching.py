@@ -0,0 +1,61 @@
+"""Version numbers used to key cached fragments of catalog pages.
+
+A version is stored in the cache under its own key and replaced with a new
+value whenever the data it describes changes, so anything cached under the
+old version is simply never read again. Versions are taken from the clock
+rather than counted up from 1, so a version that is evicted from the cache
+and recreated can't collide with one that was used before.
+"""
+import time
+
+from django.core.cache import cache
+
+# Versions only need to outlive the fragments keyed on them
+VERSION_TIMEOUT = None
+
+
+def _version_key(name):
+    return f'catalog:version:{name}'
+
+
+def get_version(name):
+    """Return the current version for name, creating one if there is none."""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, VERSION_TIMEOUT):
+            # Another request created the version first
+            version = cache.get(key, version)
+    return version
+
+
+def get_versions(*names):
+    """Return {name: version} for the names, reading the cache once for those that exist."""
+    found = cache.get_many([_version_key(name) for name in names])
+    return {name: found.get(_version_key(name)) or get_version(name) for name in names}
+
+
+def bump_version(*names):
+    """Give each of the names a new version."""
+    version = time.time_ns()
+    cache.set_many({_version_key(name): version for name in names}, VERSION_TIMEOUT)
+
+
+def book_copies_version_name(book_id):
+    """Name of the version covering the copies (BookInstance rows) of a book."""
+    return f'book-copies:{book_id}'
+
+
+def model_version_name(model):
+    """Name of the version covering every row of a model, which changes whenever any of them does."""
+    return f'model:{model._meta.label_lower}'
+
+
+def bump_model_versions(*models):
+    bump_version(*(model_version_name(model) for model in models))
+
+
+def instance_version_name(model, pk):
+    """Name of the version covering one row of a model."""
+    return f'instance:{model._meta.label_lower}:{pk}'
@@ -0,0 +1,42 @@
+"""System checks for settings that only go wrong once the site runs on several workers."""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHE_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache'}
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    """Warn when the production profile keeps the catalog's caches in each worker's own memory."""
+    if getattr(settings, 'DATABASE_PROFILE', 'default') != 'production':
+        return []
+    errors = []
+    for alias in sorted({DEFAULT_CACHE_ALIAS, getattr(settings, 'CATALOG_PAGE_CACHE', DEFAULT_CACHE_ALIAS)}):
+        if settings.CACHES.get(alias, {}).get('BACKEND') in LOCAL_CACHE_BACKENDS:
+            errors.append(Warning(
+                f'The "{alias}" cache is kept in local memory, so each worker has its own.',
+                hint=(
+                    'Changes made through one worker will not invalidate the pages, API responses and counts '
+                    'cached by the others. Configure a cache shared by the workers (file-based, memcached, ...).'
+                ),
+                id='catalog.W001',
+            ))
+    return errors
+
+
+@register(Tags.caches, Tags.security)
+def check_permissions_cache(app_configs, **kwargs):
+    """Warn when users' permissions are cached in each worker's own memory."""
+    if 'catalog.permissions.CachedPermissionBackend' not in settings.AUTHENTICATION_BACKENDS:
+        return []
+    if settings.CACHES.get(DEFAULT_CACHE_ALIAS, {}).get('BACKEND') not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Warning(
+        'CachedPermissionBackend keeps permissions in the "default" cache, which is kept in local memory.',
+        hint=(
+            'A permission revoked through one worker keeps working in the others until their cached copy expires. '
+            'Configure a cache shared by the workers, or use ModelBackend.'
+        ),
+        id='catalog.W002',
+    )]
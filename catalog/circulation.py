@@ -0,0 +1,128 @@
+"""Batch circulation: checking out, returning and renewing many copies at once.
+
+A batch runs in one transaction. The copies are locked with
+select_for_update(), checked against the transition's allowed statuses, and
+the eligible ones are changed with a single UPDATE. Every copy gets its own
+result, so a cart with one unavailable copy still processes the others.
+The counters are updated in the transaction, but the caches are only
+invalidated once it commits.
+"""
+import uuid
+
+from django.db import transaction
+
+from catalog import counters
+from catalog.caching import book_copies_version_name, bump_model_versions, bump_version
+from catalog.forms import RenewBookForm
+from catalog.models import BookInstance
+from catalog.routers import note_write
+from catalog.stats import invalidate_catalog_stats
+
+CHECKOUT = 'checkout'
+RETURN = 'return'
+RENEW = 'renew'
+
+# Action -> statuses a copy may be in for the action to apply
+TRANSITIONS = BookInstance.LOAN_TRANSITIONS
+
+ACTIONS = tuple(TRANSITIONS)
+
+
+class CirculationError(Exception):
+    """The batch as a whole is invalid (e.g. a bad due date), so nothing was changed."""
+    pass
+
+
+def clean_due_date(due_back):
+    """Check a due date with the same rules as renewing a single copy."""
+    form = RenewBookForm(data={'renewal_date': due_back or BookInstance.default_due_date()})
+    if not form.is_valid():
+        raise CirculationError(' '.join(form.errors['renewal_date']))
+    return form.cleaned_data['renewal_date']
+
+
+def _parse_ids(copy_ids):
+    """Return (the distinct valid UUIDs, the result keys in the given order, results for the invalid ids)."""
+    ids = []
+    keys = []
+    invalid = {}
+    for copy_id in copy_ids:
+        try:
+            key = str(copy_id if isinstance(copy_id, uuid.UUID) else uuid.UUID(str(copy_id)))
+        except ValueError:
+            key = str(copy_id)
+            invalid[key] = {'id': key, 'ok': False, 'error': 'Invalid copy id.'}
+        else:
+            if key not in keys:
+                ids.append(uuid.UUID(key))
+        if key not in keys:
+            keys.append(key)
+    return ids, keys, invalid
+
+
+def _batch_committed(copies_versions):
+    bump_version(*copies_versions)
+    bump_model_versions(BookInstance)
+    invalidate_catalog_stats()
+
+
+def process_batch(action, copy_ids, borrower=None, due_back=None):
+    """Apply action to the copies with the given ids and return one result per id."""
+    if not isinstance(action, str) or action not in TRANSITIONS:
+        raise CirculationError(f'Unknown action "{action}".')
+    if action == CHECKOUT and borrower is None:
+        raise CirculationError('A borrower is required to check out copies.')
+    if action in (CHECKOUT, RENEW):
+        due_back = clean_due_date(due_back)
+
+    from_statuses = TRANSITIONS[action]
+    changes = BookInstance.loan_changes(action, borrower, due_back)
+    ids, keys, invalid = _parse_ids(copy_ids)
+
+    results = dict(invalid)
+    with transaction.atomic():
+        copies = {
+            pk: (status, book_id)
+            for pk, status, book_id in BookInstance.objects.select_for_update().filter(pk__in=ids).values_list(
+                'pk', 'status', 'book_id')
+        }
+
+        eligible = []
+        for pk in ids:
+            if pk not in copies:
+                results[str(pk)] = {'id': str(pk), 'ok': False, 'error': 'No such copy.'}
+            elif copies[pk][0] not in from_statuses:
+                status = copies[pk][0]
+                results[str(pk)] = {
+                    'id': str(pk), 'ok': False, 'status': status,
+                    'error': f'Cannot {action} a copy that is {dict(BookInstance.LOAN_STATUS).get(status, status).lower()}.',
+                }
+            else:
+                eligible.append(pk)
+
+        if eligible:
+            # One UPDATE for the whole batch. The status condition repeats the check above,
+            # for databases where select_for_update() does not lock.
+            updated = BookInstance.objects.filter(pk__in=eligible, status__in=from_statuses).update(**changes)
+            note_write()
+            if updated != len(eligible):
+                # Rolls the batch back, it can simply be tried again
+                raise CirculationError('Some copies changed while the batch was processed, please try again.')
+
+            # A bulk UPDATE sends no signals, so do what the signal handlers would have done
+            if 'status' in changes:
+                counters.adjust_counters(
+                    [(copies[pk][1], copies[pk][0], -1) for pk in eligible]
+                    + [(copies[pk][1], changes['status'], 1) for pk in eligible]
+                )
+            # Once committed, as a request reading in between would cache the old rows under the new versions
+            copies_versions = {book_copies_version_name(copies[pk][1]) for pk in eligible if copies[pk][1]}
+            transaction.on_commit(lambda: _batch_committed(copies_versions))
+
+    for pk in eligible:
+        result = {'id': str(pk), 'ok': True, 'status': changes.get('status', copies[pk][0])}
+        if 'due_back' in changes:
+            result['due_back'] = changes['due_back'].isoformat() if changes['due_back'] else None
+        results[str(pk)] = result
+
+    return [results[key] for key in keys]
@@ -0,0 +1,92 @@
+"""Copy counters stored on each Book: copies_total, copies_available and copies_on_loan.
+
+The counters are changed with UPDATE ... SET counter = counter + delta (F()
+expressions), so concurrent changes never overwrite each other. The signal
+handlers in catalog.signals adjust them when a BookInstance is created,
+deleted or changes book or status. Code that writes copies with bulk
+operations (which send no signals) should call adjust_counters() or
+reconcile_counters() itself. reconcile_counters() recounts from the copies
+and repairs any drift, see also manage.py reconcile_counters.
+"""
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from catalog.caching import bump_model_versions
+from catalog.models import Book, BookInstance
+
+# Status -> the counter of copies in that status, besides copies_total
+STATUS_COUNTERS = {
+    'a': 'copies_available',
+    'o': 'copies_on_loan',
+}
+
+
+def counter_deltas(book_id, status, delta):
+    """Return the counter changes for delta copies of a book in status, as {field: delta}."""
+    if book_id is None:
+        return {}
+    deltas = {'copies_total': delta}
+    if status in STATUS_COUNTERS:
+        deltas[STATUS_COUNTERS[status]] = delta
+    return deltas
+
+
+def adjust_counters(changes, using=DEFAULT_DB_ALIAS):
+    """Apply (book_id, status, delta) changes to the counters.
+
+    Changes are summed per book first, and books with the same changes are
+    updated together, so a batch of copies takes a handful of UPDATEs.
+    """
+    per_book = defaultdict(lambda: defaultdict(int))
+    for book_id, status, delta in changes:
+        for field, field_delta in counter_deltas(book_id, status, delta).items():
+            per_book[book_id][field] += field_delta
+
+    books_by_deltas = defaultdict(list)
+    for book_id, deltas in per_book.items():
+        deltas = tuple(sorted((field, delta) for field, delta in deltas.items() if delta))
+        if deltas:
+            books_by_deltas[deltas].append(book_id)
+
+    for deltas, book_ids in books_by_deltas.items():
+        Book.objects.using(using).filter(pk__in=book_ids).update(
+            **{field: F(field) + delta for field, delta in deltas}
+        )
+    if books_by_deltas:
+        transaction.on_commit(lambda: bump_model_versions(Book), using=using)
+
+
+def _count(**filters):
+    copies = BookInstance.objects.filter(book=OuterRef('pk'), **filters).order_by().values('book')
+    return Coalesce(Subquery(copies.annotate(count=Count('pk')).values('count')), Value(0), output_field=IntegerField())
+
+
+def counted_values():
+    """Return {counter: expression counting the copies of the outer book}."""
+    values = {'copies_total': _count()}
+    for status, field in STATUS_COUNTERS.items():
+        values[field] = _count(status=status)
+    return values
+
+
+def drifted_books(queryset=None):
+    """Return the books of queryset (all books by default) whose counters don't match their copies."""
+    queryset = Book.objects.all() if queryset is None else queryset
+    counted = {f'counted_{field}': value for field, value in counted_values().items()}
+    drift = Q()
+    for name in counted:
+        drift |= ~Q(**{name[len('counted_'):]: F(name)})
+    return queryset.order_by().annotate(**counted).filter(drift)
+
+
+def reconcile_counters(queryset=None):
+    """Recount the counters of the books of queryset that drifted, return how many were repaired."""
+    queryset = Book.objects.all() if queryset is None else queryset
+    drifted = drifted_books(queryset).values('pk')
+    repaired = Book.objects.using(queryset.db).filter(pk__in=drifted).update(**counted_values())
+    if repaired:
+        transaction.on_commit(lambda: bump_model_versions(Book), using=queryset.db)
+    return repaired
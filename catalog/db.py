@@ -0,0 +1,16 @@
+"""Setup run on every new database connection."""
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    """Run the PRAGMAS of the database's settings (see DATABASE_PROFILES) on a new SQLite connection."""
+    pragmas = connection.settings_dict.get('PRAGMAS')
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    # On the sqlite3 connection itself: the PRAGMAS are setup, not queries of the request
+    # that happened to open the connection, so execute wrappers (see catalog.querybudget)
+    # and CaptureQueriesContext don't see them
+    for name, value in pragmas.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
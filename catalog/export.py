@@ -0,0 +1,176 @@
+"""Streaming exports of the catalog and the loan ledger.
+
+Rows are read with QuerySet.iterator() and written out as they arrive, so
+memory use stays flat whatever the size of the tables. The column names
+match the fields read by manage.py import_catalog, so an export of copies
+can be imported again.
+"""
+import csv
+import io
+import json
+import zlib
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS
+
+from catalog.models import Author, Book, BookInstance
+from catalog.search import MAX_IDS_PER_QUERY
+
+FORMATS = ('csv', 'jsonl', 'ndjson')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/jsonl',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched from the database at a time
+CHUNK_SIZE = 2000
+
+# Rows rendered into each piece of output
+LINES_PER_WRITE = 500
+
+
+def _book_rows(using):
+    rows = Book.objects.using(using).order_by('pk').values_list(
+        'pk', 'isbn', 'title', 'summary', 'author__first_name', 'author__last_name', 'language__name',
+    ).iterator(chunk_size=CHUNK_SIZE)
+    for chunk in _batches(rows, MAX_IDS_PER_QUERY):
+        # Genres are fetched for each chunk of books rather than with a join per book, the
+        # chunk kept within the variables SQLite allows in a statement
+        genres = defaultdict(list)
+        through = Book.genre.through.objects.using(using)
+        for book_id, name in through.filter(book_id__in=[row[0] for row in chunk]).values_list('book_id', 'genre__name'):
+            genres[book_id].append(name)
+        for book_id, isbn, title, summary, first_name, last_name, language in chunk:
+            yield {
+                'book_id': book_id,
+                'isbn': isbn,
+                'title': title,
+                'summary': summary,
+                'author_first_name': first_name,
+                'author_last_name': last_name,
+                'language': language,
+                'genres': sorted(genres[book_id]),
+            }
+
+
+def _author_rows(using):
+    rows = Author.objects.using(using).order_by('pk').values(
+        'id', 'first_name', 'last_name', 'date_of_birth', 'date_of_death',
+    ).iterator(chunk_size=CHUNK_SIZE)
+    for row in rows:
+        yield {
+            'author_id': row['id'],
+            'author_first_name': row['first_name'],
+            'author_last_name': row['last_name'],
+            'author_date_of_birth': row['date_of_birth'],
+            'author_date_of_death': row['date_of_death'],
+        }
+
+
+def _copy_rows(using):
+    rows = BookInstance.objects.using(using).order_by('pk').values_list(
+        'id', 'book_id', 'book__isbn', 'book__title', 'imprint', 'status', 'due_back', 'borrower__username',
+    ).iterator(chunk_size=CHUNK_SIZE)
+    for copy_id, book_id, isbn, title, imprint, status, due_back, borrower in rows:
+        yield {
+            'copy_id': copy_id,
+            'book_id': book_id,
+            'isbn': isbn,
+            'title': title,
+            'imprint': imprint,
+            'status': status,
+            'due_back': due_back,
+            'borrower': borrower,
+        }
+
+
+# Export name -> (columns, row generator)
+EXPORTS = {
+    'books': (
+        ('book_id', 'isbn', 'title', 'summary', 'author_first_name', 'author_last_name', 'language', 'genres'),
+        _book_rows,
+    ),
+    'authors': (
+        ('author_id', 'author_first_name', 'author_last_name', 'author_date_of_birth', 'author_date_of_death'),
+        _author_rows,
+    ),
+    'copies': (
+        ('copy_id', 'book_id', 'isbn', 'title', 'imprint', 'status', 'due_back', 'borrower'),
+        _copy_rows,
+    ),
+}
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ';'.join(value)
+    return str(value)
+
+
+def _json(value):
+    if value is None or isinstance(value, (int, list)):
+        return value
+    return str(value)
+
+
+def _csv_lines(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for batch in _batches(rows, LINES_PER_WRITE):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_text(row[column]) for column in columns] for row in batch)
+        yield buffer.getvalue()
+
+
+def _json_lines(columns, rows):
+    for batch in _batches(rows, LINES_PER_WRITE):
+        yield ''.join(json.dumps({column: _json(row[column]) for column in columns}) + '\n' for row in batch)
+
+
+def export_chunks(name, export_format='csv', using=DEFAULT_DB_ALIAS):
+    """Yield an export as pieces of text."""
+    columns, rows = EXPORTS[name]
+    if export_format == 'csv':
+        return _csv_lines(columns, rows(using))
+    return _json_lines(columns, rows(using))
+
+
+def gzip_chunks(chunks):
+    """Compress pieces of text into pieces of a gzip file as they are produced."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(name, export_format='csv', compress=False, using=DEFAULT_DB_ALIAS):
+    """Yield an export as bytes, gzip-compressed if compress is true."""
+    chunks = export_chunks(name, export_format, using)
+    if compress:
+        return gzip_chunks(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
+
+
+def export_filename(name, export_format='csv', compress=False):
+    extension = 'jsonl' if export_format == 'ndjson' else export_format
+    return f'{name}.{extension}' + ('.gz' if compress else '')
@@ -0,0 +1,94 @@
+"""Cache entries that many requests need at once, recomputed without a stampede.
+
+When a popular entry expires, every request that misses it would otherwise
+run the same queries at the same moment. get_or_compute() prevents that in
+three ways:
+
+* Single flight: only the request that takes a per-key lock (cache.add, so
+  it works across processes with a shared backend) recomputes the entry.
+* Stale-while-revalidate: entries are kept for a grace period after they
+  expire, and while one request recomputes an expired entry the others are
+  served the stale value instead of waiting.
+* Probabilistic early expiry ("XFetch", Vattani et al., VLDB 2015): before
+  an entry expires, each read recomputes it early with a probability that
+  rises as expiry gets closer and with how long the value took to compute,
+  so a hot entry is usually refreshed before it ever expires.
+
+Only a request finding no entry at all waits, polling for the value the lock
+holder is computing.
+"""
+import math
+import random
+import time
+import uuid
+
+from django.core.cache import cache as default_cache
+
+# Seconds an expired entry is still served while it is recomputed
+STALE_TIMEOUT = 60
+
+# Seconds a recomputation may hold the lock, after which another request may take over
+LOCK_TIMEOUT = 10
+
+# Seconds between checks for the value while waiting for the lock holder
+POLL_INTERVAL = 0.02
+
+# Larger values recompute earlier, 1 is the value suggested by the XFetch paper
+BETA = 1.0
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _is_fresh(expires, delta, now, beta):
+    # -log(random()) is exponentially distributed, so early recomputation gets likelier near expiry
+    return now + delta * beta * -math.log(1 - random.random()) < expires
+
+
+def _compute_and_set(key, compute, timeout, cache, stale_timeout):
+    start = time.time()
+    value = compute()
+    delta = time.time() - start
+    if value is not None:
+        cache.set(key, (value, delta, time.time() + timeout), timeout + stale_timeout)
+    return value
+
+
+def get_or_compute(key, compute, timeout, cache=None, stale_timeout=STALE_TIMEOUT,
+                   lock_timeout=LOCK_TIMEOUT, beta=BETA):
+    """Return the value cached under key, calling compute() to fill or refresh it.
+
+    Returns (value, computed), computed being True if this call ran compute().
+    compute() returning None means the value must not be cached. A request
+    that waits for the lock longer than lock_timeout computes the value itself.
+    """
+    cache = cache or default_cache
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if _is_fresh(expires, delta, time.time(), beta):
+            return value, False
+
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + lock_timeout
+    while True:
+        if cache.add(_lock_key(key), token, lock_timeout):
+            try:
+                current = cache.get(key)
+                if current is not None and (entry is None or current[2] != entry[2]):
+                    # Refreshed by the previous lock holder since it was read
+                    return current[0], False
+                return _compute_and_set(key, compute, timeout, cache, stale_timeout), True
+            finally:
+                if cache.get(_lock_key(key)) == token:
+                    cache.delete(_lock_key(key))
+        if entry is not None:
+            # Someone else is recomputing it, the current value will do until they're done
+            return entry[0], False
+        if time.monotonic() >= deadline:
+            return compute(), True
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0], False
@@ -0,0 +1,74 @@
+import datetime
+import importlib
+import json
+import os
+import platform
+import sqlite3
+
+import django
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from catalog.benchmarks import SUITES
+
+# Options changing what the suites measure, recorded with the results
+OPTIONS = ('repeat', 'deep_page', 'books', 'copies', 'loans', 'clients', 'instances', 'requests', 'concurrency', 'server')
+
+
+class Command(BaseCommand):
+    help = 'Run catalog benchmark suites against a throwaway test database and print the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', metavar='suite', help='Suites to run (default: all). Choices: %s.' % ', '.join(SUITES))
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per measurement.')
+        parser.add_argument('--deep-page', type=int, default=10000, help='Page number used for deep pagination.')
+        parser.add_argument('--books', type=int, default=100000, help='Number of books in the search catalog.')
+        parser.add_argument('--copies', type=int, default=100000, help='Number of copies in the generated import file.')
+        parser.add_argument('--loans', type=int, default=200000, help='Number of loans for the overdue sweep.')
+        parser.add_argument('--clients', type=int, default=200, help='Concurrent clients hitting an expired cache entry.')
+        parser.add_argument('--instances', type=int, default=100000, help='Number of copies in the generated catalog of the site suite (10k to 10M).')
+        parser.add_argument('--requests', type=int, default=50, help='Number of timed requests per URL in the site suite.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients requesting the site through a server.')
+        parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi', help='Server the site suite runs the site in (asgi needs uvicorn).')
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the benchmark database between runs.')
+
+    def handle(self, *args, **options):
+        names = options['suites'] or list(SUITES)
+        unknown = set(names) - set(SUITES)
+        if unknown:
+            raise CommandError('Unknown suite(s): %s' % ', '.join(sorted(unknown)))
+
+        started = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        # Queries aren't logged while benchmarking, whatever DEBUG is set to
+        with override_settings(DEBUG=False):
+            old_config = setup_databases(self.verbosity(options), interactive=False, keepdb=options['keepdb'])
+            try:
+                results = {name: importlib.import_module(SUITES[name]).run(options) for name in names}
+            finally:
+                teardown_databases(old_config, self.verbosity(options), keepdb=options['keepdb'])
+
+        report = json.dumps({'run': self.describe_run(names, started, options), **results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    @staticmethod
+    def describe_run(names, started, options):
+        return {
+            'suites': names,
+            'started': started,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'options': {name: options[name] for name in OPTIONS},
+        }
+
+    @staticmethod
+    def verbosity(options):
+        return max(options['verbosity'] - 1, 0)
@@ -0,0 +1,36 @@
+import codecs
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from catalog.export import EXPORTS, FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = 'Stream an export of the books, authors or copies (with status and borrower) as CSV or JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS), help='What to export.')
+        parser.add_argument('--format', choices=FORMATS, default='csv', help='Output format (default: csv).')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip.')
+        parser.add_argument('--output', help='File to write to (default: stdout).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to export from.')
+
+    def handle(self, *args, **options):
+        chunks = export_stream(options['name'], options['format'], options['gzip'], options['database'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        elif options['gzip']:
+            # Compressed output is binary, so it can't go through self.stdout
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            # A character may be split between chunks
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            for chunk in chunks:
+                self.stdout.write(decoder.decode(chunk), ending='')
+            self.stdout.write(decoder.decode(b'', final=True), ending='')
@@ -0,0 +1,272 @@
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import json
+import sys
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from catalog import counters, search
+from catalog.caching import book_copies_version_name, bump_model_versions, bump_version, instance_version_name
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.search import MAX_IDS_PER_QUERY
+from catalog.stats import invalidate_catalog_stats
+
+FORMATS = ('csv', 'jsonl')
+
+STATUSES = {code for code, name in BookInstance.LOAN_STATUS}
+
+
+def filter_in(queryset, field, values):
+    """Yield the rows of queryset whose field is one of values, querying MAX_IDS_PER_QUERY values at a time.
+
+    A chunk holds more values than SQLite (before 3.32) allows variables in a statement.
+    """
+    values = list(values)
+    for start in range(0, len(values), MAX_IDS_PER_QUERY):
+        yield from queryset.filter(**{f'{field}__in': values[start:start + MAX_IDS_PER_QUERY]})
+
+
+class Command(BaseCommand):
+    help = (
+        'Import books, authors, genres, languages and copies from CSV or JSON Lines files. '
+        'Each row describes a book (identified by its ISBN) and optionally copies of it: '
+        'isbn, title, summary, author_first_name, author_last_name, author_date_of_birth, '
+        'author_date_of_death, language, genres (separated by ";" in CSV, or a JSON list), '
+        'and for copies imprint, status (default "a"), due_back, borrower (a username), copy_id and copies '
+        '(the number of identical copies, default 1 when there is an imprint).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Files to import, "-" for stdin. Files ending in .gz are decompressed.')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension).')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows written per transaction.')
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        if self.chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+
+        # Small tables are held in memory, name -> id
+        self.languages = dict(Language.objects.values_list('name', 'id'))
+        self.genres = dict(Genre.objects.values_list('name', 'id'))
+        self.authors = {
+            (first_name, last_name): author_id
+            for first_name, last_name, author_id in Author.objects.values_list('first_name', 'last_name', 'id').order_by('-id')
+        }
+        self.totals = {'rows': 0, 'books': 0, 'copies': 0}
+        self.start = time.perf_counter()
+
+        for path in options['files']:
+            rows = self.read_rows(path, options['format'])
+            while True:
+                chunk = list(itertools.islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self.import_chunk(chunk)
+                self.report('Imported')
+
+        self.report('Finished:', style=self.style.SUCCESS)
+
+    def report(self, prefix, style=None):
+        elapsed = time.perf_counter() - self.start
+        rate = self.totals['rows'] / elapsed if elapsed else 0
+        message = '{} {rows} rows, {books} new books, {copies} copies in {elapsed:.1f}s ({rate:.0f} rows/s)'.format(
+            prefix, elapsed=elapsed, rate=rate, **self.totals)
+        self.stdout.write(style(message) if style else message)
+
+    def read_rows(self, path, file_format):
+        """Yield the rows of a file one at a time, as dicts."""
+        name = path[:-3] if path.endswith('.gz') else path
+        file_format = file_format or name.rsplit('.', 1)[-1].lower()
+        if file_format in ('json', 'ndjson'):
+            file_format = 'jsonl'
+        if file_format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}, use --format.')
+
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        elif path.endswith('.gz'):
+            stream = gzip.open(path, 'rt', encoding='utf-8', newline='')
+        else:
+            stream = open(path, encoding='utf-8', newline='')
+
+        with stream:
+            if file_format == 'csv':
+                for line_number, row in enumerate(csv.DictReader(stream), start=2):
+                    yield self.clean_row(row, path, line_number)
+            else:
+                for line_number, line in enumerate(stream, start=1):
+                    if line.strip():
+                        try:
+                            row = json.loads(line)
+                        except ValueError as e:
+                            raise CommandError(f'{path}:{line_number}: {e}')
+                        yield self.clean_row(row, path, line_number)
+
+    def clean_row(self, row, path, line_number):
+        """Normalize a raw row, raising CommandError with its position if it is invalid."""
+        def text(name):
+            value = row.get(name)
+            return '' if value is None else str(value).strip()
+
+        def date(name):
+            value = text(name)
+            try:
+                return datetime.date.fromisoformat(value) if value else None
+            except ValueError:
+                raise CommandError(f'{path}:{line_number}: {name} must be a YYYY-MM-DD date, not "{value}".')
+
+        isbn = text('isbn')
+        if not isbn:
+            raise CommandError(f'{path}:{line_number}: isbn is required.')
+
+        genres = row.get('genres') or []
+        if isinstance(genres, str):
+            genres = genres.split(';')
+        genres = [str(genre).strip() for genre in genres if str(genre).strip()]
+
+        status = text('status') or 'a'
+        if status not in STATUSES:
+            raise CommandError(f'{path}:{line_number}: unknown status "{status}".')
+
+        imprint = text('imprint')
+        copies = text('copies')
+        try:
+            copies = int(copies) if copies else (1 if imprint else 0)
+        except ValueError:
+            raise CommandError(f'{path}:{line_number}: copies must be a number, not "{copies}".')
+        copy_id = text('copy_id')
+        try:
+            copy_id = uuid.UUID(copy_id) if copy_id else None
+        except ValueError:
+            raise CommandError(f'{path}:{line_number}: copy_id must be a UUID, not "{copy_id}".')
+
+        author = (text('author_first_name'), text('author_last_name'))
+        return {
+            'isbn': isbn,
+            'title': text('title'),
+            'summary': text('summary'),
+            'author': author if any(author) else None,
+            'author_date_of_birth': date('author_date_of_birth'),
+            'author_date_of_death': date('author_date_of_death'),
+            'language': text('language') or None,
+            'genres': genres,
+            'imprint': imprint,
+            'status': status,
+            'due_back': date('due_back'),
+            'borrower': text('borrower') or None,
+            'copy_id': copy_id,
+            'copies': 1 if copy_id else copies,
+        }
+
+    def resolve_names(self, lookup, model, names):
+        """Create the missing Language/Genre names and add them to the lookup map."""
+        missing = {name for name in names if name and name not in lookup}
+        if missing:
+            model.objects.bulk_create(model(name=name) for name in sorted(missing))
+            lookup.update(filter_in(model.objects.values_list('name', 'id'), 'name', missing))
+
+    def resolve_authors(self, chunk):
+        missing = {}
+        for row in chunk:
+            if row['author'] and row['author'] not in self.authors:
+                missing.setdefault(row['author'], row)
+        if missing:
+            Author.objects.bulk_create(
+                Author(
+                    first_name=first_name,
+                    last_name=last_name,
+                    date_of_birth=row['author_date_of_birth'],
+                    date_of_death=row['author_date_of_death'],
+                )
+                for (first_name, last_name), row in missing.items()
+            )
+            last_names = {last_name for first_name, last_name in missing}
+            authors = Author.objects.values_list('first_name', 'last_name', 'id').order_by('-id')
+            for first_name, last_name, author_id in filter_in(authors, 'last_name', last_names):
+                self.authors.setdefault((first_name, last_name), author_id)
+
+    def resolve_books(self, chunk):
+        """Return isbn -> book id for the chunk, creating the books that don't exist yet."""
+        isbns = {row['isbn'] for row in chunk}
+        books = {}
+        for isbn, book_id in filter_in(Book.objects.values_list('isbn', 'id').order_by('-id'), 'isbn', isbns):
+            books[isbn] = book_id
+
+        new_books = {}
+        for row in chunk:
+            if row['isbn'] not in books and row['isbn'] not in new_books:
+                new_books[row['isbn']] = Book(
+                    isbn=row['isbn'],
+                    title=row['title'],
+                    summary=row['summary'],
+                    author_id=self.authors.get(row['author']),
+                    language_id=self.languages.get(row['language']),
+                )
+        if new_books:
+            Book.objects.bulk_create(new_books.values())
+            books.update(filter_in(Book.objects.values_list('isbn', 'id').order_by('-id'), 'isbn', new_books))
+            self.totals['books'] += len(new_books)
+        return books, {books[isbn] for isbn in new_books}
+
+    def import_chunk(self, chunk):
+        with transaction.atomic():
+            self.resolve_names(self.languages, Language, (row['language'] for row in chunk))
+            self.resolve_names(self.genres, Genre, (genre for row in chunk for genre in row['genres']))
+            self.resolve_authors(chunk)
+            books, new_book_ids = self.resolve_books(chunk)
+
+            # Genres through the M2M table directly, skipping pairs that already exist
+            BookGenre = Book.genre.through
+            pairs = {(books[row['isbn']], self.genres[genre]) for row in chunk for genre in row['genres']}
+            BookGenre.objects.bulk_create(
+                (BookGenre(book_id=book_id, genre_id=genre_id) for book_id, genre_id in pairs),
+                ignore_conflicts=True,
+            )
+
+            usernames = {row['borrower'] for row in chunk if row['borrower'] and row['copies']}
+            borrowers = dict(filter_in(User.objects.values_list('username', 'id'), 'username', usernames))
+            copies = [
+                BookInstance(
+                    id=row['copy_id'] or uuid.uuid4(),
+                    book_id=books[row['isbn']],
+                    imprint=row['imprint'],
+                    status=row['status'],
+                    due_back=row['due_back'],
+                    borrower_id=borrowers.get(row['borrower']),
+                )
+                for row in chunk
+                for _ in range(row['copies'])
+            ]
+            # Copies with a given id may have been imported before
+            BookInstance.objects.bulk_create(copies, ignore_conflicts=True)
+
+            # Bulk writes send no signals, so do what the signal handlers would have done
+            changed_book_ids = {book_id for book_id, genre_id in pairs} | new_book_ids
+            copied_book_ids = {copy.book_id for copy in copies}
+            search.index_books(changed_book_ids)
+            # Copies that were imported before are skipped, recounting tells which ones were added
+            copied = list(copied_book_ids)
+            for start in range(0, len(copied), MAX_IDS_PER_QUERY):
+                counters.reconcile_counters(Book.objects.filter(pk__in=copied[start:start + MAX_IDS_PER_QUERY]))
+            # Once the chunk is committed, so that no request caches the previous chunk's rows under the new versions
+            transaction.on_commit(lambda: self.chunk_committed(changed_book_ids, copied_book_ids))
+
+        self.totals['rows'] += len(chunk)
+        self.totals['copies'] += len(copies)
+
+    def chunk_committed(self, changed_book_ids, copied_book_ids):
+        """Invalidate what the cached pages and counts showed of the books a chunk changed."""
+        bump_version(
+            *(instance_version_name(Book, book_id) for book_id in changed_book_ids),
+            *(book_copies_version_name(book_id) for book_id in copied_book_ids),
+        )
+        bump_model_versions(Author, Book, BookInstance, Genre, Language)
+        invalidate_catalog_stats()
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from catalog.counters import drifted_books, reconcile_counters
+from catalog.models import Book
+from catalog.stats import invalidate_catalog_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Recount the copies_total, copies_available and copies_on_loan counters of the books from their copies, '
+        'and repair the books whose counters drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Books checked per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many books drifted.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to reconcile.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        using = options['database']
+        books = Book.objects.using(using).order_by('pk')
+
+        checked = repaired = 0
+        last_pk = 0
+        while True:
+            # Walk the books in primary key ranges, each repaired in a short transaction of its own
+            batch = list(books.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                break
+            queryset = books.filter(pk__gte=batch[0], pk__lte=batch[-1])
+            if options['dry_run']:
+                repaired += drifted_books(queryset).count()
+            else:
+                with transaction.atomic(using=using):
+                    repaired += reconcile_counters(queryset)
+            checked += len(batch)
+            last_pk = batch[-1]
+
+        if repaired and not options['dry_run']:
+            invalidate_catalog_stats()
+        verb = 'drifted' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} books, {repaired} {verb}.'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from catalog.replication import replicate
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary database over the read replicas in CATALOG_READ_REPLICAS, a stand-in for replication '
+        'when running with SQLite replicas locally. With --interval, keep copying every so many seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Seconds between copies (default: copy once).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Primary database to copy from.')
+        parser.add_argument('--replica', action='append', dest='replicas', help='Replica to copy to (default: all of them).')
+
+    def handle(self, *args, **options):
+        if options['interval'] is not None and options['interval'] <= 0:
+            raise CommandError('--interval must be positive.')
+        unknown = set(options['replicas'] or []) - set(connections)
+        if unknown:
+            raise CommandError('Unknown database(s): %s.' % ', '.join(sorted(unknown)))
+
+        while True:
+            replicas = replicate(options['database'], options['replicas'])
+            if not replicas:
+                raise CommandError('No replicas to copy to, set CATALOG_READ_REPLICAS or pass --replica.')
+            self.stdout.write('Copied %s to %s.' % (options['database'], ', '.join(replicas)))
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,54 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from catalog.overdue import Checkpoint, sweep_overdue
+
+
+class Command(BaseCommand):
+    help = (
+        'Email a reminder to every borrower with overdue loans, one email per borrower listing their overdue books. '
+        'Emails go through EMAIL_BACKEND in batches from a pool of worker threads. With --checkpoint, progress is '
+        'saved to a file and a sweep interrupted on the same day resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkpoint', help='File keeping the progress of the sweep.')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the beginning.')
+        parser.add_argument('--workers', type=int, default=4, help='Threads sending email.')
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails sent over one connection.')
+        parser.add_argument('--rate', type=float, help='Most emails sent per second (default: no limit).')
+        parser.add_argument('--date', type=datetime.date.fromisoformat, help='Loans due before this YYYY-MM-DD date are overdue (default: today).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to read the loans from.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers and --batch-size must be at least 1.')
+        if options['rate'] is not None and options['rate'] <= 0:
+            raise CommandError('--rate must be positive.')
+
+        today = options['date'] or datetime.date.today()
+        checkpoint = Checkpoint(options['checkpoint'], today)
+        if options['restart']:
+            checkpoint.clear()
+
+        start = time.perf_counter()
+        try:
+            totals = sweep_overdue(
+                today, checkpoint,
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                rate=options['rate'],
+                using=options['database'],
+                log=self.stdout.write,
+            )
+        except Exception as e:
+            raise CommandError(f'Sending reminders failed, run again with the same --checkpoint to resume: {e}')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            '{loans} overdue loans of {borrowers} borrowers: {sent} reminders sent, '
+            '{skipped} borrowers without an email address, in {elapsed:.1f}s.'.format(elapsed=elapsed, **totals)
+        ))
@@ -0,0 +1,40 @@
+"""Middleware for the catalog."""
+from django.conf import settings
+from django.urls import reverse
+
+from catalog.routers import WriteTracker, use_primary
+
+PIN_COOKIE_NAME = 'catalog_primary'
+
+# Seconds a user keeps reading from the primary after a write, longer than the replicas lag behind
+DEFAULT_PIN_SECONDS = 10
+
+
+class PrimaryPinningMiddleware:
+    """Read from the primary database when a user could otherwise miss their own changes.
+
+    Requests that may write (anything but GET, HEAD, OPTIONS and TRACE) and
+    the admin read from the primary. A request that writes to the catalog
+    sets a cookie pinning the user's next requests to the primary for
+    CATALOG_PRIMARY_PIN_SECONDS, by which time the replicas have the change.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = (
+            request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+            or PIN_COOKIE_NAME in request.COOKIES
+            or request.path_info.startswith(reverse('admin:index'))
+        )
+        with WriteTracker() as tracker:
+            if pinned:
+                with use_primary():
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+        if tracker.wrote:
+            max_age = getattr(settings, 'CATALOG_PRIMARY_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+            response.set_cookie(PIN_COOKIE_NAME, '1', max_age=max_age, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# Created on SQLite only, other databases use the in-memory search index
+CREATE_FTS_TABLE = """
+    CREATE VIRTUAL TABLE catalog_book_fts USING fts5(
+        title, summary, author, genres, isbn,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+"""
+
+FILL_FTS_TABLE = """
+    INSERT INTO catalog_book_fts (rowid, title, summary, author, genres, isbn)
+    SELECT b.id,
+           b.title,
+           b.summary,
+           COALESCE(a.first_name || ' ' || a.last_name, ''),
+           COALESCE((SELECT group_concat(g.name, ' ')
+                     FROM catalog_book_genre bg INNER JOIN catalog_genre g ON g.id = bg.genre_id
+                     WHERE bg.book_id = b.id), ''),
+           b.isbn
+    FROM catalog_book b LEFT OUTER JOIN catalog_author a ON a.id = b.author_id
+"""
+
+
+def has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # Builds can also load FTS5 without the compile option being reported
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.catalog_fts5_probe USING fts5(probe)')
+        except Exception:
+            return False
+        cursor.execute('DROP TABLE temp.catalog_fts5_probe')
+        return True
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or not has_fts5(connection):
+        return
+    schema_editor.execute(CREATE_FTS_TABLE)
+    schema_editor.execute(FILL_FTS_TABLE)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS catalog_book_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_loan_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.0.14 on 2026-10-18 20:24
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_copies(apps, schema_editor):
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+
+    def count(**filters):
+        copies = BookInstance.objects.filter(book=OuterRef('pk'), **filters).order_by().values('book')
+        return Coalesce(Subquery(copies.annotate(count=Count('pk')).values('count')), Value(0), output_field=IntegerField())
+
+    Book.objects.using(schema_editor.connection.alias).update(
+        copies_total=count(),
+        copies_available=count(status='a'),
+        copies_on_loan=count(status='o'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_book_isbn_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='copies_available',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_on_loan',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_copies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-18 21:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_book_copy_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['due_back', 'id'], name='bookinst_due_back_id_idx'),
+        ),
+    ]
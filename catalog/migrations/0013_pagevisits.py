@@ -0,0 +1,24 @@
+# Generated by Django 3.0.14 on 2026-10-18 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_bookinstance_due_back_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageVisits',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.CharField(max_length=100, unique=True)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'page visits',
+            },
+        ),
+    ]
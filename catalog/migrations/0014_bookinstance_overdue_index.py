@@ -0,0 +1,17 @@
+# Generated by Django 3.0.14 on 2026-10-18 22:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_pagevisits'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['status', 'due_back', 'borrower'], name='bookinst_overdue_borrower_idx'),
+        ),
+    ]
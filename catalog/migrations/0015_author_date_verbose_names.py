@@ -0,0 +1,23 @@
+# Generated by Django 3.0.14 on 2026-10-18 22:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_bookinstance_overdue_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='author',
+            name='date_of_birth',
+            field=models.DateField(blank=True, null=True, verbose_name='born'),
+        ),
+        migrations.AlterField(
+            model_name='author',
+            name='date_of_death',
+            field=models.DateField(blank=True, null=True, verbose_name='died'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
+from django.db.models.signals import post_save
 from django.contrib.auth.models import User
-from datetime import date
+from datetime import date, timedelta
 
 # Create your models here.
 class Genre(models.Model):
@@ -21,6 +22,11 @@ class Language(models.Model):
 
 from django.urls import reverse # Used to generate URLs by reversingthe URL pattern
 
+class BookQuerySet(models.QuerySet):
+    def with_listing_data(self):
+        """Load what a list of books displays: language and genres (the copy counters are on the book row)."""
+        return self.select_related('language').prefetch_related('genre')
+
 class Book(models.Model):
     """Model representing a book (but not a specific copy of a book)."""
     title = models.CharField(max_length=200)
@@ -30,7 +36,7 @@ class Book(models.Model):
     author = models.ForeignKey('Author', on_delete=models.SET_NULL, null=True)
 
     summary = models.TextField(max_length=1000, help_text='Enter a brief description of the book')
-    isbn = models.CharField('ISBN', max_length=13, help_text='13 character <a href="https://www.isbn-international.org/content/what-isbn">ISBN number</a>')
+    isbn = models.CharField('ISBN', max_length=13, db_index=True, help_text='13 character <a href="https://www.isbn-international.org/content/what-isbn">ISBN number</a>')
 
     # ManyToManyField used because genre can contain many books. Books can cover many genres.
     # Genre class has already been defined so we can specify the object above.
@@ -38,6 +44,25 @@ class Book(models.Model):
 
     language = models.ForeignKey(Language, on_delete=models.SET_NULL, null=True)
 
+    # Counts of this book's copies, kept up to date by catalog.counters
+    copies_total = models.IntegerField(default=0, editable=False)
+    copies_available = models.IntegerField(default=0, editable=False)
+    copies_on_loan = models.IntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('copies_total', 'copies_available', 'copies_on_loan')
+
+    objects = BookQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        # The counters are changed by UPDATEs of their own, saving a book that was loaded
+        # earlier must not write back the counts it was loaded with
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """String for representing the Model object."""
         return self.title
@@ -54,9 +79,33 @@ class Book(models.Model):
 
     class Meta:
         permissions = (("can_edit_books", "Add, edit, delete Book records"),)
+        indexes = [
+            # Ordering key used to page through the book list
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ]
 
 import uuid # Required for unique book instances
 
+class BookInstanceQuerySet(models.QuerySet):
+    def on_loan(self):
+        return self.filter(status__exact='o')
+
+    def with_overdue(self, today=None):
+        """Annotate overdue, computed by the database against one date for the whole query."""
+        return self.annotate(overdue=models.Case(
+            models.When(due_back__lt=today or date.today(), then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField(),
+        ))
+
+    def overdue(self, today=None):
+        """Only the copies due back before today (a range on due_back, so the due date indexes apply)."""
+        return self.filter(due_back__lt=today or date.today())
+
+class LoanStateError(Exception):
+    """A loan action was tried on a copy that isn't (or is no longer) in a status that allows it."""
+    pass
+
 class BookInstance(models.Model):
     """Model representing a specific copy of a book (i.e. that can be borrowed from the library)."""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, help_text='Unique ID for this particular book across whole library')
@@ -80,9 +129,109 @@ class BookInstance(models.Model):
         help_text='Book availability'
     )
 
+    objects = BookInstanceQuerySet.as_manager()
+
+    # Loan action -> the statuses a copy may be in for the action to apply
+    LOAN_TRANSITIONS = {
+        'checkout': ('a', 'r'),
+        'return': ('o',),
+        'renew': ('o',),
+    }
+
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Set book as returned"),)
+        indexes = [
+            # A user's loans (borrower + status), in due date order
+            models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinst_borrower_loans_idx'),
+            # Copies by status in due date order, also used to count available copies
+            models.Index(fields=['status', 'due_back', 'id'], name='bookinst_status_due_idx'),
+            # The overdue loans (status + due_back range) with their borrowers, for the reminder sweep
+            models.Index(fields=['status', 'due_back', 'borrower'], name='bookinst_overdue_borrower_idx'),
+            # Only the copies on loan, for backends that support partial indexes
+            models.Index(fields=['due_back', 'id'], name='bookinst_on_loan_due_idx', condition=models.Q(status='o')),
+            # All the copies in due date order, as the admin changelist lists them
+            models.Index(fields=['due_back', 'id'], name='bookinst_due_back_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the values as loaded, so that signal handlers can see what a save changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields if field.attname not in deferred
+        }
+
+    def get_loaded_value(self, attname):
+        """Return the value attname had when this copy was loaded or last saved (None for a new copy)."""
+        return getattr(self, '_loaded_values', {}).get(attname)
+
+    @staticmethod
+    def default_due_date():
+        """The due date proposed for loans and renewals, three weeks from today."""
+        return date.today() + timedelta(weeks=3)
+
+    @classmethod
+    def loan_changes(cls, action, borrower=None, due_back=None):
+        """Return the fields a loan action writes, as {field name: value}."""
+        if action == 'checkout':
+            return {'status': 'o', 'borrower': borrower, 'due_back': due_back}
+        if action == 'return':
+            return {'status': 'a', 'borrower': None, 'due_back': None}
+        if action == 'renew':
+            return {'due_back': due_back}
+        raise ValueError(f'Unknown loan action "{action}".')
+
+    def _apply_loan_action(self, action, **kwargs):
+        """Apply a loan action with one conditional UPDATE of only the fields it changes.
+
+        The UPDATE only matches while the copy is in a status the action allows,
+        so when two requests race for the same copy exactly one of them wins,
+        without reading the row first or locking anything beyond it. It also
+        only matches while the copy still has the book and status it was loaded
+        with, which the signal handlers move the book's counters from: a copy
+        changed since it was loaded has to be loaded again.
+        """
+        changes = self.loan_changes(action, **kwargs)
+        copies = type(self)._base_manager.using(self._state.db).filter(
+            pk=self.pk, status__in=self.LOAN_TRANSITIONS[action],
+        )
+        loaded = getattr(self, '_loaded_values', {})
+        if 'book_id' in loaded and 'status' in loaded:
+            copies = copies.filter(book_id=loaded['book_id'], status=loaded['status'])
+        if not copies.update(**changes):
+            raise LoanStateError(f'Cannot {action} copy {self.pk}, it is not in a status that allows it.')
+
+        for name, value in changes.items():
+            setattr(self, name, value)
+        # UPDATE sends no signals, send post_save so the catalog caches see the change.
+        # Like save(), the loaded values are refreshed after the receivers have run.
+        post_save.send(
+            sender=type(self), instance=self, created=False, update_fields=frozenset(changes),
+            raw=False, using=self._state.db,
+        )
+        if hasattr(self, '_loaded_values'):
+            attnames = (self._meta.get_field(name).attname for name in changes)
+            self._loaded_values.update((attname, getattr(self, attname)) for attname in attnames)
+
+    def checkout(self, borrower, due_back=None):
+        """Lend this copy to borrower, if it is available or reserved."""
+        self._apply_loan_action('checkout', borrower=borrower, due_back=due_back or self.default_due_date())
+
+    def mark_returned(self):
+        """Make this copy available again, if it is on loan."""
+        self._apply_loan_action('return')
+
+    def renew(self, due_back):
+        """Move the due date of this copy, if it is on loan."""
+        self._apply_loan_action('renew', due_back=due_back)
 
     def __str__(self):
         """String for representing the Model object."""
@@ -104,6 +253,10 @@ class Author(models.Model):
     class Meta:
         ordering = ['last_name', 'first_name']
         permissions = (("can_edit_authors", "Add, edit, delete Author records"),)
+        indexes = [
+            # Ordering key used to page through the author list
+            models.Index(fields=['last_name', 'first_name', 'id'], name='author_name_id_idx'),
+        ]
 
     def get_absolute_url(self):
         """Returns the url to process a particular author instance."""
@@ -111,4 +264,16 @@ class Author(models.Model):
 
     def __str__(self):
         """String for representing the Model object."""
-        return f'{self.last_name}, {self.first_name}'
\ No newline at end of file
+        return f'{self.last_name}, {self.first_name}'
+
+class PageVisits(models.Model):
+    """Model representing the number of visits to a page of the site (see catalog.visits)."""
+    page = models.CharField(max_length=100, unique=True)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'page visits'
+
+    def __str__(self):
+        """String for representing the Model object."""
+        return f'{self.page}: {self.count}'
@@ -0,0 +1,176 @@
+"""Reminder emails for overdue loans.
+
+The overdue loans are read with one range scan of the (status, due_back,
+borrower) index, then sorted by borrower (a temporary B-tree holding only the
+overdue loans, as the range is in due date order) so that each borrower's
+loans arrive together and are grouped into one reminder. Reminders are sent
+in batches by a pool of worker threads, each batch over one connection to the
+configured EMAIL_BACKEND, at a limited rate. Progress is kept as the last
+borrower whose reminder was sent, so an interrupted sweep can resume.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import DEFAULT_DB_ALIAS
+from django.template.loader import render_to_string
+
+from catalog.models import BookInstance
+
+REMINDER_SUBJECT = 'Overdue library books'
+
+REMINDER_TEMPLATE = 'catalog/overdue_reminder_email.txt'
+
+# Rows fetched from the database at a time
+CHUNK_SIZE = 2000
+
+
+class RateLimiter:
+    """Spread events out to at most rate per second, shared by any number of threads."""
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self, count=1):
+        """Block until count more events are allowed."""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + count * self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Checkpoint:
+    """The last borrower reminded in a sweep, stored as JSON in a file."""
+
+    def __init__(self, path, today):
+        self.path = path
+        self.today = today.isoformat()
+
+    def load(self):
+        """Return the borrower id to resume after, or None to start from the beginning."""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            data = json.load(f)
+        # A checkpoint from an earlier day belongs to a sweep that is over
+        return data['borrower_id'] if data.get('today') == self.today else None
+
+    def save(self, borrower_id):
+        if not self.path:
+            return
+        # Written to a temporary file first, so a crash never leaves a partial checkpoint
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'today': self.today, 'borrower_id': borrower_id}, f)
+        os.replace(temporary_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def overdue_loans(today, after_borrower_id=None, using=DEFAULT_DB_ALIAS):
+    """Return the overdue loans as (borrower_id, username, email, first_name, title, due_back), by borrower."""
+    loans = BookInstance.objects.using(using).filter(status='o', due_back__lt=today, borrower__isnull=False)
+    if after_borrower_id is not None:
+        loans = loans.filter(borrower_id__gt=after_borrower_id)
+    return loans.order_by('borrower_id', 'due_back', 'id').values_list(
+        'borrower_id', 'borrower__username', 'borrower__email', 'borrower__first_name', 'book__title', 'due_back',
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def group_by_borrower(loans):
+    """Yield (borrower_id, email, name, loans) for rows of overdue_loans() in borrower order."""
+    current = None
+    for borrower_id, username, email, first_name, title, due_back in loans:
+        if current is None or current[0] != borrower_id:
+            if current is not None:
+                yield current
+            current = (borrower_id, email, first_name or username, [])
+        current[3].append({'title': title, 'due_back': due_back})
+    if current is not None:
+        yield current
+
+
+def reminder_message(email, name, loans):
+    body = render_to_string(REMINDER_TEMPLATE, {'name': name, 'loans': loans})
+    return EmailMessage(REMINDER_SUBJECT, body, settings.DEFAULT_FROM_EMAIL, [email])
+
+
+def _send_batch(messages, limiter):
+    limiter.wait(len(messages))
+    connection = get_connection()
+    return connection.send_messages(messages) or 0
+
+
+def sweep_overdue(today, checkpoint, workers=4, batch_size=100, rate=None, using=DEFAULT_DB_ALIAS, log=None):
+    """Send a reminder to every borrower with overdue loans, resuming from checkpoint.
+
+    Returns a dict of totals. Batches complete in any order, so the checkpoint
+    only moves past a batch once every batch before it has been sent. If a
+    batch fails, the sweep stops and the exception is raised once the batches
+    already submitted are done, leaving the checkpoint before the failure.
+    """
+    totals = {'borrowers': 0, 'loans': 0, 'sent': 0, 'skipped': 0}
+    limiter = RateLimiter(rate)
+    after_borrower_id = checkpoint.load()
+    if after_borrower_id is not None and log:
+        log(f'Resuming after borrower {after_borrower_id}.')
+
+    pending = []  # [future, last borrower id of the batch] in submission order
+    error = None
+
+    def collect(block):
+        """Wait for batches, advance the checkpoint past the oldest ones that are done."""
+        nonlocal error
+        if block and pending:
+            wait([future for future, _ in pending], return_when=FIRST_COMPLETED)
+        while pending and pending[0][0].done():
+            future, last_borrower_id = pending.pop(0)
+            if future.exception() is not None:
+                error = error or future.exception()
+            elif error is None:
+                totals['sent'] += future.result()
+                checkpoint.save(last_borrower_id)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        batch = []
+        last_borrower_id = None
+        for borrower_id, email, name, loans in group_by_borrower(overdue_loans(today, after_borrower_id, using)):
+            totals['borrowers'] += 1
+            totals['loans'] += len(loans)
+            last_borrower_id = borrower_id
+            if email:
+                batch.append(reminder_message(email, name, loans))
+            else:
+                totals['skipped'] += 1
+            if len(batch) >= batch_size:
+                pending.append([executor.submit(_send_batch, batch, limiter), last_borrower_id])
+                batch = []
+                # Keep a bounded number of batches in flight, so memory stays flat
+                while len(pending) >= workers * 2 and error is None:
+                    collect(block=True)
+                if error is not None:
+                    break
+        else:
+            if batch:
+                pending.append([executor.submit(_send_batch, batch, limiter), last_borrower_id])
+            elif last_borrower_id is not None:
+                # Borrowers without an email address after the last batch
+                pending.append([executor.submit(lambda: 0), last_borrower_id])
+        while pending:
+            collect(block=True)
+
+    if error is not None:
+        raise error
+    return totals
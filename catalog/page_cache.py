@@ -0,0 +1,85 @@
+"""Whole-page caching of the public catalog pages for anonymous users.
+
+A page is cached under its full URL and the versions of the data it shows
+(see catalog.caching): the model versions of what it lists and the versions
+of the rows it details. The signal handlers give those a new version when
+the data changes, so a changed page is simply looked up under a new key and
+the old copy is never read again, without any other page being invalidated.
+
+Pages are stored in the cache named by CATALOG_PAGE_CACHE (any configured
+Django cache backend) for CATALOG_PAGE_CACHE_TIMEOUT seconds (0 disables
+caching). Signed-in users see their own name and links on every page, so
+only anonymous GET and HEAD requests are served from the cache.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.http import HttpResponse
+
+from catalog.caching import get_versions, model_version_name
+from catalog.hotcache import get_or_compute
+from catalog.querybudget import record_template_time
+from catalog.routers import use_primary
+
+DEFAULT_TIMEOUT = 600
+
+
+def _page_key(request, version_names, vary):
+    versions = get_versions(*version_names)
+    key = repr((request.get_full_path(), sorted(versions.items()), vary))
+    return f'catalog:page:{hashlib.sha1(key.encode()).hexdigest()}'
+
+
+def cached_page(request, version_names, render, vary=()):
+    """Return render() for request, or the copy of it cached under the same URL and versions.
+
+    vary holds anything else the page depends on, and only successful
+    responses are cached.
+    """
+    timeout = getattr(settings, 'CATALOG_PAGE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    if not timeout or request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return render()
+
+    page_cache = caches[getattr(settings, 'CATALOG_PAGE_CACHE', DEFAULT_CACHE_ALIAS)]
+    rendered = []
+
+    def render_page():
+        # Read from the primary, which has the changes the versions in the key were bumped for
+        with use_primary():
+            response = render()
+            rendered.append(response)
+            if response.status_code != 200 or response.streaming:
+                return None
+            if hasattr(response, 'render'):
+                # Views return a TemplateResponse, rendered only on the way out
+                start = time.perf_counter()
+                response.render()
+                record_template_time(time.perf_counter() - start)
+        return response.content, response['Content-Type']
+
+    # A popular page that expires is rendered again by one request, the others get the cached copy
+    cached = get_or_compute(_page_key(request, version_names, vary), render_page, timeout, cache=page_cache)[0]
+    if rendered:
+        # This request rendered the page, or the page can't be cached
+        return rendered[0]
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+def cache_anonymous_page(models=(), rows=None):
+    """Decorate a view to cache its pages with cached_page().
+
+    models are the models the page lists, and rows(**kwargs) returns the
+    names of the versions of the rows it shows, from the URL's arguments.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            version_names = [model_version_name(model) for model in models]
+            if rows is not None:
+                version_names.extend(rows(**kwargs))
+            return cached_page(request, version_names, lambda: view(request, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,272 @@
+"""Keyset (cursor) pagination for the catalog list views.
+
+Django's Paginator pages with OFFSET and needs a COUNT(*) for every page, so
+deep pages get slower the further in they are. CursorPaginator instead seeks
+past the last row of the previous page using the ordering key, which an index
+can answer in the same time for any page. Pages are addressed by opaque,
+signed tokens that take the place of the page number in ?page=, so the
+existing pagination links in base_generic.html keep working.
+
+EstimatedCountPaginator is a Django Paginator for the admin changelists: it
+takes the number of rows of a large table from the database's statistics
+instead of counting them.
+"""
+import datetime
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import gettext as _
+
+CURSOR_SALT = 'catalog.pagination.cursor'
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+# Tables with more rows than this (by estimate) are not counted by EstimatedCountPaginator
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class InvalidCursor(Exception):
+    """The cursor token was tampered with or does not fit the ordering."""
+    pass
+
+
+class CursorPage:
+    """A page of results, with the same interface as django.core.paginator.Page.
+
+    The page "numbers" for the next and previous pages are cursor tokens.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page %s>' % self.number
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self.paginator.encode_cursor(FORWARD, self.number + 1, self.object_list[-1])
+
+    def previous_page_number(self):
+        return self.paginator.encode_cursor(BACKWARD, self.number - 1, self.object_list[0])
+
+
+class CursorPaginator:
+    """Paginate a queryset by seeking on an ordering key.
+
+    ordering is a sequence of field names (prefixed with '-' for descending
+    order) whose values together identify a row, typically ending with 'id'.
+    The queryset may return model instances or .values() dicts.
+    """
+
+    def __init__(self, object_list, per_page, ordering):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.model = object_list.model
+        self.fields = [self.model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+        self.num_pages = 1
+
+    @property
+    def count(self):
+        # Counting is what this paginator avoids, it is only done if asked for
+        return self.object_list.count()
+
+    def encode_cursor(self, direction, number, row):
+        """Return the token for the page before or after row."""
+        values = [self._serialize(self._row_value(row, field)) for field in self.fields]
+        return signing.dumps([direction, number, values], salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, token):
+        try:
+            direction, number, values = signing.loads(token, salt=CURSOR_SALT)
+            if direction not in (FORWARD, BACKWARD) or len(values) != len(self.fields):
+                raise ValueError
+            values = [None if value is None else field.to_python(value) for field, value in zip(self.fields, values)]
+            return direction, int(number), values
+        except (signing.BadSignature, TypeError, ValueError) as e:
+            raise InvalidCursor(_('Invalid page cursor.')) from e
+
+    def page(self, token=None):
+        """Return the page the token points to, or the first page."""
+        if not token or token == '1':
+            direction, number, values = FORWARD, 1, None
+        else:
+            direction, number, values = self.decode_cursor(token)
+
+        queryset = self.object_list
+        if direction == FORWARD:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            queryset = queryset.order_by(*(self._reverse(name) for name in self.ordering))
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, after=direction == FORWARD))
+
+        # One row more than a page tells us whether there is another page in this direction
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == FORWARD:
+            has_next, has_previous = has_more, values is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        # The total number of pages is unknown without a count, so show that there are more
+        self.num_pages = f'{number + 1}+' if has_next else number
+        return CursorPage(rows, number, self, has_next, has_previous)
+
+    @staticmethod
+    def _reverse(name):
+        return name[1:] if name.startswith('-') else f'-{name}'
+
+    @staticmethod
+    def _row_value(row, field):
+        if isinstance(row, dict):
+            return row[field.name] if field.name in row else row[field.attname]
+        return getattr(row, field.attname)
+
+    @staticmethod
+    def _serialize(value):
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        return value
+
+    def _seek(self, values, after):
+        """Build the filter for the rows after (or before) the row with the given key values.
+
+        For a key (a, b, c) this is a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z),
+        with NULLs placed where the database sorts them.
+        """
+        nulls_largest = connections[self.object_list.db].features.nulls_order_largest
+        condition = Q(pk__in=[])
+        equal = Q()
+        bound = Q()
+        for position, (name, field, value) in enumerate(zip(self.ordering, self.fields, values)):
+            descending = name.startswith('-')
+            attname = field.attname
+            # Whether NULLs come first when walking in the requested direction
+            nulls_first = (nulls_largest == descending) == after
+
+            if value is None:
+                beyond = Q(**{f'{attname}__isnull': False}) if nulls_first else Q(pk__in=[])
+                same = Q(**{f'{attname}__isnull': True})
+            else:
+                lookup = 'gt' if descending != after else 'lt'
+                beyond = Q(**{f'{attname}__{lookup}': value})
+                if field.null and not nulls_first:
+                    beyond |= Q(**{f'{attname}__isnull': True})
+                same = Q(**{attname: value})
+
+            if position == 0 and value is not None and (nulls_first or not field.null):
+                # A plain range on the leading column lets the database walk the index in order
+                # instead of merging the alternatives and sorting them
+                bound = Q(**{f'{attname}__{lookup}e': value})
+
+            condition |= equal & beyond
+            equal &= same
+        return bound & condition
+
+
+class CursorPaginationMixin:
+    """Let a ListView page with CursorPaginator instead of Django's Paginator.
+
+    Cursor pagination is used when cursor_pagination is True, or when it is
+    None and the CATALOG_CURSOR_PAGINATION setting is on. The view's
+    cursor_ordering is used as the ordering in both modes.
+    """
+    cursor_ordering = ('id',)
+    cursor_pagination = None
+
+    def use_cursor_pagination(self):
+        if self.cursor_pagination is None:
+            return getattr(settings, 'CATALOG_CURSOR_PAGINATION', False)
+        return self.cursor_pagination
+
+    def get_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering)
+        token = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg)
+        try:
+            page = paginator.page(token)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        if not page.object_list and page.number != 1:
+            raise Http404(_('Invalid page (%(page_number)s): That page contains no results') % {
+                'page_number': page.number,
+            })
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+def estimated_count(queryset):
+    """Estimate the number of rows of an unfiltered queryset from the database's statistics, or return None."""
+    query = queryset.query
+    if query.where or query.distinct or query.combinator or query.low_mark or query.high_mark is not None:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+                [table],
+            )
+        elif connection.vendor == 'sqlite':
+            # The largest rowid is read from the end of the table's b-tree. It is off by the rows deleted.
+            cursor.execute('SELECT MAX(_rowid_) FROM %s' % connection.ops.quote_name(table))
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """A Paginator that estimates the number of rows of large unfiltered tables instead of counting them.
+
+    Filtered querysets, and tables estimated to be small, are counted. An
+    estimate can be off by a few pages at the end.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
@@ -0,0 +1,62 @@
+"""Users' permissions, loaded in one query and kept in the cache between requests.
+
+CachedPermissionBackend is Django's ModelBackend with a different way of
+finding a user's permissions: their own and their groups' are loaded
+together in a single query, and cached under versions (see catalog.caching)
+for the user and for everyone. The PermissionRequiredMixin views,
+@permission_required and the perms variable in templates all ask the
+backend, which also keeps the permissions on the user object for the rest
+of the request, as ModelBackend does.
+
+The signal handlers in catalog.signals give a user's permissions a new
+version, once the change is committed, when the user is saved or their
+groups or permissions change. Changes made from the other side, to a
+group's permissions or to the users of a group or permission, give
+everyone's permissions a new version.
+
+The backend is only safe with a cache shared by every worker, so the
+settings only use it then, and the catalog.W002 check warns otherwise.
+"""
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db.models import Q
+
+from catalog.caching import get_versions
+
+# Changes are handled by invalidation, this only lets unused entries go
+PERMISSIONS_CACHE_TIMEOUT = 60 * 60 * 24
+
+ALL_PERMISSIONS_VERSION_NAME = 'permissions:all'
+
+
+def user_permissions_version_name(user_id):
+    """Name of the version covering the permissions of one user."""
+    return f'permissions:user:{user_id}'
+
+
+def load_permissions(user):
+    """Return the user's permissions, with their groups', as a set of 'app_label.codename'."""
+    if user.is_superuser:
+        permissions = Permission.objects.all()
+    else:
+        permissions = Permission.objects.filter(Q(user=user) | Q(group__user=user))
+    return {
+        f'{app_label}.{codename}'
+        for app_label, codename in permissions.values_list('content_type__app_label', 'codename').order_by().distinct()
+    }
+
+
+class CachedPermissionBackend(ModelBackend):
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            versions = get_versions(user_permissions_version_name(user_obj.pk), ALL_PERMISSIONS_VERSION_NAME)
+            key = 'catalog:permissions:{}:{}:{}'.format(user_obj.pk, *versions.values())
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = load_permissions(user_obj)
+                cache.set(key, permissions, PERMISSIONS_CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
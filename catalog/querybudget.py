@@ -0,0 +1,174 @@
+"""Queries, SQL time and template render time per view, checked against per-view budgets.
+
+QueryBudgetMiddleware records every query a request makes, on every
+database, and how long its templates took to render. The numbers are:
+- attached to the response as response.query_metrics;
+- sent as X-Query-* headers when DEBUG is on;
+- added up per view for the metrics endpoint (views.query_metrics).
+
+Queries are also fingerprinted, with their parameters and the length of IN
+lists left out, so the same query repeated for each row of a list (an N+1)
+shows up as a duplicate.
+
+Views declare the most queries they may make with @query_budget(n) or a
+query_budget attribute on the class. A request going over budget is logged,
+and catalog.tests.utils.QueryBudgetClient fails the test making it.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+_in_list = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def query_budget(queries):
+    """Declare the most queries a function view may make."""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+def view_budget(view):
+    """Return the query budget declared by a view function or the class of a class-based view."""
+    budget = getattr(view, 'query_budget', None)
+    if budget is None and hasattr(view, 'view_class'):
+        budget = getattr(view.view_class, 'query_budget', None)
+    return budget
+
+
+def fingerprint(sql):
+    """The query without its parameters, so the same query made for different rows looks the same."""
+    return _in_list.sub('IN (...)', ' '.join(sql.split()))
+
+
+class QueryMetrics:
+    """Queries and render time recorded during one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+        self.budget = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper recording the query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        """Number of queries that repeat one made before."""
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def repeated(self):
+        """Return [(count, fingerprint)] for the queries made more than once, most repeated first."""
+        return [(count, sql) for sql, count in self.fingerprints.most_common() if count > 1]
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.queries > self.budget
+
+    def describe(self):
+        lines = [f'{self.queries} queries (budget {self.budget}), {self.duplicates} duplicates']
+        lines.extend(f'  {count} x {sql}' for count, sql in self.repeated())
+        return '\n'.join(lines)
+
+
+def record_template_time(seconds):
+    """Add to the render time of the current request, if it is being recorded."""
+    metrics = getattr(_state, 'metrics', None)
+    if metrics is not None:
+        metrics.template_time += seconds
+
+
+class ViewStats:
+    """Totals per view since the process started, shown by the metrics endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def add(self, view_name, metrics):
+        with self.lock:
+            stats = self.views.setdefault(view_name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'sql_ms': 0.0, 'template_ms': 0.0,
+                'duplicates': 0, 'over_budget': 0, 'budget': metrics.budget,
+            })
+            stats['requests'] += 1
+            stats['queries'] += metrics.queries
+            stats['max_queries'] = max(stats['max_queries'], metrics.queries)
+            stats['sql_ms'] += metrics.sql_time * 1000
+            stats['template_ms'] += metrics.template_time * 1000
+            stats['duplicates'] += metrics.duplicates
+            stats['over_budget'] += metrics.over_budget
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                view_name: {**stats, 'sql_ms': round(stats['sql_ms'], 3), 'template_ms': round(stats['template_ms'], 3)}
+                for view_name, stats in sorted(self.views.items())
+            }
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+
+view_stats = ViewStats()
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = QueryMetrics()
+        previous = getattr(_state, 'metrics', None)
+        _state.metrics = metrics
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _state.metrics = previous
+
+        match = request.resolver_match
+        if match is None:
+            return response
+        metrics.budget = view_budget(match.func)
+        view_stats.add(match.view_name, metrics)
+        response.query_metrics = metrics
+        if metrics.over_budget:
+            logger.warning('%s went over its query budget: %s', match.view_name, metrics.describe())
+        if settings.DEBUG:
+            response['X-Query-Count'] = metrics.queries
+            response['X-Query-Time-Ms'] = f'{metrics.sql_time * 1000:.3f}'
+            response['X-Query-Duplicates'] = metrics.duplicates
+            response['X-Template-Time-Ms'] = f'{metrics.template_time * 1000:.3f}'
+            if metrics.budget is not None:
+                response['X-Query-Budget'] = metrics.budget
+        return response
+
+    def process_template_response(self, request, response):
+        # The response is rendered right after this, so time it from here to the post-render callback
+        start = time.perf_counter()
+        response.add_post_render_callback(lambda response: record_template_time(time.perf_counter() - start))
+        return response
@@ -0,0 +1,23 @@
+"""A stand-in for replication, to run the site against read replicas locally.
+
+SQLite has no replication of its own, so replicate() copies the primary
+database over each replica with SQLite's online backup API, which readers of
+the replica can go on using while it runs. Run ``manage.py replicate
+--interval N`` next to the server to get replicas lagging at most N seconds
+behind, like real ones.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from catalog.routers import read_replicas
+
+
+def replicate(source=DEFAULT_DB_ALIAS, replicas=None):
+    """Copy the source database over each of the replicas (CATALOG_READ_REPLICAS by default)."""
+    replicas = read_replicas() if replicas is None else replicas
+    source_connection = connections[source]
+    source_connection.ensure_connection()
+    for alias in replicas:
+        replica = connections[alias]
+        replica.ensure_connection()
+        source_connection.connection.backup(replica.connection)
+    return replicas
@@ -0,0 +1,102 @@
+"""Send reads of the catalog to read replicas, and everything else to the primary database.
+
+Replicas are the database aliases listed in CATALOG_READ_REPLICAS, picked at
+random for each query; with none listed every query goes to 'default'. The
+catalog's writes, and the reads of the other apps (users, sessions, admin
+log), always go to the primary. So do reads made inside a transaction on the
+primary, as they are usually followed by a write depending on them, and
+reads made while pinned to the primary: by use_primary() and by
+catalog.middleware.PrimaryPinningMiddleware, which pins a user's requests for
+a while after they change something so that they see their own changes
+before the replicas catch up.
+"""
+import functools
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = threading.local()
+
+
+def read_replicas():
+    return getattr(settings, 'CATALOG_READ_REPLICAS', [])
+
+
+@contextmanager
+def use_primary():
+    """Read everything from the primary database inside the block."""
+    previous = getattr(_state, 'pinned', False)
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = previous
+
+
+def read_from_primary(view):
+    """Decorate a view to make all of its reads from the primary database."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with use_primary():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+class WriteTracker:
+    """Notes whether the catalog was written to, while it is active (see note_write())."""
+
+    def __init__(self):
+        self.wrote = False
+
+    def __enter__(self):
+        self.previous = getattr(_state, 'tracker', None)
+        _state.tracker = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _state.tracker = self.previous
+
+
+def note_write():
+    """Tell the active WriteTracker that the catalog was written to.
+
+    Called by the signal handlers in catalog.signals when a catalog model is
+    saved or deleted, and by the code making bulk writes, which send no
+    signals. Routing a query for writing isn't enough, as reads of rows that
+    have to be current are routed the same way.
+    """
+    tracker = getattr(_state, 'tracker', None)
+    if tracker is not None:
+        tracker.wrote = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = read_replicas()
+        if not replicas or model._meta.app_label != 'catalog' or getattr(_state, 'pinned', False):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in read_replicas():
+            # Rows read from a replica are written back to the primary
+            return DEFAULT_DB_ALIAS
+        # Otherwise the database the instance came from, or the primary
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *read_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema along with the data
+        return db not in read_replicas()
@@ -0,0 +1,337 @@
+"""Full-text search over the catalog's books.
+
+Books are indexed on their title, summary, author name, genre names and ISBN.
+On SQLite the index is an FTS5 virtual table (created by a migration) that is
+queried with MATCH and ranked with bm25(). Other databases, or SQLite builds
+without FTS5, use an inverted index held in memory by each process.
+
+The signal handlers in catalog.signals keep the index up to date as books,
+authors and genres change. Code that writes with bulk operations (which send
+no signals) should call index_books()/remove_books() itself.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from catalog.models import Book
+
+FTS_TABLE = 'catalog_book_fts'
+
+# Relative weight of each indexed column when ranking results
+COLUMN_WEIGHTS = {
+    'title': 10.0,
+    'summary': 1.0,
+    'author': 5.0,
+    'genres': 3.0,
+    'isbn': 10.0,
+}
+
+# SQLite limits the number of variables in one statement
+MAX_IDS_PER_QUERY = 500
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Split text into lowercase tokens without diacritics, like FTS5's unicode61 tokenizer."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_RE.findall(text.lower())
+
+
+def parse_query(query):
+    """Split a search query into (token, is_prefix) terms. A trailing * marks a prefix."""
+    terms = []
+    for word in (query or '').split():
+        is_prefix = word.endswith('*')
+        tokens = tokenize(word)
+        terms.extend((token, False) for token in tokens[:-1])
+        if tokens:
+            terms.append((tokens[-1], is_prefix))
+    return terms
+
+
+def _chunks(ids, size=MAX_IDS_PER_QUERY):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+# The columns of the FTS table for a set of books, as (SQLite) SQL over the catalog tables
+DOCUMENTS_SQL = """
+    SELECT b.id,
+           b.title,
+           b.summary,
+           COALESCE(a.first_name || ' ' || a.last_name, ''),
+           COALESCE((SELECT group_concat(g.name, ' ')
+                     FROM catalog_book_genre bg INNER JOIN catalog_genre g ON g.id = bg.genre_id
+                     WHERE bg.book_id = b.id), ''),
+           b.isbn
+    FROM catalog_book b LEFT OUTER JOIN catalog_author a ON a.id = b.author_id
+"""
+
+
+class BaseSearchBackend:
+    """Interface shared by the search backends."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def search(self, query, offset=0, limit=20):
+        """Return the ids of the books matching query, best match first."""
+        raise NotImplementedError
+
+    def index_books(self, book_ids):
+        """Add or refresh the books with these ids."""
+        raise NotImplementedError
+
+    def remove_books(self, book_ids):
+        """Remove the books with these ids."""
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Rebuild the whole index from the catalog tables."""
+        raise NotImplementedError
+
+    def remove_deleted_books(self):
+        """Remove the books deleted without signals, as flush (and TransactionTestCase) deletes them."""
+        raise NotImplementedError
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """Search backend using the SQLite FTS5 table created by the catalog migrations."""
+
+    @staticmethod
+    def match_expression(terms):
+        # Every term is quoted so user input can't use the FTS5 query syntax
+        return ' '.join('"%s"%s' % (token, '*' if is_prefix else '') for token, is_prefix in terms)
+
+    def search(self, query, offset=0, limit=20):
+        terms = parse_query(query)
+        if not terms:
+            return []
+        # FTS5 ranks the matches by the rank column, here bm25() with the column weights, and
+        # only returns a page of them
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS.values())
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rank MATCH %s '
+                f'ORDER BY rank LIMIT %s OFFSET %s',
+                [self.match_expression(terms), f'bm25({weights})', limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_books(self, book_ids):
+        columns = ', '.join(COLUMN_WEIGHTS)
+        with connections[self.using].cursor() as cursor:
+            for chunk in _chunks(book_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+                cursor.execute(
+                    f'INSERT INTO {FTS_TABLE} (rowid, {columns}) {DOCUMENTS_SQL} WHERE b.id IN ({placeholders})',
+                    chunk,
+                )
+
+    def remove_books(self, book_ids):
+        with connections[self.using].cursor() as cursor:
+            for chunk in _chunks(book_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+    def rebuild(self):
+        columns = ', '.join(COLUMN_WEIGHTS)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, {columns}) {DOCUMENTS_SQL}')
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+    def remove_deleted_books(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid NOT IN (SELECT id FROM {Book._meta.db_table})')
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """Search backend keeping an inverted index in the memory of the current process.
+
+    The index is built from the database on first use. It only sees changes
+    made through this process, so it suits development, tests and single
+    process deployments on databases without a full-text index.
+    """
+    # BM25 parameters
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        super().__init__(using)
+        self.lock = threading.RLock()
+        self.postings = None
+
+    def _load(self):
+        if self.postings is None:
+            self.postings = defaultdict(dict)  # token -> {book_id: weighted term frequency}
+            self.documents = {}  # book_id -> (tokens, document length)
+            self.total_length = 0
+            self._add_documents(self._fetch_documents(), update_terms=False)
+            self.terms = sorted(self.postings)  # for prefix lookups
+
+    def _fetch_documents(self, book_ids=None):
+        """Yield the indexed columns of the books, read with the ORM so any database works."""
+        books = Book.objects.using(self.using).order_by()
+        genres = Book.genre.through.objects.using(self.using).order_by()
+        if book_ids is None:
+            chunks = [None]
+        else:
+            chunks = _chunks(book_ids)
+        for chunk in chunks:
+            chunk_books = books if chunk is None else books.filter(pk__in=chunk)
+            chunk_genres = genres if chunk is None else genres.filter(book_id__in=chunk)
+            genre_names = defaultdict(list)
+            for book_id, name in chunk_genres.values_list('book_id', 'genre__name').iterator():
+                genre_names[book_id].append(name)
+            rows = chunk_books.values_list(
+                'id', 'title', 'summary', 'author__first_name', 'author__last_name', 'isbn',
+            ).iterator()
+            for book_id, title, summary, first_name, last_name, isbn in rows:
+                author = f'{first_name} {last_name}' if first_name is not None else ''
+                yield book_id, title, summary, author, ' '.join(genre_names[book_id]), isbn
+
+    def _add_documents(self, rows, update_terms=True):
+        for book_id, *columns in rows:
+            frequencies = defaultdict(float)
+            length = 0
+            for weight, text in zip(COLUMN_WEIGHTS.values(), columns):
+                tokens = tokenize(text)
+                length += len(tokens)
+                for token in tokens:
+                    frequencies[token] += weight
+            for token, frequency in frequencies.items():
+                if update_terms and token not in self.postings:
+                    bisect.insort(self.terms, token)
+                self.postings[token][book_id] = frequency
+            self.documents[book_id] = (tuple(frequencies), length)
+            self.total_length += length
+
+    def _remove_documents(self, book_ids):
+        for book_id in book_ids:
+            tokens, length = self.documents.pop(book_id, ((), 0))
+            self.total_length -= length
+            for token in tokens:
+                postings = self.postings[token]
+                postings.pop(book_id, None)
+                if not postings:
+                    del self.postings[token]
+                    del self.terms[bisect.bisect_left(self.terms, token)]
+
+    def _expand(self, token, is_prefix):
+        if not is_prefix:
+            return [token] if token in self.postings else []
+        start = bisect.bisect_left(self.terms, token)
+        end = bisect.bisect_left(self.terms, token + '\U0010ffff')
+        return self.terms[start:end]
+
+    def search(self, query, offset=0, limit=20):
+        terms = parse_query(query)
+        if not terms:
+            return []
+        with self.lock:
+            self._load()
+            count = len(self.documents) or 1
+            average_length = self.total_length / count or 1
+            scores = None
+            for token, is_prefix in terms:
+                # Every term has to match, a prefix matches through its best scoring expansion
+                term_scores = {}
+                for expansion in self._expand(token, is_prefix):
+                    postings = self.postings[expansion]
+                    idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for book_id, frequency in postings.items():
+                        length = self.documents[book_id][1]
+                        score = idf * frequency * (self.k1 + 1) / (
+                            frequency + self.k1 * (1 - self.b + self.b * length / average_length))
+                        term_scores[book_id] = max(score, term_scores.get(book_id, 0))
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {book_id: score + term_scores[book_id] for book_id, score in scores.items() if book_id in term_scores}
+                if not scores:
+                    return []
+            # Only the books up to the end of the page are sorted
+            ranked = heapq.nsmallest(offset + limit, scores, key=lambda book_id: (-scores[book_id], book_id))
+            return ranked[offset:]
+
+    def index_books(self, book_ids):
+        book_ids = list(book_ids)
+        with self.lock:
+            if self.postings is None:
+                # Loaded from the database, including these books, on first search
+                return
+            self._remove_documents(book_ids)
+            self._add_documents(self._fetch_documents(book_ids))
+
+    def remove_books(self, book_ids):
+        with self.lock:
+            if self.postings is not None:
+                self._remove_documents(book_ids)
+
+    def rebuild(self):
+        with self.lock:
+            self.postings = None
+            self._load()
+
+    def remove_deleted_books(self):
+        with self.lock:
+            # Loaded again from the database on the next search
+            self.postings = None
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def has_fts_table(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+
+@receiver(setting_changed)
+def reset_search_backends(setting, **kwargs):
+    if setting == 'CATALOG_SEARCH_BACKEND':
+        with _backends_lock:
+            _backends.clear()
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    """Return the search backend for a database, as set by CATALOG_SEARCH_BACKEND or detected."""
+    with _backends_lock:
+        if using not in _backends:
+            backend_path = getattr(settings, 'CATALOG_SEARCH_BACKEND', None)
+            if backend_path:
+                backend_class = import_string(backend_path)
+            elif has_fts_table(using):
+                backend_class = SQLiteFTSSearchBackend
+            else:
+                backend_class = InMemorySearchBackend
+            _backends[using] = backend_class(using)
+        return _backends[using]
+
+
+def index_books(book_ids, using=DEFAULT_DB_ALIAS):
+    book_ids = [book_id for book_id in book_ids if book_id is not None]
+    if book_ids:
+        get_search_backend(using).index_books(book_ids)
+
+
+def remove_books(book_ids, using=DEFAULT_DB_ALIAS):
+    book_ids = [book_id for book_id in book_ids if book_id is not None]
+    if book_ids:
+        get_search_backend(using).remove_books(book_ids)
@@ -0,0 +1,228 @@
+"""Signal handlers keeping the catalog caches in step with the database.
+
+Versions are given new values, and the cached counts dropped, once the
+change is committed (transaction.on_commit() runs them at once outside a
+transaction). Before the commit, a request reading the old rows would cache
+them under the new versions, and they would be served until they expired.
+"""
+from django.contrib.auth.models import Group, Permission, User
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from catalog import counters, search
+from catalog.caching import book_copies_version_name, bump_model_versions, bump_version, instance_version_name
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.permissions import ALL_PERMISSIONS_VERSION_NAME, user_permissions_version_name
+from catalog.routers import note_write
+from catalog.stats import invalidate_catalog_stats
+
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(m2m_changed)
+def catalog_written(sender, **kwargs):
+    """Pin the user to the primary for a while after they change the catalog (see catalog.middleware)."""
+    if sender._meta.app_label == 'catalog':
+        note_write()
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_delete, sender=Genre)
+def catalog_stats_changed(sender, using, **kwargs):
+    """Any change to a counted model invalidates the home page counts."""
+    transaction.on_commit(invalidate_catalog_stats, using=using)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=BookInstance)
+@receiver(post_save, sender=Genre)
+@receiver(post_save, sender=Language)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_delete, sender=Genre)
+@receiver(post_delete, sender=Language)
+@receiver(post_delete, sender=User)
+def model_changed(sender, using, **kwargs):
+    """Give the model a new version, which the API's ETag and Last-Modified headers are made from."""
+    if sender is User and kwargs.get('update_fields') == frozenset(['last_login']):
+        # Logging in changes nothing the catalog shows
+        return
+    transaction.on_commit(lambda: bump_model_versions(sender), using=using)
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed(sender, action, using, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump_model_versions(Book), using=using)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Book)
+def row_changed(sender, instance, using, **kwargs):
+    """Give the row a new version, so the cached pages showing it are rendered again."""
+    name = instance_version_name(sender, instance.pk)
+    transaction.on_commit(lambda: bump_version(name), using=using)
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed_rows(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            names = [instance_version_name(Book, instance.pk)]
+            transaction.on_commit(lambda: bump_version(*names), using=using)
+    elif action == 'pre_clear':
+        instance._page_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    else:
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_page_book_ids', [])
+        if action in ('post_add', 'post_remove', 'post_clear') and pk_set:
+            names = [instance_version_name(Book, pk) for pk in pk_set]
+            transaction.on_commit(lambda: bump_version(*names), using=using)
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_delete, sender=BookInstance)
+def book_copies_changed(sender, instance, using, **kwargs):
+    """Give the book a copy belongs to (and belonged to, if it moved) a new copies version."""
+    book_ids = {instance.book_id, instance.get_loaded_value('book_id')} - {None}
+    if book_ids:
+        names = [book_copies_version_name(book_id) for book_id in book_ids]
+        transaction.on_commit(lambda: bump_version(*names), using=using)
+
+
+def _loaded_book_and_status(instance):
+    """Return the (book_id, status) a copy was loaded with, or None if they weren't loaded."""
+    loaded = getattr(instance, '_loaded_values', {})
+    if 'book_id' in loaded and 'status' in loaded:
+        return loaded['book_id'], loaded['status']
+    return None
+
+
+@receiver(post_save, sender=BookInstance)
+def copy_saved_counters(sender, instance, created, update_fields, raw, using, **kwargs):
+    """Move the copy between its book's counters, or the counters of the books it moved between."""
+    if raw:
+        # Fixtures carry the counters of the books they were dumped with
+        return
+    if created:
+        counters.adjust_counters([(instance.book_id, instance.status, 1)], using)
+        return
+    if update_fields is not None and not {'book', 'status'} & set(update_fields):
+        return
+    loaded = _loaded_book_and_status(instance)
+    if loaded is None:
+        # What the copy was before is unknown, so recount its book
+        counters.reconcile_counters(Book.objects.using(using).filter(pk=instance.book_id))
+        return
+    counters.adjust_counters([(*loaded, -1), (instance.book_id, instance.status, 1)], using)
+
+
+@receiver(post_delete, sender=BookInstance)
+def copy_deleted_counters(sender, instance, using, **kwargs):
+    book_id, status = _loaded_book_and_status(instance) or (instance.book_id, instance.status)
+    counters.adjust_counters([(book_id, status, -1)], using)
+
+
+@receiver(post_save, sender=Book)
+def book_saved_search(sender, instance, **kwargs):
+    search.index_books([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted_search(sender, instance, **kwargs):
+    search.remove_books([instance.pk])
+
+
+@receiver(m2m_changed, sender=Book.genre.through)
+def book_genres_changed_search(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index_books([instance.pk])
+    elif action == 'pre_clear':
+        # The books are gone from the genre by post_clear, so note them first
+        instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        search.index_books(getattr(instance, '_search_book_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        search.index_books(pk_set)
+
+
+@receiver(post_save, sender=Author)
+def author_saved_search(sender, instance, created, **kwargs):
+    if not created:
+        search.index_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved_search(sender, instance, created, **kwargs):
+    if not created:
+        search.index_books(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Genre)
+def author_or_genre_deleting_search(sender, instance, **kwargs):
+    # Deleting updates the books' rows without sending signals for them, so note them first
+    instance._search_book_ids = list(instance.book_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Genre)
+def author_or_genre_deleted_search(sender, instance, **kwargs):
+    search.index_books(getattr(instance, '_search_book_ids', []))
+
+
+@receiver(post_migrate)
+def catalog_migrated_search(sender, using, **kwargs):
+    """Drop the books flush deleted from the search index, flush sends post_migrate once it is done."""
+    if sender.name == 'catalog' and Book._meta.db_table in connections[using].introspection.table_names():
+        search.get_search_backend(using).remove_deleted_books()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_permissions_changed(sender, instance, using, **kwargs):
+    """Give the user's permissions a new version, as being active or a superuser changes them."""
+    if kwargs.get('update_fields') == frozenset(['last_login']):
+        return
+    name = user_permissions_version_name(instance.pk)
+    transaction.on_commit(lambda: bump_version(name), using=using)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_permission_links_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        names = [user_permissions_version_name(instance.pk)]
+    elif pk_set:
+        # Users added to or removed from a group or permission
+        names = [user_permissions_version_name(pk) for pk in pk_set]
+    else:
+        # A group or permission was cleared of its users, whoever they were
+        names = [ALL_PERMISSIONS_VERSION_NAME]
+    transaction.on_commit(lambda: bump_version(*names), using=using)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def group_permissions_changed(sender, using, action=None, **kwargs):
+    """Give everyone's permissions a new version, rather than look up whose changed."""
+    if action not in (None, 'post_add', 'post_remove', 'post_clear'):
+        return
+    transaction.on_commit(lambda: bump_version(ALL_PERMISSIONS_VERSION_NAME), using=using)
@@ -0,0 +1,76 @@
+"""Catalog statistics shown on the home page.
+
+All of the counts are computed in a single aggregate query and kept in the
+cache, refreshed by one request at a time (see catalog.hotcache). The signal
+handlers in catalog.signals invalidate the cached value whenever one of the
+counted models changes.
+"""
+from django.core.cache import cache
+from django.db import connection
+
+from catalog.hotcache import get_or_compute
+from catalog.models import Author, Book, BookInstance, Genre
+
+STATS_CACHE_KEY = 'catalog:stats'
+
+# Keep the counts for a day at most, changes are handled by invalidation
+STATS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _stats_querysets():
+    """Return the (name, parts) pairs shown on the home page, parts being (queryset, summed field) pairs.
+
+    The parts of a count are added together. Without a summed field the rows
+    of the queryset are counted.
+    """
+    # The counters on the books only cover copies of a book
+    copies_without_book = BookInstance.objects.filter(book__isnull=True)
+    return (
+        ('num_books', [(Book.objects.all(), None)]),
+        # Copies are added up from the counters on the books rather than counted
+        ('num_instances', [(Book.objects.all(), 'copies_total'), (copies_without_book, None)]),
+        # Available books (status = 'a')
+        ('num_instances_available', [
+            (Book.objects.all(), 'copies_available'), (copies_without_book.filter(status='a'), None),
+        ]),
+        ('num_authors', [(Author.objects.all(), None)]),
+        # Number of books that contain "novel"
+        ('num_books_with_novel', [(Book.objects.filter(title__icontains='novel'), None)]),
+        # Number of genres that contain "fiction"
+        ('num_genres_with_fiction', [(Genre.objects.filter(name__icontains='fiction'), None)]),
+    )
+
+
+def compute_catalog_stats():
+    """Compute everything in one round trip, using one scalar subquery per count."""
+    names = []
+    columns = []
+    params = []
+    for name, parts in _stats_querysets():
+        terms = []
+        for queryset, summed_field in parts:
+            # Order and default ordering are irrelevant to a count
+            sql, sql_params = queryset.order_by().values(summed_field or 'pk').query.sql_with_params()
+            if summed_field:
+                terms.append(f'(SELECT COALESCE(SUM({summed_field}), 0) FROM ({sql}) subquery)')
+            else:
+                terms.append(f'(SELECT COUNT(*) FROM ({sql}) subquery)')
+            params.extend(sql_params)
+        names.append(name)
+        columns.append(' + '.join(terms))
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(columns), params)
+        row = cursor.fetchone()
+
+    return dict(zip(names, row))
+
+
+def get_catalog_stats():
+    """Return the home page counts, from the cache when possible."""
+    return get_or_compute(STATS_CACHE_KEY, compute_catalog_stats, STATS_CACHE_TIMEOUT)[0]
+
+
+def invalidate_catalog_stats():
+    """Drop the cached counts so the next request recomputes them."""
+    cache.delete(STATS_CACHE_KEY)
@@ -0,0 +1,110 @@
+"""A template backend that times renders and can compile the site's templates ahead of time.
+
+DjangoTemplates is Django's backend with two additions:
+- Each render of a template by a view (not the templates it extends or
+  includes, whose time is part of it) is added to template_stats, shown by
+  the metrics endpoint.
+- With the 'preload' option, preload_templates() compiles every template in
+  the project's template directories and the catalog app when a worker
+  starts (from CatalogConfig.ready). With the cached loader, which keeps
+  compiled templates in memory, no request then reads or parses a template.
+
+See TEMPLATE_MODE in the settings.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.apps import apps
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateStats:
+    """Renders and render time per template since the process started."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.templates = {}
+
+    def add(self, template_name, seconds):
+        with self.lock:
+            stats = self.templates.setdefault(template_name, {'renders': 0, 'render_ms': 0.0, 'max_ms': 0.0})
+            stats['renders'] += 1
+            stats['render_ms'] += seconds * 1000
+            stats['max_ms'] = max(stats['max_ms'], seconds * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                template_name: {
+                    'renders': stats['renders'],
+                    'render_ms': round(stats['render_ms'], 3),
+                    'mean_ms': round(stats['render_ms'] / stats['renders'], 3),
+                    'max_ms': round(stats['max_ms'], 3),
+                }
+                for template_name, stats in sorted(self.templates.items())
+            }
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+
+
+template_stats = TemplateStats()
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            template_stats.add(self.origin.template_name or '<string>', time.perf_counter() - start)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def __init__(self, params):
+        params = params.copy()
+        options = params['OPTIONS'] = params['OPTIONS'].copy()
+        self.preload = options.pop('preload', False)
+        super().__init__(params)
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+    def preload_directories(self):
+        """The project's template directories and the catalog app's."""
+        return [*self.engine.dirs, os.path.join(apps.get_app_config('catalog').path, 'templates')]
+
+    def preload_templates(self):
+        """Compile every template in the preload directories, and return their names."""
+        names = []
+        for directory in self.preload_directories():
+            for root, _, files in os.walk(directory):
+                for file in files:
+                    name = os.path.relpath(os.path.join(root, file), directory).replace(os.sep, '/')
+                    try:
+                        self.engine.get_template(name)
+                    except TemplateSyntaxError:
+                        # Left to fail, with the usual error page, when a view renders it
+                        logger.warning('Could not preload template %s', name, exc_info=True)
+                        continue
+                    names.append(name)
+        return names
+
+
+def preload_templates():
+    """Compile the templates of every backend with the preload option on."""
+    for backend in engines.all():
+        if getattr(backend, 'preload', False):
+            backend.preload_templates()
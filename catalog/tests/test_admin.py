@@ -0,0 +1,132 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.pagination import EstimatedCountPaginator
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+        self.client.force_login(self.admin)
+        self.language = Language.objects.create(name='English')
+        self.genres = [Genre.objects.create(name=name) for name in ('Fantasy', 'Poetry', 'History')]
+
+    def create_books(self, count):
+        books = []
+        for i in range(count):
+            author = Author.objects.create(first_name='Jane', last_name=f'Writer {i}')
+            book = Book.objects.create(title=f'Book {i}', summary='Summary', isbn=f'{i:013}',
+                                       author=author, language=self.language)
+            book.genre.set(self.genres)
+            books.append(book)
+        return books
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:catalog_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+class ChangelistQueriesTest(AdminTestCase):
+    def test_book_changelist_queries_do_not_grow_with_rows(self):
+        self.create_books(2)
+        few = self.changelist_queries('book')
+        self.create_books(20)
+        self.assertEqual(self.changelist_queries('book'), few)
+
+    def test_bookinstance_changelist_queries_do_not_grow_with_rows(self):
+        def create_loans(count):
+            for book in self.create_books(count):
+                borrower = User.objects.create_user(username=f'reader{book.pk}')
+                BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=borrower,
+                                            due_back=datetime.date.today())
+
+        create_loans(2)
+        few = self.changelist_queries('bookinstance')
+        create_loans(20)
+        self.assertEqual(self.changelist_queries('bookinstance'), few)
+
+
+class EstimatedCountPaginatorTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        books = self.create_books(5)
+        # The estimate goes by the largest rowid, so it still counts a deleted row
+        books[2].delete()
+
+    @mock.patch('catalog.pagination.ESTIMATED_COUNT_THRESHOLD', 3)
+    def test_large_table_is_estimated(self):
+        self.assertEqual(EstimatedCountPaginator(Book.objects.order_by('pk'), 2).count, 5)
+
+    @mock.patch('catalog.pagination.ESTIMATED_COUNT_THRESHOLD', 3)
+    def test_filtered_queryset_is_counted(self):
+        self.assertEqual(EstimatedCountPaginator(Book.objects.filter(title__startswith='Book').order_by('pk'), 2).count, 4)
+
+    def test_small_table_is_counted(self):
+        self.assertEqual(EstimatedCountPaginator(Book.objects.order_by('pk'), 2).count, 4)
+
+
+class PaginatedInlineTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = self.create_books(1)[0]
+        self.copies = [
+            BookInstance.objects.create(book=self.book, imprint=f'Imprint {i}', status='a') for i in range(25)
+        ]
+        self.url = reverse('admin:catalog_book_change', args=[self.book.pk])
+
+    def inline_formset(self, response):
+        return response.context['inline_admin_formsets'][0].formset
+
+    def test_inline_shows_one_page(self):
+        formset = self.inline_formset(self.client.get(self.url))
+        self.assertEqual(len(formset.forms), 20)
+        self.assertEqual(formset.paginator.num_pages, 2)
+
+        formset = self.inline_formset(self.client.get(self.url, {'bookinstance_set-page': 2}))
+        self.assertEqual(len(formset.forms), 5)
+        self.assertEqual(formset.page.number, 2)
+
+    def test_pages_hold_every_row_once(self):
+        # The copies all tie on their ordering (due_back), so the pages are ordered by pk too
+        formset = self.inline_formset(self.client.get(self.url))
+        self.assertEqual(list(formset.paginator.object_list.query.order_by), ['due_back', 'pk'])
+        shown = [form.instance.pk for form in formset.forms]
+        formset = self.inline_formset(self.client.get(self.url, {'bookinstance_set-page': 2}))
+        shown += [form.instance.pk for form in formset.forms]
+        self.assertCountEqual(shown, [copy.pk for copy in self.copies])
+
+    def test_page_links_keep_the_query(self):
+        filters = '_changelist_filters=status%3Da'
+        response = self.client.get(f'{self.url}?{filters}')
+        self.assertContains(response, f'href="?{filters}&amp;bookinstance_set-page=2"')
+        response = self.client.get(f'{self.url}?{filters}&bookinstance_set-page=2')
+        self.assertContains(response, f'href="?{filters}&amp;bookinstance_set-page=1"')
+
+    def test_saving_a_page_changes_its_rows(self):
+        page = self.url + '?bookinstance_set-page=2'
+        formset = self.inline_formset(self.client.get(page))
+        copies = [form.instance for form in formset.forms]
+        data = {
+            'title': self.book.title, 'author': self.book.author_id, 'summary': self.book.summary,
+            'isbn': self.book.isbn, 'genre': [genre.pk for genre in self.genres], 'language': self.language.pk,
+            'bookinstance_set-TOTAL_FORMS': len(copies), 'bookinstance_set-INITIAL_FORMS': len(copies),
+            'bookinstance_set-MIN_NUM_FORMS': 0, 'bookinstance_set-MAX_NUM_FORMS': 1000,
+        }
+        for i, copy in enumerate(copies):
+            data.update({
+                f'bookinstance_set-{i}-id': copy.pk, f'bookinstance_set-{i}-book': self.book.pk,
+                f'bookinstance_set-{i}-imprint': 'Reprint', f'bookinstance_set-{i}-status': copy.status,
+            })
+
+        response = self.client.post(page, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(BookInstance.objects.filter(imprint='Reprint').count(), 5)
@@ -0,0 +1,181 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.tests.utils import run_on_commit_callbacks
+
+
+class CatalogAPITest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = Author.objects.create(first_name='Frank', last_name='Herbert')
+        self.language = Language.objects.create(name='English')
+        self.genre = Genre.objects.create(name='Science Fiction')
+        self.books = []
+        for number in range(25):
+            book = Book.objects.create(
+                title=f'Book {number:02}', summary='Summary.', isbn=f'{number:013}',
+                author=self.author, language=self.language,
+            )
+            book.genre.set([self.genre])
+            self.books.append(book)
+        self.reader = User.objects.create_user(username='reader', password='1X<IIbnibusdg')
+        self.copy = BookInstance.objects.create(
+            book=self.books[0], imprint='Imprint', status='o', borrower=self.reader,
+            due_back=datetime.date.today() - datetime.timedelta(days=1),
+        )
+
+    def get(self, resource, pk=None, **params):
+        if pk is None:
+            url = reverse('api-list', kwargs={'resource': resource})
+        else:
+            url = reverse('api-detail', kwargs={'resource': resource, 'pk': pk})
+        return self.client.get(url, params)
+
+    def test_book_list_pages(self):
+        response = self.get('books')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(data['results'][0], {
+            'id': self.books[0].pk,
+            'title': 'Book 00',
+            'isbn': '0000000000000',
+            'summary': 'Summary.',
+            'author_id': self.author.pk,
+            'author_first_name': 'Frank',
+            'author_last_name': 'Herbert',
+            'language': 'English',
+            'genres': ['Science Fiction'],
+            'copies_total': 1,
+            'copies_available': 0,
+            'copies_on_loan': 1,
+        })
+        self.assertIsNone(data['previous'])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([book['title'] for book in data['results']], [f'Book {number}' for number in range(20, 25)])
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+    def test_sparse_fields(self):
+        data = self.get('books', fields='title,genres', limit=2).json()
+        self.assertEqual(data['results'], [
+            {'title': 'Book 00', 'genres': ['Science Fiction']},
+            {'title': 'Book 01', 'genres': ['Science Fiction']},
+        ])
+        self.assertIn('fields=title%2Cgenres', data['next'])
+
+        # A single query, no model instances
+        with self.assertNumQueries(1):
+            data = self.get('authors', self.author.pk, fields='last_name').json()
+        self.assertEqual(data, {'last_name': 'Herbert'})
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get('books', fields='title,password').status_code, 400)
+        self.assertEqual(self.get('books', limit='1000').status_code, 400)
+        self.assertEqual(self.get('books', cursor='tampered').status_code, 400)
+        self.assertEqual(self.get('users').status_code, 404)
+        self.assertEqual(self.get('books', 999999).status_code, 404)
+        self.assertEqual(self.get('copies', 'not-a-uuid').status_code, 404)
+        response = self.client.post(reverse('api-list', kwargs={'resource': 'books'}))
+        self.assertEqual(response.status_code, 405)
+
+    def test_loans_need_permission(self):
+        self.assertEqual(self.get('loans').status_code, 403)
+        librarian = User.objects.create_user(username='librarian', password='18DFH5jhkeHO!')
+        librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        self.client.login(username='librarian', password='18DFH5jhkeHO!')
+
+        response = self.get('loans')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(response.json()['results'], [{
+            'id': str(self.copy.pk),
+            'book_id': self.books[0].pk,
+            'title': 'Book 00',
+            'due_back': self.copy.due_back.isoformat(),
+            'overdue': True,
+            'borrower': 'reader',
+        }])
+
+    def test_loans_change_with_the_date(self):
+        librarian = User.objects.create_user(username='librarian', password='18DFH5jhkeHO!')
+        librarian.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+        self.client.login(username='librarian', password='18DFH5jhkeHO!')
+        self.copy.due_back = datetime.date.today()
+        self.copy.save()
+
+        url = reverse('api-list', kwargs={'resource': 'loans'})
+        response = self.client.get(url)
+        self.assertFalse(response.json()['results'][0]['overdue'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        # Nothing was written, but the loan is overdue the next day
+        with mock.patch('catalog.api.today', return_value=datetime.date.today() + datetime.timedelta(days=1)):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.json()['results'][0]['overdue'])
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 200)
+
+    def test_conditional_get(self):
+        response = self.get('books', fields='title')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        # Revalidating doesn't touch the database
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse('api-list', kwargs={'resource': 'books'}), {'fields': 'title'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Another query is another representation
+        response = self.get('books', fields='isbn')
+        self.assertNotEqual(response['ETag'], etag)
+
+        # A change to a model the books are built from changes the ETag
+        with run_on_commit_callbacks():
+            self.copy.mark_returned()
+        response = self.client.get(
+            reverse('api-list', kwargs={'resource': 'books'}), {'fields': 'title'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Authors don't depend on copies
+        response = self.get('authors')
+        etag = response['ETag']
+        BookInstance.objects.create(book=self.books[1], imprint='Imprint', status='a')
+        response = self.client.get(reverse('api-list', kwargs={'resource': 'authors'}), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        response = self.get('authors')
+        response = self.client.get(
+            reverse('api-list', kwargs={'resource': 'authors'}), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_response_bodies_cached_by_etag(self):
+        response = self.get('books', fields='title,copies_available', limit=1)
+        with self.assertNumQueries(0):
+            cached = self.get('books', fields='title,copies_available', limit=1)
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        with run_on_commit_callbacks():
+            self.copy.mark_returned()
+        response = self.get('books', fields='title,copies_available', limit=1)
+        self.assertEqual(response.json()['results'], [{'title': 'Book 00', 'copies_available': 1}])
+
+    @override_settings(CATALOG_API_CACHE_TIMEOUT=0)
+    def test_response_cache_disabled(self):
+        self.get('authors')
+        with self.assertNumQueries(1):
+            self.get('authors')
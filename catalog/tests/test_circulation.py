@@ -0,0 +1,96 @@
+import datetime
+import uuid
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from catalog import circulation
+from catalog.caching import book_copies_version_name, get_version, model_version_name
+from catalog.models import Book, BookInstance
+from catalog.stats import get_catalog_stats
+from catalog.tests.utils import run_on_commit_callbacks
+
+class ProcessBatchTest(TestCase):
+    def setUp(self):
+        self.borrower = User.objects.create_user(username='reader', password='1X<IIbnibusdg')
+        test_book = Book.objects.create(title='Book Title', summary='My book summary.', isbn='ABCDEFG')
+        self.available = [
+            BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='a') for copy in range(3)
+        ]
+        self.on_loan = BookInstance.objects.create(
+            book=test_book, imprint='Unlikely Imprint, 2016', status='o', borrower=self.borrower,
+            due_back=datetime.date.today() + datetime.timedelta(days=2),
+        )
+        self.in_maintenance = BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='m')
+
+    def test_checkout(self):
+        due_back = datetime.date.today() + datetime.timedelta(weeks=2)
+        ids = [copy.pk for copy in self.available]
+        results = circulation.process_batch(circulation.CHECKOUT, ids, borrower=self.borrower, due_back=due_back)
+
+        self.assertEqual([result['ok'] for result in results], [True, True, True])
+        self.assertEqual([result['id'] for result in results], [str(pk) for pk in ids])
+        for copy in BookInstance.objects.filter(pk__in=ids):
+            self.assertEqual((copy.status, copy.borrower, copy.due_back), ('o', self.borrower, due_back))
+
+    def test_batch_uses_one_update(self):
+        ids = [copy.pk for copy in self.available]
+        # SELECT ... FOR UPDATE, one UPDATE of the copies and one of the book counters, inside a savepoint
+        with self.assertNumQueries(5):
+            circulation.process_batch(circulation.CHECKOUT, ids, borrower=self.borrower)
+
+    def test_caches_invalidated_once_committed(self):
+        book_id = self.available[0].book_id
+        names = [model_version_name(Book), model_version_name(BookInstance), book_copies_version_name(book_id)]
+        versions = [get_version(name) for name in names]
+        self.assertEqual(get_catalog_stats()['num_instances_available'], 3)
+
+        with run_on_commit_callbacks():
+            circulation.process_batch(circulation.CHECKOUT, [self.available[0].pk], borrower=self.borrower)
+            # A request reading before the commit would cache the old rows, so nothing is invalidated yet
+            self.assertEqual([get_version(name) for name in names], versions)
+            self.assertEqual(get_catalog_stats()['num_instances_available'], 3)
+
+        for name, version in zip(names, versions):
+            self.assertNotEqual(get_version(name), version)
+        self.assertEqual(get_catalog_stats()['num_instances_available'], 2)
+
+    def test_mixed_batch_reports_each_copy(self):
+        missing = uuid.uuid4()
+        ids = [self.available[0].pk, self.on_loan.pk, self.in_maintenance.pk, missing, 'not-a-uuid', self.available[0].pk]
+        results = circulation.process_batch(circulation.RETURN, ids)
+
+        self.assertEqual(len(results), 5)
+        self.assertEqual(results[0], {
+            'id': str(self.available[0].pk), 'ok': False, 'status': 'a', 'error': 'Cannot return a copy that is available.',
+        })
+        self.assertEqual(results[1], {'id': str(self.on_loan.pk), 'ok': True, 'status': 'a', 'due_back': None})
+        self.assertEqual(results[2]['error'], 'Cannot return a copy that is maintenance.')
+        self.assertEqual(results[3], {'id': str(missing), 'ok': False, 'error': 'No such copy.'})
+        self.assertEqual(results[4], {'id': 'not-a-uuid', 'ok': False, 'error': 'Invalid copy id.'})
+
+        self.on_loan.refresh_from_db()
+        self.assertEqual((self.on_loan.status, self.on_loan.borrower, self.on_loan.due_back), ('a', None, None))
+
+    def test_renew_uses_renewal_date_rules(self):
+        with self.assertRaisesMessage(circulation.CirculationError, 'Invalid date - renewal more than 4 weeks ahead'):
+            circulation.process_batch(
+                circulation.RENEW, [self.on_loan.pk], due_back=datetime.date.today() + datetime.timedelta(weeks=5),
+            )
+        with self.assertRaisesMessage(circulation.CirculationError, 'Invalid date - renewal in past'):
+            circulation.process_batch(circulation.RENEW, [self.on_loan.pk], due_back='2000-01-01')
+
+        results = circulation.process_batch(circulation.RENEW, [self.on_loan.pk, self.available[0].pk])
+        due_back = datetime.date.today() + datetime.timedelta(weeks=3)
+        self.assertEqual(results[0], {'id': str(self.on_loan.pk), 'ok': True, 'status': 'o', 'due_back': due_back.isoformat()})
+        self.assertFalse(results[1]['ok'])
+        self.on_loan.refresh_from_db()
+        self.assertEqual(self.on_loan.due_back, due_back)
+
+    def test_checkout_needs_borrower(self):
+        with self.assertRaises(circulation.CirculationError):
+            circulation.process_batch(circulation.CHECKOUT, [self.available[0].pk])
+        with self.assertRaises(circulation.CirculationError):
+            circulation.process_batch('lose', [self.available[0].pk])
+        with self.assertRaises(circulation.CirculationError):
+            circulation.process_batch(['checkout'], [self.available[0].pk], borrower=self.borrower)
@@ -0,0 +1,360 @@
+import csv
+import datetime
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.overdue import overdue_loans
+from catalog.search import get_search_backend
+from catalog.stats import get_catalog_stats
+from catalog.tests.utils import ReplicaDatabaseMixin, run_on_commit_callbacks
+
+
+def longest_in_list(queries):
+    """The most values given in one IN (...) list of the captured queries."""
+    lists = re.findall(r' IN \(([^()]*)\)', ' '.join(query['sql'] for query in queries))
+    return max((len(values.split(', ')) for values in lists if not values.startswith('SELECT')), default=0)
+
+class ImportCatalogCommandTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        # Existing records should be reused, not duplicated
+        self.existing_author = Author.objects.create(first_name='John', last_name='Tolkien')
+        self.existing_genre = Genre.objects.create(name='Fantasy')
+        self.existing_book = Book.objects.create(title='The Hobbit', summary='Existing.', isbn='9780261103283', author=self.existing_author)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', newline='') as f:
+            f.write(content)
+        return path
+
+    def call_import(self, *args, **options):
+        out = StringIO()
+        call_command('import_catalog', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        path = self.write_file('catalog.csv', (
+            'isbn,title,summary,author_first_name,author_last_name,language,genres,imprint,copies\n'
+            '9780261103283,The Hobbit,Ignored.,John,Tolkien,English,Fantasy;Adventure,Allen & Unwin,2\n'
+            '9780441172719,Dune,Worms.,Frank,Herbert,English,Science Fiction,Ace,3\n'
+            '9780441172719,Dune,Worms.,Frank,Herbert,English,Science Fiction,Chilton,1\n'
+            '9780000000001,No Copies,Nothing.,Frank,Herbert,French,,,\n'
+        ))
+        output = self.call_import(path, chunk_size=2)
+        self.assertIn('Finished: 4 rows, 2 new books, 6 copies', output)
+        self.assertIn('rows/s', output)
+
+        self.assertEqual(Book.objects.count(), 3)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Language.objects.count(), 2)
+        self.assertEqual(Genre.objects.filter(name='Fantasy').count(), 1)
+
+        hobbit = Book.objects.get(pk=self.existing_book.pk)
+        self.assertEqual(hobbit.summary, 'Existing.')
+        self.assertEqual(sorted(hobbit.genre.values_list('name', flat=True)), ['Adventure', 'Fantasy'])
+        self.assertEqual(hobbit.bookinstance_set.count(), 2)
+
+        dune = Book.objects.get(isbn='9780441172719')
+        self.assertEqual(str(dune.author), 'Herbert, Frank')
+        self.assertEqual(str(dune.language), 'English')
+        self.assertEqual(list(dune.genre.values_list('name', flat=True)), ['Science Fiction'])
+        self.assertEqual(dune.bookinstance_set.filter(status='a').count(), 4)
+        self.assertEqual(Book.objects.get(isbn='9780000000001').bookinstance_set.count(), 0)
+
+    def test_import_jsonl_with_copy_details(self):
+        User.objects.create_user(username='reader', password='1X<IIbnibusdg')
+        copy_id = uuid.uuid4()
+        path = self.write_file('catalog.jsonl', '\n'.join(json.dumps(row) for row in [
+            {'isbn': '9780441172719', 'title': 'Dune', 'author_first_name': 'Frank', 'author_last_name': 'Herbert',
+             'genres': ['Science Fiction'], 'imprint': 'Ace', 'copy_id': str(copy_id), 'status': 'o',
+             'due_back': '2020-06-01', 'borrower': 'reader'},
+        ]) + '\n')
+        self.call_import(path)
+        # Importing the same copy again does not duplicate it
+        self.call_import(path)
+
+        copy = BookInstance.objects.get()
+        self.assertEqual(copy.pk, copy_id)
+        self.assertEqual(copy.status, 'o')
+        self.assertEqual(copy.due_back, datetime.date(2020, 6, 1))
+        self.assertEqual(copy.borrower.username, 'reader')
+        self.assertEqual(
+            Book.objects.filter(pk=copy.book_id).values_list('copies_total', 'copies_available', 'copies_on_loan').get(),
+            (1, 0, 1),
+        )
+
+    def test_import_updates_search_and_stats(self):
+        self.assertEqual(get_catalog_stats()['num_books'], 1)
+        path = self.write_file('catalog.csv', 'isbn,title,author_first_name,author_last_name,imprint\n9780441172719,Dune,Frank,Herbert,Ace\n')
+        with run_on_commit_callbacks():
+            self.call_import(path)
+            # Only invalidated once the chunk is committed
+            self.assertEqual(get_catalog_stats()['num_books'], 1)
+
+        dune = Book.objects.get(isbn='9780441172719')
+        self.assertEqual(get_search_backend().search('herbert'), [dune.pk])
+        self.assertEqual(get_catalog_stats()['num_books'], 2)
+        self.assertEqual(get_catalog_stats()['num_instances'], 1)
+
+    @mock.patch('catalog.management.commands.import_catalog.MAX_IDS_PER_QUERY', 2)
+    def test_chunks_are_looked_up_in_batches(self):
+        User.objects.create_user(username='reader', password='1X<IIbnibusdg')
+        rows = ['9780261103283,The Hobbit,John,Tolkien,Fantasy,Allen & Unwin,reader']
+        rows += [f'978000000000{i},Book {i},Jane,Writer {i},Genre {i},Imprint,reader' for i in range(4)]
+        path = self.write_file('catalog.csv', 'isbn,title,author_first_name,author_last_name,genres,imprint,borrower\n' + '\n'.join(rows) + '\n')
+        with CaptureQueriesContext(connection) as queries:
+            self.call_import(path)
+
+        # The search index is written in batches of its own
+        self.assertLessEqual(longest_in_list(q for q in queries if 'catalog_book_fts' not in q['sql']), 2)
+        self.assertEqual(Book.objects.count(), 5)
+        self.assertEqual(Author.objects.count(), 5)
+        self.assertEqual(self.existing_book.bookinstance_set.count(), 1)
+        self.assertEqual(BookInstance.objects.filter(borrower__username='reader').count(), 5)
+        self.assertEqual(list(Book.objects.filter(isbn='9780000000003').values_list('genre__name', 'copies_total')), [('Genre 3', 1)])
+
+    def test_invalid_rows_are_reported(self):
+        path = self.write_file('catalog.csv', 'isbn,title,due_back\n9780441172719,Dune,tomorrow\n')
+        with self.assertRaisesMessage(CommandError, 'catalog.csv:2: due_back must be a YYYY-MM-DD date'):
+            self.call_import(path)
+
+        path = self.write_file('catalog.txt', '')
+        with self.assertRaisesMessage(CommandError, 'use --format'):
+            self.call_import(path)
+
+class ExportCatalogCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader', password='1X<IIbnibusdg')
+        author = Author.objects.create(first_name='Frank', last_name='Herbert', date_of_birth=datetime.date(1920, 10, 8))
+        cls.book = Book.objects.create(title='Dune', summary='Worms, "spice", politics.', isbn='9780441172719', author=author)
+        cls.book.genre.set([Genre.objects.create(name='Science Fiction'), Genre.objects.create(name='Adventure')])
+        cls.copy = BookInstance.objects.create(
+            book=cls.book, imprint='Ace', status='o', due_back=datetime.date(2020, 6, 1), borrower=cls.reader,
+        )
+
+    def call_export(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'export')
+        call_command('export_catalog', *args, output=path, **options)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_export_books_csv(self):
+        rows = list(csv.DictReader(StringIO(self.call_export('books').decode())))
+        self.assertEqual(rows, [{
+            'book_id': str(self.book.pk),
+            'isbn': '9780441172719',
+            'title': 'Dune',
+            'summary': 'Worms, "spice", politics.',
+            'author_first_name': 'Frank',
+            'author_last_name': 'Herbert',
+            'language': '',
+            'genres': 'Adventure;Science Fiction',
+        }])
+
+    @mock.patch('catalog.export.MAX_IDS_PER_QUERY', 2)
+    def test_export_books_fetches_genres_in_batches(self):
+        genre = Genre.objects.get(name='Adventure')
+        for i in range(4):
+            Book.objects.create(title=f'Book {i}', summary='Summary.', isbn=f'978000000000{i}').genre.add(genre)
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(csv.DictReader(StringIO(self.call_export('books').decode())))
+
+        self.assertLessEqual(longest_in_list(queries), 2)
+        self.assertEqual([row['genres'] for row in rows], ['Adventure;Science Fiction'] + ['Adventure'] * 4)
+
+    def test_export_copies_jsonl(self):
+        rows = [json.loads(line) for line in self.call_export('copies', format='jsonl').decode().splitlines()]
+        self.assertEqual(rows, [{
+            'copy_id': str(self.copy.pk),
+            'book_id': self.book.pk,
+            'isbn': '9780441172719',
+            'title': 'Dune',
+            'imprint': 'Ace',
+            'status': 'o',
+            'due_back': '2020-06-01',
+            'borrower': 'reader',
+        }])
+
+    def test_export_to_stdout(self):
+        out = StringIO()
+        call_command('export_catalog', 'books', format='jsonl', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['title'], 'Dune')
+
+    def test_export_authors_gzip(self):
+        content = gzip.decompress(self.call_export('authors', format='ndjson', gzip=True)).decode()
+        self.assertEqual(json.loads(content)['author_date_of_birth'], '1920-10-08')
+
+    def test_exported_copies_can_be_imported(self):
+        content = self.call_export('copies')
+        BookInstance.objects.all().delete()
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'copies.csv')
+        with open(path, 'wb') as f:
+            f.write(content)
+        call_command('import_catalog', path, stdout=StringIO())
+
+        copy = BookInstance.objects.get()
+        self.assertEqual((copy.pk, copy.book, copy.status, copy.borrower), (self.copy.pk, self.book, 'o', self.reader))
+
+
+class ReconcileCountersCommandTest(TestCase):
+    def setUp(self):
+        self.books = [Book.objects.create(title=f'Book {number}', summary='Summary.', isbn='ABCDEFG') for number in range(5)]
+        for book in self.books:
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o')
+        # Writes that bypass the counters
+        Book.objects.filter(pk__in=[self.books[1].pk, self.books[3].pk]).update(copies_total=0, copies_on_loan=7)
+        BookInstance.objects.filter(book=self.books[4], status='a').update(status='m')
+
+    def call_reconcile(self, **options):
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out, **options)
+        return out.getvalue()
+
+    def counters(self):
+        return list(Book.objects.order_by('pk').values_list('copies_total', 'copies_available', 'copies_on_loan'))
+
+    def test_dry_run_reports_drift(self):
+        before = self.counters()
+        self.assertIn('Checked 5 books, 3 drifted.', self.call_reconcile(dry_run=True, batch_size=2))
+        self.assertEqual(self.counters(), before)
+
+    def test_repairs_drift(self):
+        self.assertIn('Checked 5 books, 3 repaired.', self.call_reconcile(batch_size=2))
+        self.assertEqual(self.counters(), [(2, 1, 1)] * 4 + [(2, 0, 1)])
+        self.assertIn('Checked 5 books, 0 repaired.', self.call_reconcile())
+
+
+class SweepOverdueCommandTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.checkpoint = os.path.join(self.directory, 'sweep.json')
+
+        self.today = datetime.date.today()
+        book = Book.objects.create(title='Book Title', summary='My book summary.', isbn='ABCDEFG')
+        self.borrowers = []
+        for number in range(5):
+            borrower = User.objects.create_user(
+                username=f'reader{number}', email=f'reader{number}@example.com', password='1X<IIbnibusdg')
+            self.borrowers.append(borrower)
+            for days in (3, 1):
+                BookInstance.objects.create(
+                    book=book, imprint='Imprint', status='o', borrower=borrower,
+                    due_back=self.today - datetime.timedelta(days=days),
+                )
+        # Not overdue: due today, returned, or borrowed by someone without an email address
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=self.borrowers[0], due_back=self.today)
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a', due_back=self.today - datetime.timedelta(days=5))
+        self.no_email = User.objects.create_user(username='noemail', password='1X<IIbnibusdg')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='o', borrower=self.no_email, due_back=self.today - datetime.timedelta(days=1))
+
+    def call_sweep(self, **options):
+        out = StringIO()
+        call_command('sweep_overdue', checkpoint=self.checkpoint, stdout=out, **options)
+        return out.getvalue()
+
+    def test_one_reminder_per_borrower(self):
+        output = self.call_sweep(batch_size=2, workers=3)
+        self.assertIn('11 overdue loans of 6 borrowers: 5 reminders sent, 1 borrowers without an email address', output)
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'reader{number}@example.com' for number in range(5)])
+        message = next(message for message in mail.outbox if message.to == ['reader0@example.com'])
+        self.assertEqual(message.subject, 'Overdue library books')
+        self.assertEqual(message.body.count('Book Title, due back on'), 2)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Checks SQLite query plans')
+    def test_overdue_loans_are_read_from_a_range_of_the_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(overdue_loans(self.today))
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + queries[0]['sql'])
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING INDEX bookinst_overdue_borrower_idx (status=? AND due_back<?)', plan)
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'today': self.today.isoformat(), 'borrower_id': self.borrowers[2].pk}, f)
+        output = self.call_sweep()
+        self.assertIn(f'Resuming after borrower {self.borrowers[2].pk}.', output)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['reader3@example.com', 'reader4@example.com'])
+
+        # The sweep is complete for today, running it again sends nothing
+        mail.outbox = []
+        self.call_sweep()
+        self.assertEqual(mail.outbox, [])
+
+        # Unless it is restarted
+        self.call_sweep(restart=True)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_failed_batch_keeps_checkpoint_before_it(self):
+        sent_batches = []
+
+        def send_messages(backend, messages):
+            if sent_batches:
+                raise ConnectionError('SMTP server went away')
+            sent_batches.append(messages)
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', send_messages):
+            with self.assertRaisesMessage(CommandError, 'SMTP server went away'):
+                self.call_sweep(batch_size=2, workers=1)
+
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)['borrower_id'], self.borrowers[1].pk)
+        self.call_sweep()
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'reader{number}@example.com' for number in range(2, 5)])
+
+    def test_rate_limit(self):
+        start = time.monotonic()
+        self.call_sweep(rate=50, batch_size=1)
+        # Five emails at 50 a second: the last one waits for the first four
+        self.assertGreaterEqual(time.monotonic() - start, 4 / 50)
+        self.assertEqual(len(mail.outbox), 5)
+
+
+class ReplicateCommandTest(ReplicaDatabaseMixin, TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def test_copies_the_primary_to_the_replicas(self):
+        Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        out = StringIO()
+        with override_settings(CATALOG_READ_REPLICAS=['replica']):
+            call_command('replicate', stdout=out)
+        self.assertIn('Copied default to replica.', out.getvalue())
+        self.assertEqual(Author.objects.using('replica').get().last_name, 'Le Guin')
+
+    def test_needs_a_replica(self):
+        with self.assertRaisesMessage(CommandError, 'No replicas'):
+            call_command('replicate', stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'Unknown database'):
+            call_command('replicate', replica=['nowhere'], stdout=StringIO())
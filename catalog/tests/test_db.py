@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase
+
+from catalog.querybudget import QueryMetrics
+
+
+class DatabaseProfileTest(SimpleTestCase):
+    def connect(self, profile):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory.name, 'db.sqlite3'), 'PRAGMAS': None}
+        settings_dict.update(settings.DATABASE_PROFILES[profile])
+        wrapper = DatabaseWrapper(settings_dict, alias='profile-test')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_production_profile_pragmas(self):
+        wrapper = self.connect('production')
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'mmap_size'), 256 * 1024 * 1024)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 20000)
+        self.assertEqual(wrapper.settings_dict['CONN_MAX_AGE'], 600)
+
+    def test_default_profile_leaves_sqlite_defaults(self):
+        wrapper = self.connect('default')
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 2)  # FULL
+
+    def test_pragmas_are_not_counted_as_queries(self):
+        wrapper = self.connect('production')
+        metrics = QueryMetrics()
+        with wrapper.execute_wrapper(metrics):
+            self.pragma(wrapper, 'journal_mode')
+        self.assertEqual(metrics.queries, 1)
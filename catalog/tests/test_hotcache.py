@@ -0,0 +1,81 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from catalog.hotcache import _lock_key, get_or_compute
+
+CLIENTS = 200
+
+
+class GetOrComputeTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def compute(self, value='new', duration=0):
+        with self.lock:
+            self.calls += 1
+        time.sleep(duration)
+        return value
+
+    def concurrently(self, func):
+        barrier = threading.Barrier(CLIENTS)
+        results = []
+
+        def client():
+            barrier.wait()
+            results.append(func())
+
+        threads = [threading.Thread(target=client) for _ in range(CLIENTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_fresh_value_is_not_recomputed(self):
+        self.assertEqual(get_or_compute('key', self.compute, 60), ('new', True))
+        self.assertEqual(get_or_compute('key', self.compute, 60), ('new', False))
+        self.assertEqual(self.calls, 1)
+
+    def test_cold_key_computed_once(self):
+        results = self.concurrently(lambda: get_or_compute('key', lambda: self.compute(duration=0.2), 60)[0])
+        self.assertEqual(results, ['new'] * CLIENTS)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_value_served_while_recomputed(self):
+        cache.set('key', ('old', 0.0, time.time() - 1), 60)
+        results = self.concurrently(lambda: get_or_compute('key', lambda: self.compute(duration=0.2), 60)[0])
+        self.assertEqual(self.calls, 1)
+        self.assertIn('old', results)
+        self.assertIn('new', results)
+        self.assertEqual(get_or_compute('key', self.compute, 60), ('new', False))
+
+    def test_early_recomputation_near_expiry(self):
+        # Expiring in a millisecond, but the value took a minute to compute
+        cache.set('key', ('old', 60.0, time.time() + 0.001), 60)
+        self.assertEqual(get_or_compute('key', self.compute, 60), ('new', True))
+        # Far from expiry it is kept
+        cache.set('key', ('old', 0.001, time.time() + 3600), 7200)
+        self.assertEqual(get_or_compute('key', self.compute, 60), ('old', False))
+
+    def test_none_is_not_cached(self):
+        self.assertEqual(get_or_compute('key', lambda: self.compute(None), 60), (None, True))
+        self.assertEqual(get_or_compute('key', lambda: self.compute(None), 60), (None, True))
+        self.assertEqual(self.calls, 2)
+        self.assertIsNone(cache.get(_lock_key('key')))
+
+    def test_abandoned_lock_times_out(self):
+        cache.add(_lock_key('key'), 'someone else', 60)
+        self.assertEqual(get_or_compute('key', self.compute, 60, lock_timeout=0.1), ('new', True))
+        self.assertEqual(cache.get(_lock_key('key')), 'someone else')
+
+    def test_lock_released_when_compute_fails(self):
+        def fail():
+            raise ValueError
+        with self.assertRaises(ValueError):
+            get_or_compute('key', fail, 60)
+        self.assertIsNone(cache.get(_lock_key('key')))
@@ -1,6 +1,17 @@
-from django.test import TestCase
+import datetime
+import threading
+import time
 
-from catalog.models import Author
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog.caching import book_copies_version_name, get_version
+from catalog.counters import drifted_books
+from catalog.models import Author, Book, BookInstance, LoanStateError
+from catalog.tests.utils import run_on_commit_callbacks
 
 class AuthorModelTest(TestCase):
     @classmethod
@@ -51,3 +62,173 @@ class AuthorModelTest(TestCase):
         author = Author.objects.get(id=1)
         # This will also failt if the urlconf is not defined.
         self.assertEquals(author.get_absolute_url(), '/catalog/author/1')
+
+
+class BookInstanceLoanTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.borrower = User.objects.create_user(username='reader', password='1X<IIbnibusdg')
+        self.book = Book.objects.create(title='Book Title', summary='My book summary.', isbn='ABCDEFG')
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def test_checkout_writes_only_loan_fields(self):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        # Another request changes the imprint after this one loaded the copy
+        BookInstance.objects.filter(pk=copy.pk).update(imprint='Other Imprint, 2020')
+        version = get_version(book_copies_version_name(self.book.pk))
+
+        with run_on_commit_callbacks(), CaptureQueriesContext(connection) as queries:
+            copy.checkout(self.borrower)
+        # The copy, then the book's counters
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(queries[0]['sql'].startswith('UPDATE "catalog_bookinstance"'))
+        self.assertNotIn('imprint', queries[0]['sql'])
+        self.assertTrue(queries[1]['sql'].startswith('UPDATE "catalog_book"'))
+
+        copy.refresh_from_db()
+        self.assertEqual(copy.imprint, 'Other Imprint, 2020')
+        self.assertEqual((copy.status, copy.borrower, copy.due_back), ('o', self.borrower, BookInstance.default_due_date()))
+        # post_save was sent, so the cached list of copies was invalidated
+        self.assertNotEqual(get_version(book_copies_version_name(self.book.pk)), version)
+
+    def test_stale_copy_does_not_move_the_counters(self):
+        stale = BookInstance.objects.get(pk=self.copy.pk)
+        # Another request reserves the copy after this one loaded it as available
+        other = BookInstance.objects.get(pk=self.copy.pk)
+        other.status = 'r'
+        other.save()
+
+        # Checking out a reserved copy is allowed, but the counters would move it from available
+        with self.assertRaises(LoanStateError):
+            stale.checkout(self.borrower)
+        self.assertFalse(drifted_books().exists())
+
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        copy.checkout(self.borrower)
+        self.assertFalse(drifted_books().exists())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies_available, self.book.copies_on_loan), (0, 1))
+
+    def test_state_machine(self):
+        due_back = datetime.date.today() + datetime.timedelta(weeks=1)
+        self.copy.checkout(self.borrower, due_back)
+        self.assertEqual((self.copy.status, self.copy.borrower, self.copy.due_back), ('o', self.borrower, due_back))
+        with self.assertRaises(LoanStateError):
+            self.copy.checkout(self.borrower)
+
+        self.copy.renew(due_back + datetime.timedelta(weeks=1))
+        self.assertEqual(self.copy.due_back, due_back + datetime.timedelta(weeks=1))
+
+        self.copy.mark_returned()
+        self.assertEqual((self.copy.status, self.copy.borrower, self.copy.due_back), ('a', None, None))
+        with self.assertRaises(LoanStateError):
+            self.copy.mark_returned()
+        with self.assertRaises(LoanStateError):
+            self.copy.renew(due_back)
+
+    def test_stale_copy_cannot_be_lent_twice(self):
+        first = BookInstance.objects.get(pk=self.copy.pk)
+        second = BookInstance.objects.get(pk=self.copy.pk)
+        first.checkout(self.borrower)
+        # second still believes the copy is available
+        with self.assertRaises(LoanStateError):
+            second.checkout(User.objects.create_user(username='other', password='18DFH5jhkeHO!'))
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.borrower, self.borrower)
+
+
+class BookCopyCountersTest(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Book Title', summary='My book summary.', isbn='ABCDEFG')
+        self.other_book = Book.objects.create(title='Other Title', summary='My book summary.', isbn='ABCDEFG')
+
+    def assertCounters(self, book, total, available, on_loan):
+        book.refresh_from_db()
+        self.assertEqual((book.copies_total, book.copies_available, book.copies_on_loan), (total, available, on_loan))
+
+    def test_counters_follow_copies(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='m')
+        self.assertCounters(self.book, 2, 1, 0)
+
+        copy.checkout(User.objects.create_user(username='reader', password='1X<IIbnibusdg'))
+        self.assertCounters(self.book, 2, 0, 1)
+        copy.renew(datetime.date.today())
+        self.assertCounters(self.book, 2, 0, 1)
+        copy.mark_returned()
+        self.assertCounters(self.book, 2, 1, 0)
+
+        # Saving a copy loaded separately
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.book = self.other_book
+        copy.status = 'o'
+        copy.save()
+        self.assertCounters(self.book, 1, 0, 0)
+        self.assertCounters(self.other_book, 1, 0, 1)
+
+        copy.delete()
+        self.assertCounters(self.other_book, 0, 0, 0)
+
+    def test_deferred_status_is_recounted(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        copy = BookInstance.objects.only('id', 'book').get(pk=copy.pk)
+        copy.status = 'o'
+        copy.save()
+        self.assertCounters(self.book, 1, 0, 1)
+
+    def test_saving_a_stale_book_keeps_counters(self):
+        book = Book.objects.get(pk=self.book.pk)
+        BookInstance.objects.create(book=self.book, imprint='Unlikely Imprint, 2016', status='a')
+        book.title = 'New Title'
+        book.save()
+        self.assertCounters(self.book, 1, 1, 0)
+        self.assertEqual(self.book.title, 'New Title')
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """Many requests racing to lend the same copy, each on its own database connection."""
+    num_requests = 200
+
+    def setUp(self):
+        self.borrowers = [User(username=f'reader{number}') for number in range(self.num_requests)]
+        User.objects.bulk_create(self.borrowers)
+        self.borrowers = list(User.objects.order_by('pk'))
+        book = Book.objects.create(title='Book Title', summary='My book summary.', isbn='ABCDEFG')
+        self.copy = BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def checkout(self, borrower, barrier, outcomes):
+        copy = BookInstance.objects.get(pk=self.copy.pk)
+        barrier.wait()
+        try:
+            while True:
+                try:
+                    copy.checkout(borrower)
+                except OperationalError as e:
+                    # SQLite's shared cache test database reports a busy table instead of waiting
+                    if 'locked' not in str(e):
+                        raise
+                    time.sleep(0.001)
+                else:
+                    outcomes.append(borrower.pk)
+                    break
+        except LoanStateError:
+            outcomes.append(None)
+        finally:
+            connection.close()
+
+    def test_exactly_one_checkout_succeeds(self):
+        barrier = threading.Barrier(self.num_requests)
+        outcomes = []
+        threads = [
+            threading.Thread(target=self.checkout, args=(borrower, barrier, outcomes)) for borrower in self.borrowers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [borrower_id for borrower_id in outcomes if borrower_id is not None]
+        self.assertEqual(len(outcomes), self.num_requests)
+        self.assertEqual(len(winners), 1)
+        self.copy.refresh_from_db()
+        self.assertEqual((self.copy.status, self.copy.borrower_id), ('o', winners[0]))
@@ -0,0 +1,162 @@
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from catalog.checks import check_shared_caches
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.tests.utils import run_on_commit_callbacks
+
+PAGE_CACHE_DIR = tempfile.mkdtemp(prefix='locallibrary-page-cache-')
+
+
+class PageCacheTestMixin:
+    """Tests run against the cache backend configured by the test case."""
+
+    def setUp(self):
+        for alias in ('default', 'pages'):
+            caches[alias].clear()
+        self.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        self.language = Language.objects.create(name='English')
+        self.genre = Genre.objects.create(name='Fantasy')
+        self.book = Book.objects.create(
+            title='A Wizard of Earthsea', summary='Summary.', isbn='9780553262506',
+            author=self.author, language=self.language,
+        )
+        self.other_book = Book.objects.create(
+            title='The Dispossessed', summary='Summary.', isbn='9780061054884',
+            author=self.author, language=self.language,
+        )
+        self.book_url = reverse('book-detail', args=[self.book.pk])
+        self.other_book_url = reverse('book-detail', args=[self.other_book.pk])
+
+    def assertCached(self, url):
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertRendered(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context)
+        return response
+
+    def test_pages_cached_for_anonymous_users(self):
+        for url in [reverse('books'), reverse('authors'), self.book_url, reverse('author-detail', args=[self.author.pk])]:
+            response = self.assertRendered(url)
+            self.assertEqual(self.assertCached(url).content, response.content)
+
+    def test_saving_a_book_renders_only_its_pages_again(self):
+        self.assertRendered(self.book_url)
+        self.assertRendered(self.other_book_url)
+        self.assertRendered(reverse('authors'))
+
+        self.book.title = 'The Tombs of Atuan'
+        with run_on_commit_callbacks():
+            self.book.save()
+        self.assertContains(self.assertRendered(self.book_url), 'The Tombs of Atuan')
+        self.assertCached(self.other_book_url)
+        self.assertCached(reverse('authors'))
+
+    def test_copies_and_genres_change_the_book_page(self):
+        self.assertRendered(self.book_url)
+        with run_on_commit_callbacks():
+            BookInstance.objects.create(book=self.book, imprint='Parnassus Press', status='a')
+        self.assertContains(self.assertRendered(self.book_url), 'Parnassus Press')
+
+        with run_on_commit_callbacks():
+            self.book.genre.add(self.genre)
+        self.assertContains(self.assertRendered(self.book_url), 'Fantasy')
+
+        with run_on_commit_callbacks():
+            self.genre.book_set.clear()
+        self.assertNotContains(self.assertRendered(self.book_url), 'Fantasy')
+
+    def test_author_change_shows_on_their_books(self):
+        author_url = reverse('author-detail', args=[self.author.pk])
+        self.assertRendered(self.book_url)
+        self.assertRendered(author_url)
+        self.author.last_name = 'K. Le Guin'
+        with run_on_commit_callbacks():
+            self.author.save()
+        self.assertContains(self.assertRendered(self.book_url), 'K. Le Guin')
+        self.assertContains(self.assertRendered(author_url), 'K. Le Guin')
+
+    def test_pages_invalidated_once_committed(self):
+        self.assertRendered(self.book_url)
+        with run_on_commit_callbacks():
+            with transaction.atomic():
+                self.book.title = 'The Tombs of Atuan'
+                self.book.save()
+                # Requests on other connections only see the old title until the commit,
+                # so the page cached from it stays under the versions it was cached with
+                self.assertNotContains(self.assertCached(self.book_url), 'The Tombs of Atuan')
+        self.assertContains(self.assertRendered(self.book_url), 'The Tombs of Atuan')
+
+    def test_query_string_is_part_of_the_key(self):
+        self.assertRendered(reverse('books'))
+        self.assertRendered(reverse('books') + '?page=1')
+
+    def test_index_varies_on_visit_count(self):
+        self.assertContains(self.assertRendered(reverse('index')), 'visted this page 0 times')
+        self.assertContains(self.client.get(reverse('index')), 'visted this page 1 time.')
+        self.client.cookies.clear()
+        response = self.client.get(reverse('index'))
+        self.assertIsNone(response.context)
+        self.assertContains(response, 'visted this page 0 times')
+
+    def test_signed_in_users_are_not_served_from_the_cache(self):
+        self.assertRendered(self.book_url)
+        User.objects.create_user(username='reader', password='1X<IIbnibusdg')
+        self.client.login(username='reader', password='1X<IIbnibusdg')
+        self.assertContains(self.assertRendered(self.book_url), 'reader')
+
+    def test_missing_pages_are_not_cached(self):
+        url = reverse('book-detail', args=[self.book.pk + 100])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(CATALOG_PAGE_CACHE_TIMEOUT=0)
+    def test_page_cache_disabled(self):
+        self.assertRendered(self.book_url)
+        self.assertRendered(self.book_url)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pages'},
+}, CATALOG_PAGE_CACHE='pages')
+class LocMemPageCacheTest(PageCacheTestMixin, TestCase):
+    pass
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'pages': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': PAGE_CACHE_DIR},
+}, CATALOG_PAGE_CACHE='pages')
+class FileBasedPageCacheTest(PageCacheTestMixin, TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(PAGE_CACHE_DIR, ignore_errors=True)
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+    @override_settings(DATABASE_PROFILE='production', CATALOG_PAGE_CACHE='pages', CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': PAGE_CACHE_DIR},
+        'pages': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_production_profile_warns_about_local_memory_caches(self):
+        self.assertEqual([warning.id for warning in check_shared_caches(None)], ['catalog.W001'])
+
+    @override_settings(DATABASE_PROFILE='default', CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_default_profile_may_use_local_memory(self):
+        self.assertEqual(check_shared_caches(None), [])
@@ -0,0 +1,94 @@
+import datetime
+
+from django.test import TestCase
+
+from catalog.models import Author, Book, BookInstance
+from catalog.pagination import CursorPaginator, InvalidCursor
+
+class CursorPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 23 authors, several sharing a last name so that the tie breakers are needed
+        for author_id in range(23):
+            Author.objects.create(first_name=f'First {author_id % 4}', last_name=f'Surname {author_id % 5}')
+
+        # Copies with and without a due date, to check NULLs are paged over
+        test_book = Book.objects.create(title='Book Title', summary='My book summary.', isbn='ABCDEFG')
+        for copy in range(13):
+            due_back = None if copy % 4 == 0 else datetime.date(2020, 6, 1 + copy % 3)
+            BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', due_back=due_back)
+
+    def walk_forward(self, paginator):
+        page = paginator.page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.page(page.next_page_number())
+            pages.append(page)
+        return pages
+
+    def test_forward_pages_match_ordered_queryset(self):
+        ordering = ('last_name', 'first_name', 'id')
+        paginator = CursorPaginator(Author.objects.all(), 5, ordering)
+        pages = self.walk_forward(paginator)
+
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+        self.assertEqual(
+            [author for page in pages for author in page],
+            list(Author.objects.order_by(*ordering)),
+        )
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[-1].has_previous())
+        self.assertEqual(paginator.num_pages, 5)
+
+    def test_backward_pages_match_forward_pages(self):
+        paginator = CursorPaginator(Author.objects.all(), 5, ('last_name', 'first_name', 'id'))
+        pages = self.walk_forward(paginator)
+
+        page = pages[-1]
+        while page.has_previous():
+            previous_page = paginator.page(page.previous_page_number())
+            self.assertEqual(previous_page.number, page.number - 1)
+            self.assertEqual(list(previous_page), list(pages[previous_page.number - 1]))
+            page = previous_page
+        self.assertEqual(page.number, 1)
+
+    def test_descending_ordering(self):
+        ordering = ('-last_name', 'first_name', '-id')
+        paginator = CursorPaginator(Author.objects.all(), 4, ordering)
+        pages = self.walk_forward(paginator)
+        self.assertEqual(
+            [author for page in pages for author in page],
+            list(Author.objects.order_by(*ordering)),
+        )
+
+    def test_nullable_key(self):
+        for ordering in (('due_back', 'id'), ('-due_back', 'id')):
+            paginator = CursorPaginator(BookInstance.objects.all(), 3, ordering)
+            pages = self.walk_forward(paginator)
+            self.assertEqual(
+                [copy.pk for page in pages for copy in page],
+                list(BookInstance.objects.order_by(*ordering).values_list('pk', flat=True)),
+            )
+
+    def test_values_rows(self):
+        ordering = ('last_name', 'first_name', 'id')
+        paginator = CursorPaginator(Author.objects.values('id', 'last_name', 'first_name'), 10, ordering)
+        pages = self.walk_forward(paginator)
+        self.assertEqual(
+            [row['id'] for page in pages for row in page],
+            list(Author.objects.order_by(*ordering).values_list('id', flat=True)),
+        )
+
+    def test_each_page_uses_one_query(self):
+        paginator = CursorPaginator(Author.objects.all(), 5, ('last_name', 'first_name', 'id'))
+        token = paginator.page().next_page_number()
+        with self.assertNumQueries(1):
+            paginator.page(token)
+
+    def test_tampered_cursor_rejected(self):
+        paginator = CursorPaginator(Author.objects.all(), 5, ('last_name', 'first_name', 'id'))
+        token = paginator.page().next_page_number()
+        with self.assertRaises(InvalidCursor):
+            paginator.page(token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+        with self.assertRaises(InvalidCursor):
+            CursorPaginator(Author.objects.all(), 5, ('last_name', 'id')).page(token)
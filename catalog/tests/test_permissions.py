@@ -0,0 +1,111 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from catalog.caching import get_version
+from catalog.checks import check_permissions_cache
+from catalog.permissions import user_permissions_version_name
+from catalog.tests.utils import run_on_commit_callbacks
+
+EDIT_BOOKS = 'catalog.can_edit_books'
+
+CACHED_BACKENDS = ['catalog.permissions.CachedPermissionBackend']
+
+
+@override_settings(AUTHENTICATION_BACKENDS=CACHED_BACKENDS)
+class CachedPermissionBackendTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='librarian', password='1X<IIbnibusdg')
+        self.group = Group.objects.create(name='Librarians')
+        self.edit_books = Permission.objects.get(codename='can_edit_books')
+        self.mark_returned = Permission.objects.get(codename='can_mark_returned')
+
+    def has_perm(self, perm=EDIT_BOOKS):
+        # A new user object, as each request loads one
+        return User.objects.get(pk=self.user.pk).has_perm(perm)
+
+    def test_permissions_are_loaded_in_one_query_then_cached(self):
+        self.user.user_permissions.add(self.edit_books)
+        self.group.permissions.add(self.mark_returned)
+        self.user.groups.add(self.group)
+
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.get_all_permissions(), {EDIT_BOOKS, 'catalog.can_mark_returned'})
+            self.assertTrue(user.has_perms([EDIT_BOOKS, 'catalog.can_mark_returned']))
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm(EDIT_BOOKS))
+
+    def test_versions_change_once_committed(self):
+        name = user_permissions_version_name(self.user.pk)
+        version = get_version(name)
+        with run_on_commit_callbacks():
+            self.user.user_permissions.add(self.edit_books)
+            # A request reading before the commit would cache the old permissions under a new version
+            self.assertEqual(get_version(name), version)
+        self.assertNotEqual(get_version(name), version)
+
+    def test_user_permission_changes(self):
+        self.assertFalse(self.has_perm())
+        with run_on_commit_callbacks():
+            self.user.user_permissions.add(self.edit_books)
+        self.assertTrue(self.has_perm())
+        with run_on_commit_callbacks():
+            self.edit_books.user_set.remove(self.user)
+        self.assertFalse(self.has_perm())
+        with run_on_commit_callbacks():
+            self.edit_books.user_set.add(self.user)
+        self.assertTrue(self.has_perm())
+        with run_on_commit_callbacks():
+            self.edit_books.user_set.clear()
+        self.assertFalse(self.has_perm())
+
+    def test_group_changes(self):
+        with run_on_commit_callbacks():
+            self.group.permissions.add(self.edit_books)
+        self.assertFalse(self.has_perm())
+        with run_on_commit_callbacks():
+            self.user.groups.add(self.group)
+        self.assertTrue(self.has_perm())
+        with run_on_commit_callbacks():
+            self.group.permissions.remove(self.edit_books)
+        self.assertFalse(self.has_perm())
+        with run_on_commit_callbacks():
+            self.group.permissions.add(self.edit_books)
+        self.assertTrue(self.has_perm())
+        with run_on_commit_callbacks():
+            self.group.user_set.clear()
+        self.assertFalse(self.has_perm())
+        with run_on_commit_callbacks():
+            self.group.user_set.add(self.user)
+        self.assertTrue(self.has_perm())
+        with run_on_commit_callbacks():
+            self.group.delete()
+        self.assertFalse(self.has_perm())
+
+    def test_user_changes(self):
+        self.assertFalse(self.has_perm())
+        self.user.is_superuser = True
+        with run_on_commit_callbacks():
+            self.user.save()
+        self.assertTrue(self.has_perm())
+        self.user.is_active = False
+        with run_on_commit_callbacks():
+            self.user.save()
+        self.assertFalse(self.has_perm())
+
+
+class PermissionsCacheCheckTest(SimpleTestCase):
+    @override_settings(AUTHENTICATION_BACKENDS=CACHED_BACKENDS, CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_warns_about_local_memory_cache(self):
+        self.assertEqual([warning.id for warning in check_permissions_cache(None)], ['catalog.W002'])
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend'], CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    })
+    def test_model_backend_needs_no_shared_cache(self):
+        self.assertEqual(check_permissions_cache(None), [])
@@ -0,0 +1,78 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Author, Book
+from catalog.querybudget import QueryMetrics, fingerprint, view_stats
+from catalog.tests.utils import QueryBudgetClient
+from catalog.views import BookListView
+
+
+class QueryMetricsTest(TestCase):
+    def test_fingerprint_leaves_out_in_lists(self):
+        self.assertEqual(
+            fingerprint('SELECT id FROM t\n  WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT id FROM t WHERE id IN (%s)'),
+        )
+
+    def test_repeated_queries_are_duplicates(self):
+        authors = [Author.objects.create(first_name='John', last_name=f'Smith {i}') for i in range(3)]
+        metrics = QueryMetrics()
+        with connection.execute_wrapper(metrics):
+            for author in authors:
+                Author.objects.get(pk=author.pk)
+            list(Book.objects.all())
+        self.assertEqual(metrics.queries, 4)
+        self.assertEqual(metrics.duplicates, 2)
+        [(count, sql)] = metrics.repeated()
+        self.assertEqual(count, 3)
+        self.assertIn('"catalog_author"."id" = %s', sql)
+
+
+class QueryBudgetMiddlewareTest(TestCase):
+    client_class = QueryBudgetClient
+
+    def setUp(self):
+        cache.clear()
+        view_stats.clear()
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        for i in range(3):
+            Book.objects.create(title=f'Book {i}', summary='Summary.', isbn=f'{i:013}', author=author)
+
+    @override_settings(DEBUG=True)
+    def test_headers_in_debug(self):
+        response = self.client.get(reverse('books'))
+        self.assertEqual(response['X-Query-Count'], str(response.query_metrics.queries))
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+        self.assertEqual(response['X-Query-Budget'], str(BookListView.query_budget))
+        self.assertGreater(float(response['X-Template-Time-Ms']), 0)
+        self.assertIn('X-Query-Time-Ms', response)
+
+    def test_no_headers_without_debug(self):
+        response = self.client.get(reverse('books'))
+        self.assertNotIn('X-Query-Count', response)
+        self.assertGreater(response.query_metrics.queries, 0)
+
+    def test_going_over_budget_fails(self):
+        with mock.patch.object(BookListView, 'query_budget', 1):
+            with self.assertLogs('catalog.querybudget', 'WARNING'):
+                with self.assertRaisesMessage(AssertionError, 'books went over its query budget'):
+                    self.client.get(reverse('books'))
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+        response = self.client.get(reverse('query-metrics'))
+        self.assertEqual(response.status_code, 302)
+
+        staff = User.objects.create_user(username='staff', password='1X<IIbnibusdg', is_staff=True)
+        self.client.force_login(staff)
+        stats = self.client.get(reverse('query-metrics')).json()['views']['books']
+        self.assertEqual(stats['requests'], 2)
+        self.assertEqual(stats['budget'], BookListView.query_budget)
+        self.assertEqual(stats['over_budget'], 0)
+        self.assertGreater(stats['queries'], 0)
@@ -0,0 +1,97 @@
+from django.contrib.auth.models import Permission, User
+from django.db import connections, router
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from catalog.middleware import PIN_COOKIE_NAME
+from catalog.models import Author, Book, BookInstance, Genre, Language
+from catalog.replication import replicate
+from catalog.routers import WriteTracker, note_write, use_primary
+from catalog.tests.utils import ReplicaDatabaseMixin
+
+
+@override_settings(CATALOG_READ_REPLICAS=['replica'])
+class PrimaryReplicaRouterTest(SimpleTestCase):
+    def test_catalog_reads_go_to_replicas(self):
+        self.assertEqual(router.db_for_read(Book), 'replica')
+        self.assertEqual(router.db_for_read(BookInstance), 'replica')
+        # Other apps are read from the primary
+        self.assertEqual(router.db_for_read(User), 'default')
+
+    def test_writes_go_to_the_primary(self):
+        with WriteTracker() as tracker:
+            self.assertEqual(router.db_for_write(User), 'default')
+            self.assertEqual(router.db_for_write(Book), 'default')
+            # Routing is not writing, writes are noted by the code making them
+            self.assertFalse(tracker.wrote)
+            note_write()
+            self.assertTrue(tracker.wrote)
+        book = Book(title='A Wizard of Earthsea')
+        book._state.db = 'replica'
+        self.assertEqual(router.db_for_write(Book, instance=book), 'default')
+
+    def test_pinned_reads_go_to_the_primary(self):
+        with use_primary():
+            self.assertEqual(router.db_for_read(Book), 'default')
+        self.assertEqual(router.db_for_read(Book), 'replica')
+
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        connection = connections['default']
+        connection.in_atomic_block = True
+        try:
+            self.assertEqual(router.db_for_read(Book), 'default')
+        finally:
+            connection.in_atomic_block = False
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(router.allow_migrate('default', 'catalog'))
+        self.assertFalse(router.allow_migrate('replica', 'catalog'))
+
+    @override_settings(CATALOG_READ_REPLICAS=[])
+    def test_without_replicas_everything_goes_to_the_primary(self):
+        self.assertEqual(router.db_for_read(Book), 'default')
+
+
+@override_settings(CATALOG_READ_REPLICAS=['replica'], CATALOG_PAGE_CACHE_TIMEOUT=0)
+class ReadReplicaTest(ReplicaDatabaseMixin, TransactionTestCase):
+    """Two SQLite databases, the replica updated only when replicate() is called."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        self.genre = Genre.objects.create(name='Fantasy')
+        self.language = Language.objects.create(name='English')
+        self.book = Book.objects.create(title='A Wizard of Earthsea', summary='Summary.', isbn='9780553262506', author=self.author)
+        replicate()
+        self.librarian = User.objects.create_user(username='librarian', password='18DFH5jhkeHO!')
+        self.librarian.user_permissions.add(Permission.objects.get(codename='can_edit_books'))
+
+    def test_reads_lag_until_replicated(self):
+        Book.objects.create(title='The Dispossessed', summary='Summary.', isbn='9780061054884', author=self.author)
+        self.assertNotContains(self.client.get(reverse('books')), 'The Dispossessed')
+        replicate()
+        self.assertContains(self.client.get(reverse('books')), 'The Dispossessed')
+
+    def test_users_read_their_own_writes(self):
+        self.client.force_login(self.librarian)
+        response = self.client.post(reverse('book_update', args=[self.book.pk]), {
+            'title': 'The Tombs of Atuan', 'author': self.author.pk, 'summary': 'Summary.', 'isbn': '9780553262506',
+            'genre': [self.genre.pk], 'language': self.language.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+
+        # The librarian reads from the primary for a while, others from the replica
+        self.assertContains(self.client.get(reverse('book-detail', args=[self.book.pk])), 'The Tombs of Atuan')
+        self.client.cookies.pop(PIN_COOKIE_NAME)
+        self.assertContains(self.client.get(reverse('book-detail', args=[self.book.pk])), 'A Wizard of Earthsea')
+
+        replicate()
+        self.assertContains(self.client.get(reverse('book-detail', args=[self.book.pk])), 'The Tombs of Atuan')
+
+    def test_reading_sets_no_pin(self):
+        response = self.client.get(reverse('books'))
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+        # The book's copies are read from the primary, which is not a write
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
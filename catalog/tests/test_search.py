@@ -0,0 +1,157 @@
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from catalog.models import Author, Book, Genre, Language
+from catalog.search import InMemorySearchBackend, SQLiteFTSSearchBackend, get_search_backend, has_fts_table
+
+class SearchBackendTestMixin:
+    """Tests run against each search backend."""
+
+    def setUp(self):
+        self.tolkien = Author.objects.create(first_name='John', last_name='Tolkien')
+        self.herbert = Author.objects.create(first_name='Frank', last_name='Herbert')
+        self.fantasy = Genre.objects.create(name='Fantasy')
+        self.science_fiction = Genre.objects.create(name='Science Fiction')
+        language = Language.objects.create(name='English')
+
+        self.hobbit = Book.objects.create(
+            title='The Hobbit', summary='A hobbit goes on an adventure with dwarves.',
+            isbn='9780261103283', author=self.tolkien, language=language,
+        )
+        self.hobbit.genre.set([self.fantasy])
+        self.dune = Book.objects.create(
+            title='Dune', summary='Politics and giant worms on a desert planet, no hobbits.',
+            isbn='9780441172719', author=self.herbert, language=language,
+        )
+        self.dune.genre.set([self.science_fiction])
+
+    def search(self, query):
+        return self.backend.search(query)
+
+    def test_matches_each_indexed_field(self):
+        self.assertEqual(self.search('hobbit'), [self.hobbit.pk])
+        self.assertEqual(self.search('worms'), [self.dune.pk])
+        self.assertEqual(self.search('tolkien'), [self.hobbit.pk])
+        self.assertEqual(self.search('science'), [self.dune.pk])
+        self.assertEqual(self.search('9780441172719'), [self.dune.pk])
+
+    def test_title_match_ranks_first(self):
+        # "hobbits" in Dune's summary isn't the same token, but the prefix matches both books
+        self.assertEqual(self.search('hobbit*'), [self.hobbit.pk, self.dune.pk])
+
+    def test_results_are_paged_in_rank_order(self):
+        self.assertEqual(self.backend.search('hobbit*', limit=1), [self.hobbit.pk])
+        self.assertEqual(self.backend.search('hobbit*', offset=1, limit=1), [self.dune.pk])
+        self.assertEqual(self.backend.search('hobbit*', offset=2), [])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search('desert planet'), [self.dune.pk])
+        self.assertEqual(self.search('desert hobbit'), [])
+
+    def test_prefix_query(self):
+        self.assertEqual(self.search('tolk'), [])
+        self.assertEqual(self.search('tolk*'), [self.hobbit.pk])
+        self.assertEqual(self.search('978026*'), [self.hobbit.pk])
+
+    def test_diacritics_and_case_ignored(self):
+        self.assertEqual(self.search('DÜNE'), [self.dune.pk])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"dune" OR NEAR(hobbit'), [])
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(self.search('*'), [])
+
+    def test_index_follows_changes(self):
+        self.hobbit.title = 'There and Back Again'
+        self.hobbit.save()
+        self.assertEqual(self.search('back again'), [self.hobbit.pk])
+
+        self.tolkien.last_name = 'Tolkein'
+        self.tolkien.save()
+        self.assertEqual(self.search('tolkien'), [])
+        self.assertEqual(self.search('tolkein'), [self.hobbit.pk])
+
+        self.hobbit.genre.add(self.science_fiction)
+        self.assertEqual(set(self.search('science fiction')), {self.dune.pk, self.hobbit.pk})
+
+        self.science_fiction.book_set.clear()
+        self.assertEqual(self.search('science'), [])
+
+        self.fantasy.delete()
+        self.assertEqual(self.search('fantasy'), [])
+
+        self.herbert.delete()
+        self.assertEqual(self.search('herbert'), [])
+        self.assertEqual(self.search('dune'), [self.dune.pk])
+
+        self.dune.delete()
+        self.assertEqual(self.search('dune'), [])
+
+    def test_rebuild(self):
+        self.backend.rebuild()
+        self.assertEqual(self.search('tolk*'), [self.hobbit.pk])
+        self.assertEqual(self.search('worms'), [self.dune.pk])
+
+@override_settings(CATALOG_SEARCH_BACKEND='catalog.search.SQLiteFTSSearchBackend')
+class SQLiteFTSSearchBackendTest(SearchBackendTestMixin, TestCase):
+    def setUp(self):
+        if not has_fts_table():
+            self.skipTest('SQLite FTS5 is not available')
+        super().setUp()
+        self.backend = get_search_backend()
+        self.assertIsInstance(self.backend, SQLiteFTSSearchBackend)
+
+@override_settings(CATALOG_SEARCH_BACKEND='catalog.search.InMemorySearchBackend')
+class InMemorySearchBackendTest(SearchBackendTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = get_search_backend()
+        self.assertIsInstance(self.backend, InMemorySearchBackend)
+        # Load the index now, so that the tests also check it is kept up to date
+        self.backend.rebuild()
+
+class SearchFlushTest(TransactionTestCase):
+    def test_flushed_books_are_not_found(self):
+        backends = ['catalog.search.InMemorySearchBackend']
+        if has_fts_table():
+            backends.append('catalog.search.SQLiteFTSSearchBackend')
+        for backend in backends:
+            with self.subTest(backend=backend), override_settings(CATALOG_SEARCH_BACKEND=backend):
+                Book.objects.create(title='Dune', summary='Worms.', isbn='9780441172719')
+                self.assertEqual(len(get_search_backend().search('dune')), 1)
+                call_command('flush', interactive=False, verbosity=0)
+                self.assertEqual(get_search_backend().search('dune'), [])
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        for book_id in range(25):
+            Book.objects.create(title=f'Galaxy {book_id}', summary='A space opera.', isbn=f'{book_id:013}', author=author)
+
+    def test_view_url_exists_at_desired_location(self):
+        response = self.client.get('/catalog/search/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/book_search.html')
+
+    def test_results_are_paginated(self):
+        response = self.client.get(reverse('search'), {'q': 'galaxy'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 20)
+        self.assertEqual(response.context['next_page_number'], 2)
+        self.assertContains(response, '?q=galaxy&page=2')
+
+        response = self.client.get(reverse('search'), {'q': 'galaxy', 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 5)
+        self.assertIsNone(response.context['next_page_number'])
+        self.assertEqual(response.context['previous_page_number'], 1)
+
+    def test_no_results(self):
+        response = self.client.get(reverse('search'), {'q': 'nebula'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'No books match')
+
+    def test_invalid_page(self):
+        response = self.client.get(reverse('search'), {'q': 'galaxy', 'page': 'x'})
+        self.assertEqual(response.status_code, 404)
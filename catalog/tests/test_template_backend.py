@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.template.loaders.filesystem import Loader as FilesystemLoader
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from catalog.template_backend import DjangoTemplates, TemplateStats, template_stats
+
+
+def production_backend():
+    """A backend configured like TEMPLATE_MODE 'production'."""
+    params = {key: value for key, value in settings.TEMPLATES[0].items() if key != 'BACKEND'}
+    return DjangoTemplates({
+        **params,
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **params['OPTIONS'],
+            'loaders': [('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ])],
+            'preload': True,
+        },
+    })
+
+
+class PreloadTemplatesTest(SimpleTestCase):
+    def test_preloads_catalog_and_registration_templates(self):
+        backend = production_backend()
+        names = backend.preload_templates()
+        self.assertIn('base_generic.html', names)
+        self.assertIn('catalog/book_detail.html', names)
+        self.assertIn('registration/login.html', names)
+
+        # Compiled once, so getting them again reads no file
+        with mock.patch.object(FilesystemLoader, 'get_contents', side_effect=AssertionError('read a file')):
+            backend.get_template('catalog/book_detail.html')
+            backend.get_template('registration/login.html')
+
+
+class TemplateStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        template_stats.clear()
+
+    def test_adds_up_renders(self):
+        stats = TemplateStats()
+        stats.add('index.html', 0.002)
+        stats.add('index.html', 0.004)
+        self.assertEqual(stats.snapshot(), {'index.html': {'renders': 2, 'render_ms': 6.0, 'mean_ms': 3.0, 'max_ms': 4.0}})
+
+    def test_metrics_endpoint_shows_renders_per_template(self):
+        staff = User.objects.create_user(username='staff', password='1X<IIbnibusdg', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(reverse('books'))
+        self.client.get(reverse('books'))
+        stats = self.client.get(reverse('query-metrics')).json()['templates']
+        self.assertEqual(stats['catalog/book_list.html']['renders'], 2)
+        # Templates extended or included are timed as part of the one rendered
+        self.assertNotIn('base_generic.html', stats)
@@ -1,14 +1,95 @@
 import datetime
+import gzip
+import json
 import uuid
+from unittest import skipUnless
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.models import User, Permission # Required to assign User as a borrower, and grant permission to set book as returned
 
 from catalog.models import Author, BookInstance, Book, Genre, Language
+from catalog.stats import get_catalog_stats
+from catalog.tests.utils import ViewTestCase, run_on_commit_callbacks
+from catalog.views import AllLoanedBooksListView, LoanedBooksByUserListView
 
-class AuthorListViewTest(TestCase):
+class IndexViewTest(ViewTestCase):
+    def setUp(self):
+        # The statistics are cached, so start every test from a cold cache
+        cache.clear()
+
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        test_language = Language.objects.create(name='English')
+        Genre.objects.create(name='Science Fiction')
+        Genre.objects.create(name='Fantasy')
+        self.test_book = Book.objects.create(
+            title='A Novel Idea',
+            summary='My book summary.',
+            isbn='ABCDEFG',
+            author=test_author,
+            language=test_language,
+        )
+        Book.objects.create(title='Poems', summary='Verse.', isbn='HIJKLMN', author=test_author, language=test_language)
+        for status in ('a', 'a', 'o', 'm'):
+            BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status=status)
+
+    def test_view_shows_counts(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_books'], 2)
+        self.assertEqual(response.context['num_instances'], 4)
+        self.assertEqual(response.context['num_instances_available'], 2)
+        self.assertEqual(response.context['num_authors'], 1)
+        self.assertEqual(response.context['num_books_with_novel'], 1)
+        self.assertEqual(response.context['num_genres_with_fiction'], 1)
+
+    def test_counts_use_one_query(self):
+        with self.assertNumQueries(1):
+            get_catalog_stats()
+
+    def test_counts_served_from_cache_when_warm(self):
+        get_catalog_stats()
+        with self.assertNumQueries(0):
+            get_catalog_stats()
+
+    def test_counts_invalidated_on_save_and_delete(self):
+        self.assertEqual(get_catalog_stats()['num_instances_available'], 2)
+
+        with run_on_commit_callbacks():
+            copy = BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status='a')
+        self.assertEqual(get_catalog_stats()['num_instances_available'], 3)
+
+        with run_on_commit_callbacks():
+            copy.delete()
+        self.assertEqual(get_catalog_stats()['num_instances_available'], 2)
+
+        with run_on_commit_callbacks():
+            Author.objects.create(first_name='Jane', last_name='Doe')
+        self.assertEqual(get_catalog_stats()['num_authors'], 2)
+
+    def test_counts_invalidated_once_committed(self):
+        self.client.get(reverse('index'))
+        with run_on_commit_callbacks():
+            with transaction.atomic():
+                BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status='a')
+                # Until the commit, requests on other connections can only read the old rows,
+                # so the cached counts are kept rather than recomputed from them
+                self.assertEqual(get_catalog_stats()['num_instances_available'], 2)
+        self.assertEqual(get_catalog_stats()['num_instances_available'], 3)
+        self.assertEqual(self.client.get(reverse('index')).context['num_instances_available'], 3)
+
+    def test_counts_include_copies_without_book(self):
+        BookInstance.objects.create(imprint='Unlikely Imprint, 2016', status='a')
+        BookInstance.objects.create(imprint='Unlikely Imprint, 2016', status='m')
+        stats = get_catalog_stats()
+        self.assertEqual(stats['num_instances'], BookInstance.objects.count())
+        self.assertEqual(stats['num_instances_available'], BookInstance.objects.filter(status='a').count())
+
+class AuthorListViewTest(ViewTestCase):
     @classmethod
     def setUpTestData(cls):
         # Create 13 authors for pagination test
@@ -20,6 +101,10 @@ class AuthorListViewTest(TestCase):
                 last_name=f'Surname {author_id}',
             )
 
+    def setUp(self):
+        # Pages are cached for anonymous users, so start every test from a cold cache
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         response = self.client.get('/catalog/authors/')
         self.assertEqual(response.status_code, 200)
@@ -47,7 +132,142 @@ class AuthorListViewTest(TestCase):
         self.assertTrue(response.context['is_paginated'] == True)
         self.assertTrue(len(response.context['author_list']) == 3)
 
-class LoanedBookInstancesByUserListViewTest(TestCase):
+    @override_settings(CATALOG_CURSOR_PAGINATION=True)
+    def test_cursor_pagination_lists_all_authors(self):
+        response = self.client.get(reverse('authors'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_paginated'])
+        self.assertEqual(len(response.context['author_list']), 10)
+        self.assertContains(response, 'Page 1 of 2+.')
+
+        next_page = response.context['page_obj'].next_page_number()
+        response = self.client.get(reverse('authors'), {'page': next_page})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['author_list']), 3)
+        self.assertContains(response, 'Page 2 of 2.')
+
+        response = self.client.get(reverse('authors'), {'page': response.context['page_obj'].previous_page_number()})
+        self.assertEqual(len(response.context['author_list']), 10)
+
+    @override_settings(CATALOG_CURSOR_PAGINATION=True)
+    def test_cursor_pagination_invalid_cursor(self):
+        response = self.client.get(reverse('authors'), {'page': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+class AuthorDetailViewTest(ViewTestCase):
+    def setUp(self):
+        cache.clear()
+        self.test_author = Author.objects.create(first_name='John', last_name='Smith')
+        self.test_language = Language.objects.create(name='English')
+        self.test_genres = [Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Horror')]
+
+    def create_books(self, number_of_books):
+        for book_id in range(number_of_books):
+            book = Book.objects.create(
+                title=f'Book Title {book_id}',
+                summary='My book summary.',
+                isbn='ABCDEFG',
+                author=self.test_author,
+                language=self.test_language,
+            )
+            book.genre.set(self.test_genres)
+            for copy in range(book_id % 3):
+                BookInstance.objects.create(book=book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def count_page_queries(self):
+        url = reverse('author-detail', kwargs={'pk': self.test_author.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_view_shows_books_with_copy_counts(self):
+        self.create_books(3)
+        response = self.client.get(reverse('author-detail', kwargs={'pk': self.test_author.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/author_detail.html')
+        self.assertContains(response, 'Book Title 2</a></strong> (2 copies, 2 available)', html=False)
+        self.assertContains(response, 'Fantasy, Horror')
+        self.assertContains(response, 'English')
+
+    def test_query_count_does_not_grow_with_books(self):
+        self.create_books(1)
+        queries_for_one_book = self.count_page_queries()
+
+        with run_on_commit_callbacks():
+            self.create_books(10)
+        self.assertEqual(self.count_page_queries(), queries_for_one_book)
+
+class BookDetailViewTest(ViewTestCase):
+    def setUp(self):
+        cache.clear()
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        test_language = Language.objects.create(name='English')
+        self.test_book = Book.objects.create(
+            title='Book Title',
+            summary='My book summary.',
+            isbn='ABCDEFG',
+            author=test_author,
+            language=test_language,
+        )
+        self.test_book.genre.set([Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Horror')])
+        self.test_copy = BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status='a')
+
+    def get_detail_page(self, book=None):
+        return self.client.get(reverse('book-detail', kwargs={'pk': (book or self.test_book).pk}))
+
+    def test_view_shows_book_and_copies(self):
+        response = self.get_detail_page()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Smith, John')
+        self.assertContains(response, 'English')
+        self.assertContains(response, 'Fantasy, Horror')
+        self.assertContains(response, str(self.test_copy.id))
+
+    def test_query_count_does_not_grow_with_copies(self):
+        # The book with its author and language, its genres, and its copies
+        with self.assertNumQueries(3):
+            self.get_detail_page()
+
+        with run_on_commit_callbacks():
+            for copy in range(10):
+                BookInstance.objects.create(book=self.test_book, imprint='Unlikely Imprint, 2016', status='m')
+        with self.assertNumQueries(3):
+            self.get_detail_page()
+
+    @override_settings(CATALOG_PAGE_CACHE_TIMEOUT=0)
+    def test_cached_copies_are_not_queried(self):
+        self.get_detail_page()
+        # Only the page is rendered again: the book and its genres
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.get_detail_page(), str(self.test_copy.id))
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(any('catalog_bookinstance' in query['sql'] for query in queries))
+
+    def test_copies_rerendered_when_a_copy_is_saved(self):
+        self.assertContains(self.get_detail_page(), 'Available')
+
+        self.test_copy.status = 'o'
+        self.test_copy.due_back = datetime.date.today()
+        with run_on_commit_callbacks():
+            self.test_copy.save()
+        response = self.get_detail_page()
+        self.assertNotContains(response, 'Available')
+        self.assertContains(response, 'On loan')
+
+    def test_copy_moved_to_another_book_updates_both_pages(self):
+        other_book = Book.objects.create(title='Other Title', summary='Other summary.', isbn='HIJKLMN', author=self.test_book.author)
+        self.assertContains(self.get_detail_page(), str(self.test_copy.id))
+        self.assertNotContains(self.get_detail_page(other_book), str(self.test_copy.id))
+
+        copy = BookInstance.objects.get(pk=self.test_copy.pk)
+        copy.book = other_book
+        with run_on_commit_callbacks():
+            copy.save()
+        self.assertNotContains(self.get_detail_page(), str(self.test_copy.id))
+        self.assertContains(self.get_detail_page(other_book), str(self.test_copy.id))
+
+class LoanedBookInstancesByUserListViewTest(ViewTestCase):
     def setUp(self):
         # Create two users
         # setUp used instead of setUpTestData because the objects will be modified later
@@ -138,6 +358,21 @@ class LoanedBookInstancesByUserListViewTest(TestCase):
             self.assertEqual(response.context['user'], bookitem.borrower)
             self.assertEqual('o', bookitem.status)
 
+    @override_settings(CATALOG_CURSOR_PAGINATION=True)
+    def test_cursor_pages_ordered_by_due_date(self):
+        for book in BookInstance.objects.all():
+            book.status = 'o'
+            book.save()
+
+        login = self.client.login(username='testuser1', password='1X<IIbnibusdg')
+        response = self.client.get(reverse('my-borrowed'))
+        self.assertEqual(len(response.context['bookinstance_list']), 10)
+        response = self.client.get(reverse('my-borrowed'), {'page': response.context['page_obj'].next_page_number()})
+        self.assertEqual(len(response.context['bookinstance_list']), 5)
+
+        due_dates = [book.due_back for book in response.context['bookinstance_list']]
+        self.assertEqual(due_dates, sorted(due_dates))
+
     def test_pages_ordered_by_due_date(self):
         # Change all books to be on loan
         for book in BookInstance.objects.all():
@@ -164,7 +399,89 @@ class LoanedBookInstancesByUserListViewTest(TestCase):
                 last_date = book.due_back
 
 
-class RenewBookInstancesViewTest(TestCase):
+class AllLoanedBooksListViewTest(ViewTestCase):
+    def setUp(self):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<IIbnibusdg')
+        test_user2 = User.objects.create_user(username='testuser2', password='18DFH5jhkeHO!')
+        test_user2.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        # 15 loans, due from 7 days ago to 7 days ahead
+        today = datetime.date.today()
+        for number in range(15):
+            test_book = Book.objects.create(title=f'Book Title {number}', summary='My book summary.', isbn='ABCDEFG')
+            BookInstance.objects.create(
+                book=test_book,
+                imprint='Unlikely Imprint, 2016',
+                due_back=today + datetime.timedelta(days=number - 7),
+                borrower=test_user1,
+                status='o',
+            )
+        self.client.login(username='testuser2', password='18DFH5jhkeHO!')
+
+    def test_overdue_computed_in_query(self):
+        response = self.client.get(reverse('all-borrowed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([book.overdue for book in response.context['bookinstance_list']], [True] * 7 + [False] * 3)
+        self.assertContains(response, 'class="text_danger"', count=7)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        # Session, user, user and group permissions, the count for the paginator and the page itself
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('all-borrowed'))
+        self.assertEqual(len(response.context['bookinstance_list']), 10)
+
+    def test_overdue_only(self):
+        response = self.client.get(reverse('all-borrowed'), {'overdue': '1'})
+        self.assertTrue(response.context['overdue_only'])
+        self.assertEqual(len(response.context['bookinstance_list']), 7)
+        self.assertTrue(all(book.overdue for book in response.context['bookinstance_list']))
+
+    @override_settings(CATALOG_CURSOR_PAGINATION=True)
+    def test_overdue_filter_kept_when_paging(self):
+        BookInstance.objects.update(due_back=datetime.date.today() - datetime.timedelta(days=1))
+        response = self.client.get(reverse('all-borrowed'), {'overdue': '1'})
+        next_page = response.context['page_obj'].next_page_number()
+        self.assertContains(response, f'?overdue=1&page={next_page}')
+
+        response = self.client.get(reverse('all-borrowed'), {'overdue': '1', 'page': next_page})
+        self.assertEqual(len(response.context['bookinstance_list']), 5)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Checks SQLite query plans')
+class LoanedBooksQueryPlanTest(ViewTestCase):
+    """The loan lists should be read from an index in due date order, not scanned and sorted."""
+
+    def setUp(self):
+        self.test_user = User.objects.create_user(username='testuser1', password='1X<IIbnibusdg')
+
+    def get_query_plan(self, view_class, **params):
+        view = view_class()
+        view.setup(RequestFactory().get('/', params))
+        view.request.user = self.test_user
+        queryset = view.get_queryset()
+        return queryset[:view.paginate_by + 1].explain()
+
+    def assertUsesIndexInOrder(self, plan, index_name):
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotRegex(plan, r'SCAN (TABLE )?catalog_bookinstance(?! USING)')
+
+    def test_loaned_books_by_user_uses_index(self):
+        plan = self.get_query_plan(LoanedBooksByUserListView)
+        self.assertUsesIndexInOrder(plan, 'bookinst_borrower_loans_idx')
+
+    def test_all_loaned_books_uses_index(self):
+        plan = self.get_query_plan(AllLoanedBooksListView)
+        self.assertUsesIndexInOrder(plan, 'bookinst_status_due_idx')
+
+    def test_overdue_loans_use_index(self):
+        plan = self.get_query_plan(AllLoanedBooksListView, overdue='1')
+        self.assertUsesIndexInOrder(plan, 'bookinst_status_due_idx')
+        self.assertIn('due_back<?', plan)
+        plan = self.get_query_plan(LoanedBooksByUserListView, overdue='1')
+        self.assertUsesIndexInOrder(plan, 'bookinst_borrower_loans_idx')
+
+class RenewBookInstancesViewTest(ViewTestCase):
     def setUp(self):
         # Create two users
         # setUp used instead of setUpTestData because the objects will be modified later
@@ -272,6 +589,16 @@ class RenewBookInstancesViewTest(TestCase):
         response = self.client.post(reverse('renew-book-librarian', kwargs={'pk': self.test_bookinstance1.pk}), {'renewal_date': valid_date_in_future})
         self.assertRedirects(response, reverse('all-borrowed'))
 
+    def test_cannot_renew_returned_copy(self):
+        self.test_bookinstance1.mark_returned()
+        login = self.client.login(username='testuser2', password='18DFH5jhkeHO!')
+        valid_date_in_future = datetime.date.today() + datetime.timedelta(weeks=2)
+        response = self.client.post(reverse('renew-book-librarian', kwargs={'pk': self.test_bookinstance1.pk}), {'renewal_date': valid_date_in_future})
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response, 'form', None, 'This copy is no longer on loan, so it cannot be renewed.')
+        self.test_bookinstance1.refresh_from_db()
+        self.assertIsNone(self.test_bookinstance1.due_back)
+
     def test_form_invalid_renewal_date_past(self):
         login = self.client.login(username='testuser2', password='18DFH5jhkeHO!')
         date_in_past = datetime.date.today() - datetime.timedelta(weeks=1)
@@ -291,9 +618,108 @@ class RenewBookInstancesViewTest(TestCase):
         self.assertFormError(response, 'form', 'renewal_date', 'Invalid date - renewal more than 4 weeks ahead')
 
 
+class ExportCatalogViewTest(ViewTestCase):
+    def setUp(self):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<IIbnibusdg')
+        test_user2 = User.objects.create_user(username='testuser2', password='18DFH5jhkeHO!')
+        test_user2.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        test_book = Book.objects.create(title='Book Title', summary='My book summary.', isbn='ABCDEFG')
+        for copy in range(3):
+            BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='o', borrower=test_user1)
+
+    def test_redirect_if_logged_in_but_not_correct_permissions(self):
+        self.client.login(username='testuser1', password='1X<IIbnibusdg')
+        response = self.client.get(reverse('export-catalog', kwargs={'name': 'copies'}))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith('/accounts/login/'))
+
+    def test_streams_csv(self):
+        self.client.login(username='testuser2', password='18DFH5jhkeHO!')
+        response = self.client.get(reverse('export-catalog', kwargs={'name': 'copies'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="copies.csv"')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'copy_id,book_id,isbn,title,imprint,status,due_back,borrower')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].endswith(',o,,testuser1'))
+
+    def test_streams_gzipped_jsonl(self):
+        self.client.login(username='testuser2', password='18DFH5jhkeHO!')
+        response = self.client.get(reverse('export-catalog', kwargs={'name': 'books'}), {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="books.jsonl.gz"')
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(json.loads(content)['title'], 'Book Title')
+
+    def test_unknown_export(self):
+        self.client.login(username='testuser2', password='18DFH5jhkeHO!')
+        response = self.client.get(reverse('export-catalog', kwargs={'name': 'users'}))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('export-catalog', kwargs={'name': 'books'}), {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+class CirculationBatchViewTest(ViewTestCase):
+    def setUp(self):
+        test_user1 = User.objects.create_user(username='testuser1', password='1X<IIbnibusdg')
+        test_user2 = User.objects.create_user(username='testuser2', password='18DFH5jhkeHO!')
+        test_user2.user_permissions.add(Permission.objects.get(name='Set book as returned'))
+
+        test_book = Book.objects.create(title='Book Title', summary='My book summary.', isbn='ABCDEFG')
+        self.copies = [
+            BookInstance.objects.create(book=test_book, imprint='Unlikely Imprint, 2016', status='a') for copy in range(3)
+        ]
+
+    def post(self, data):
+        return self.client.post(reverse('circulation-batch'), json.dumps(data), content_type='application/json')
+
+    def test_redirect_if_logged_in_but_not_correct_permissions(self):
+        self.client.login(username='testuser1', password='1X<IIbnibusdg')
+        response = self.post({'action': 'return', 'copies': []})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith('/accounts/login/'))
+
+    def test_only_post_allowed(self):
+        self.client.login(username='testuser2', password='18DFH5jhkeHO!')
+        response = self.client.get(reverse('circulation-batch'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_checkout_batch(self):
+        self.client.login(username='testuser2', password='18DFH5jhkeHO!')
+        copies = [str(copy.pk) for copy in self.copies]
+        response = self.post({'action': 'checkout', 'copies': copies, 'borrower': 'testuser1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['action'], 'checkout')
+        self.assertEqual([result['id'] for result in response.json()['results']], copies)
+        self.assertEqual(BookInstance.objects.filter(status='o', borrower__username='testuser1').count(), 3)
+
+        # A second checkout of the same copies fails for each of them and changes nothing
+        response = self.post({'action': 'checkout', 'copies': copies, 'borrower': 'testuser2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['ok'] for result in response.json()['results']], [False, False, False])
+        self.assertEqual(BookInstance.objects.filter(borrower__username='testuser2').count(), 0)
+
+    def test_bad_requests(self):
+        self.client.login(username='testuser2', password='18DFH5jhkeHO!')
+        response = self.client.post(reverse('circulation-batch'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.post({'action': 'checkout', 'copies': str(self.copies[0].pk), 'borrower': 'testuser1'})
+        self.assertEqual(response.status_code, 400)
+        for action in (['checkout'], {'checkout': True}, None):
+            response = self.post({'action': action, 'copies': [str(self.copies[0].pk)], 'borrower': 'testuser1'})
+            self.assertEqual(response.status_code, 400)
+        response = self.post({'action': 'checkout', 'copies': [str(self.copies[0].pk)], 'borrower': 'nobody'})
+        self.assertEqual(response.json(), {'error': 'No such borrower.'})
+        response = self.post({'action': 'renew', 'copies': [str(self.copies[0].pk)], 'due_back': '2000-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid date - renewal in past'})
+
 # Challenge yourself, part 10
 
-class AuthorCreateViewTest(TestCase):
+class AuthorCreateViewTest(ViewTestCase):
     def setUp(self):
         # Create two users, one with permission and one without
         # setUp used instead of setUpTestData because the objects will be modified later
@@ -0,0 +1,54 @@
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.urls import reverse
+
+from catalog.models import PageVisits
+from catalog.tests.utils import ViewTestCase
+from catalog.visits import VisitCounter, cookie_name
+
+
+class VisitorVisitsTest(ViewTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_visits_are_counted_in_a_cookie(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 0)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'You have visted this page 1 time.')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'You have visted this page 2 times.')
+
+    def test_anonymous_visits_create_no_session(self):
+        for _ in range(3):
+            self.client.get(reverse('index'))
+        self.assertNotIn('sessionid', self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    def test_tampered_cookie_counts_from_zero(self):
+        self.client.get(reverse('index'))
+        self.client.cookies[cookie_name('index')] = '41:forged'
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'You have visted this page 0 times.')
+
+
+class VisitCounterTest(ViewTestCase):
+    def test_visits_are_written_in_batches(self):
+        counter = VisitCounter(flush_visits=5, flush_seconds=60)
+        for _ in range(4):
+            counter.add('index')
+        counter.add('books')
+        self.assertFalse(PageVisits.objects.exists())
+        self.assertTrue(counter.due())
+
+        self.assertEqual(counter.flush(), 5)
+        self.assertFalse(counter.due())
+        counter.add('index', 3)
+        counter.flush()
+        self.assertEqual(dict(PageVisits.objects.values_list('page', 'count')), {'index': 7, 'books': 1})
+
+    def test_visits_are_written_after_flush_seconds(self):
+        counter = VisitCounter(flush_visits=100, flush_seconds=0)
+        self.assertFalse(counter.due())
+        counter.add('index')
+        self.assertTrue(counter.due())
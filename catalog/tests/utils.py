@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client, TestCase
+
+
+class QueryBudgetClient(Client):
+    """Test client failing the test when a view makes more queries than its budget."""
+
+    def request(self, **request):
+        response = super().request(**request)
+        metrics = getattr(response, 'query_metrics', None)
+        if metrics is not None and metrics.over_budget:
+            raise AssertionError(f'{response.resolver_match.view_name} went over its query budget: {metrics.describe()}')
+        return response
+
+
+class ViewTestCase(TestCase):
+    """Test case whose requests fail when a view goes over its query budget."""
+    client_class = QueryBudgetClient
+
+
+@contextmanager
+def run_on_commit_callbacks(using=DEFAULT_DB_ALIAS):
+    """Run the transaction.on_commit() callbacks registered in the block, as when it commits.
+
+    A TestCase never commits, so they would otherwise never run.
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    while len(connection.run_on_commit) > start:
+        _, callback = connection.run_on_commit.pop(start)
+        callback()
+
+
+class ReplicaDatabaseMixin:
+    """Adds a 'replica' SQLite database in a temporary file for the test case's tests.
+
+    The settings only configure the replica when LOCALLIBRARY_READ_REPLICAS
+    lists it. replicate() copies the schema along with the rows, so it needs
+    no test database of its own.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_directory = tempfile.mkdtemp()
+        connections.databases['replica'] = {
+            **connections.databases[DEFAULT_DB_ALIAS],
+            'NAME': os.path.join(cls.replica_directory, 'replica.sqlite3'),
+            'TEST': {},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(cls.replica_directory, ignore_errors=True)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 # this file redirects the URLS (for example, 'books/') to the view (for example, 'views.BookListView.as_view()')
 # the views can be functions (like 'views.index' or 'views.renew_book_librarian') or Django classes (like 'views.AuthorListView.as_view()')
@@ -7,12 +7,18 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'), # uses a function-based view
     path('books/', views.BookListView.as_view(), name='books'), # uses a class-based view
+    path('search/', views.search, name='search'),
     path('book/<int:pk>', views.BookDetailView.as_view(), name='book-detail'), # the pk parameter is passed to the view
     path('authors/', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>', views.AuthorDetailView.as_view(), name='author-detail'),
     path('mybooks/', views.LoanedBooksByUserListView.as_view(), name='my-borrowed'),
     path('borrowed/', views.AllLoanedBooksListView.as_view(), name='all-borrowed'),
     path('book/<uuid:pk>/renew', views.renew_book_librarian, name='renew-book-librarian'),
+    path('circulation/', views.circulation_batch, name='circulation-batch'),
+    path('export/<str:name>/', views.export_catalog, name='export-catalog'),
+    path('api/<str:resource>/', api.resource_list, name='api-list'), # read-only JSON API
+    path('api/<str:resource>/<str:pk>/', api.resource_detail, name='api-detail'),
+    path('metrics/', views.query_metrics, name='query-metrics'), # queries per view, for staff
     path('author/create/', views.AuthorCreate.as_view(), name='author_create'),
     path('author/<int:pk>/update', views.AuthorUpdate.as_view(), name='author_update'),
     path('author/<int:pk>/delete', views.AuthorDelete.as_view(), name='author_delete'),
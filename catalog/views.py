@@ -1,91 +1,190 @@
 import datetime
+import json
 
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import permission_required
-from django.http import HttpResponseRedirect
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.utils.translation import gettext as _
+from django.views.decorators.http import require_POST
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 
+from catalog import circulation, export, visits
+from catalog.caching import book_copies_version_name, get_version, instance_version_name, model_version_name
 from catalog.forms import RenewBookForm
 from catalog.models import Author
+from catalog.page_cache import cache_anonymous_page, cached_page
+from catalog.pagination import CursorPaginationMixin
+from catalog.querybudget import query_budget, view_stats
+from catalog.routers import read_from_primary
+from catalog.search import get_search_backend
+from catalog.stats import get_catalog_stats
+from catalog.template_backend import template_stats
 
 # Create your views here.
-from catalog.models import Book, Author, BookInstance, Genre
+from catalog.models import Book, Author, BookInstance, Genre, Language, LoanStateError
+@query_budget(7)
 def index(request):
     """View function for home page of site."""
 
-    # Generate counts of some of the main objects
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
+    # Counts of the main objects, computed in one query and cached between requests
+    stats = get_catalog_stats()
 
-    # Available books (status= 'a')
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
-
-    # The 'all()' is implied by default.
-    num_authors = Author.objects.count()
-
-    # Number of books that contain "novel"
-    num_books_with_novel = Book.objects.filter(title__icontains='novel').count()
-
-    # Number of genres that contain "fiction"
-    num_genres_with_fiction = Genre.objects.filter(name__icontains='fiction').count()
-
-    # Number of visits to this view, as counted in the session variable
-    num_visits = request.session.get('num_visits', 0)
-    request.session['num_visits'] = num_visits + 1
+    # Number of visits to this view, as counted in a cookie rather than the session,
+    # so that visitors without a session don't get one
+    num_visits = visits.visitor_visits(request, 'index')
 
     context = {
-        'num_books': num_books,
-        'num_books_with_novel': num_books_with_novel,
-        'num_genres_with_fiction': num_genres_with_fiction,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
+        **stats,
         'num_visits': num_visits,
     }
 
     # Render HTML template index.html with the data in the context variable
-    # render returns an HttpResponse object
-    return render(request, 'index.html', context=context)
+    # TemplateResponse renders it on the way out, so the render can be timed. Anonymous
+    # visitors with the same visit count get the same page, until a counted model changes.
+    counted = [model_version_name(model) for model in (Author, Book, BookInstance, Genre)]
+    response = cached_page(request, counted, lambda: TemplateResponse(request, 'index.html', context), vary=(num_visits,))
+    visits.count_visit(request, response, 'index', num_visits)
+    return response
+
+
+# Number of results on each page of search results
+SEARCH_RESULTS_PER_PAGE = 20
+
+@query_budget(6)
+def search(request):
+    """View function listing the books matching a full-text search, best match first."""
+    query = request.GET.get('q', '').strip()
+    try:
+        page_number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        raise Http404(_('Invalid page number.'))
+
+    # Ask for one result more than a page to know whether there is a next page
+    offset = (page_number - 1) * SEARCH_RESULTS_PER_PAGE
+    book_ids = get_search_backend().search(query, offset=offset, limit=SEARCH_RESULTS_PER_PAGE + 1)
+    has_next = len(book_ids) > SEARCH_RESULTS_PER_PAGE
+    book_ids = book_ids[:SEARCH_RESULTS_PER_PAGE]
+
+    books = Book.objects.select_related('author').in_bulk(book_ids)
+    context = {
+        'query': query,
+        'book_list': [books[book_id] for book_id in book_ids if book_id in books],
+        'page_number': page_number,
+        'previous_page_number': page_number - 1 if page_number > 1 else None,
+        'next_page_number': page_number + 1 if has_next else None,
+    }
+    return TemplateResponse(request, 'catalog/book_search.html', context)
 
 
 from django.views import generic
-class BookListView(generic.ListView):
+@method_decorator(cache_anonymous_page(models=(Book, Author)), name='dispatch')
+class BookListView(CursorPaginationMixin, generic.ListView):
     model = Book
     paginate_by = 10
+    cursor_ordering = ('title', 'id')
+    query_budget = 6
+
+    def get_queryset(self):
+        # Each book is listed with its author
+        return super().get_queryset().select_related('author')
 
+def book_version_names(pk):
+    return [instance_version_name(Book, pk), book_copies_version_name(pk)]
+
+@method_decorator(cache_anonymous_page(models=(Author, Genre, Language), rows=book_version_names), name='dispatch')
 class BookDetailView(generic.DetailView):
     model = Book
+    query_budget = 7
 
-class AuthorListView(generic.ListView):
+    def get_queryset(self):
+        # Author, language and genres are all shown, so load them up front
+        return Book.objects.select_related('author', 'language').prefetch_related('genre')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # The copies table is cached per book, keyed on a version that changes when a copy is saved.
+        # The copies are only queried when the table is rendered again, and read where the version
+        # was bumped: the primary.
+        context['copies_version'] = get_version(book_copies_version_name(self.object.pk))
+        context['copies'] = self.object.bookinstance_set.using(DEFAULT_DB_ALIAS)
+        return context
+
+@method_decorator(cache_anonymous_page(models=(Author,)), name='dispatch')
+class AuthorListView(CursorPaginationMixin, generic.ListView):
     model = Author
     paginate_by = 10
+    cursor_ordering = ('last_name', 'first_name', 'id')
+    query_budget = 6
 
+def author_version_names(pk):
+    return [instance_version_name(Author, pk)]
+
+# The author's books are listed with their copy counts, so any change to a book shows
+@method_decorator(cache_anonymous_page(models=(Book, Genre, Language), rows=author_version_names), name='dispatch')
 class AuthorDetailView(generic.DetailView):
     model = Author
+    query_budget = 7
 
-class LoanedBooksByUserListView(LoginRequiredMixin,generic.ListView):
-    """Generic class-based view listing books on loan to current user."""
-    model=BookInstance
-    template_name = 'catalog/bookinstance_list_borrowed_user.html'
+    def get_queryset(self):
+        # Fetch the author's books with everything the page shows in a fixed number of queries
+        books = Book.objects.with_listing_data()
+        return Author.objects.prefetch_related(Prefetch('book_set', queryset=books))
+
+class LoanListMixin(CursorPaginationMixin):
+    """List copies on loan with their book and borrower, and overdue worked out in SQL.
+
+    With ?overdue=1 only the overdue loans are listed, filtered by the database.
+    """
+    model = BookInstance
     paginate_by = 10
+    cursor_ordering = ('due_back', 'id')
+
+    def overdue_only(self):
+        return self.request.GET.get('overdue') == '1'
+
+    def get_loans(self):
+        return BookInstance.objects.on_loan()
 
     def get_queryset(self):
-        return BookInstance.objects.filter(borrower=self.request.user).filter(status__exact='o').order_by('due_back')
+        today = datetime.date.today()
+        loans = self.get_loans().select_related('book', 'borrower').with_overdue(today)
+        if self.overdue_only():
+            loans = loans.overdue(today)
+        return loans.order_by(*self.get_ordering())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['overdue_only'] = self.overdue_only()
+        # Keep the filter in the pagination links
+        context['pagination_query'] = 'overdue=1' if context['overdue_only'] else ''
+        return context
+
+class LoanedBooksByUserListView(LoginRequiredMixin, LoanListMixin, generic.ListView):
+    """Generic class-based view listing books on loan to current user."""
+    template_name = 'catalog/bookinstance_list_borrowed_user.html'
+    query_budget = 6
 
-class AllLoanedBooksListView(PermissionRequiredMixin, generic.ListView):
+    def get_loans(self):
+        return BookInstance.objects.filter(borrower=self.request.user).on_loan()
+
+class AllLoanedBooksListView(PermissionRequiredMixin, LoanListMixin, generic.ListView):
     """Generic class-based view listing all books on loan."""
     permission_required = 'catalog.can_mark_returned'
-    model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_librarian.html'
-    paginate_by = 10
-
-    def get_queryset(self):
-        return BookInstance.objects.filter(status__exact='o').order_by('due_back')
+    query_budget = 6
 
 
+@query_budget(7)
 @permission_required('catalog.can_mark_returned')
+@read_from_primary
 def renew_book_librarian(request, pk):
     """View function for renewing a specific BookInstance by librarian."""
     book_instance = get_object_or_404(BookInstance, pk=pk) # get the BookInstance with primary key pk
@@ -98,12 +197,14 @@ def renew_book_librarian(request, pk):
         # Check if the form is valid
         if form.is_valid():
             # Process the data in form.cleaned_data as required (do what form is supposed to do)
-            # Here we just write it to the model due_back field
-            book_instance.due_back = form.cleaned_data['renewal_date'] # change book instance in database
-            book_instance.save() # write to database
-
-            # Redirect to a new URL
-            return HttpResponseRedirect(reverse('all-borrowed')) # reverse gets the URL based on the string, because actual URL may change
+            # Here we write only the due_back field, and only while the copy is still on loan
+            try:
+                book_instance.renew(form.cleaned_data['renewal_date'])
+            except LoanStateError:
+                form.add_error(None, _('This copy is no longer on loan, so it cannot be renewed.'))
+            else:
+                # Redirect to a new URL
+                return HttpResponseRedirect(reverse('all-borrowed')) # reverse gets the URL based on the string, because actual URL may change
     # If this is a GET (or any other method) this (probably) means this is the first time the user has seen the form
     # Create the default form
     else:
@@ -115,38 +216,102 @@ def renew_book_librarian(request, pk):
         'book_instance': book_instance,
     }
 
-    return render(request, 'catalog/book_renew_librarian.html', context)
+    return TemplateResponse(request, 'catalog/book_renew_librarian.html', context)
 
+# No query budget: the export's queries run while the response streams, after the middleware has counted
+@permission_required('catalog.can_mark_returned')
+def export_catalog(request, name):
+    """View function streaming an export of the catalog or the loan ledger to a librarian."""
+    export_format = request.GET.get('format', 'csv')
+    if name not in export.EXPORTS or export_format not in export.FORMATS:
+        raise Http404(_('Unknown export.'))
+    compress = request.GET.get('gzip') == '1'
+
+    response = StreamingHttpResponse(
+        export.export_stream(name, export_format, compress),
+        content_type='application/gzip' if compress else export.CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = 'attachment; filename="%s"' % export.export_filename(name, export_format, compress)
+    return response
+
+@query_budget(10)
+@require_POST
+@permission_required('catalog.can_mark_returned')
+def circulation_batch(request):
+    """View function checking out, returning or renewing a batch of BookInstances in one transaction.
+
+    Takes a JSON body {"action": "checkout"|"return"|"renew", "copies": [ids],
+    "borrower": username (checkout only), "due_back": "YYYY-MM-DD" (optional)}
+    and returns the result for each copy.
+    """
+    try:
+        data = json.loads(request.body)
+        action = data['action']
+        copy_ids = data['copies']
+        if not isinstance(action, str) or not isinstance(copy_ids, list):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected a JSON object with "action" and a list of "copies".'}, status=400)
+
+    borrower = None
+    if data.get('borrower') is not None:
+        borrower = User.objects.filter(username=data['borrower']).first()
+        if borrower is None:
+            return JsonResponse({'error': 'No such borrower.'}, status=400)
+
+    try:
+        results = circulation.process_batch(action, copy_ids, borrower=borrower, due_back=data.get('due_back'))
+    except circulation.CirculationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'action': action, 'results': results})
+
+@staff_member_required
+def query_metrics(request):
+    """View function returning the queries, SQL time and render time of every view since the process started."""
+    return JsonResponse({'views': view_stats.snapshot(), 'templates': template_stats.snapshot()})
+
+@method_decorator(read_from_primary, name='dispatch')
 class AuthorCreate(PermissionRequiredMixin, CreateView):
     model = Author
     fields = '__all__'
     initial = {'date_of_death': '05/01/2018'}
     permission_required = 'catalog.can_edit_authors'
+    query_budget = 5
 
+@method_decorator(read_from_primary, name='dispatch')
 class AuthorUpdate(PermissionRequiredMixin, UpdateView):
     model = Author
     fields = ['first_name', 'last_name', 'date_of_birth', 'date_of_death']
     permission_required = 'catalog.can_edit_authors'
+    query_budget = 9
 
+@method_decorator(read_from_primary, name='dispatch')
 class AuthorDelete(PermissionRequiredMixin, DeleteView):
     model = Author
     success_url = reverse_lazy('authors') # reverse_lazy used because a URL to a class-based view attribute is used
     permission_required = 'catalog.can_edit_authors'
+    query_budget = 9
 
+@method_decorator(read_from_primary, name='dispatch')
 class BookCreate(PermissionRequiredMixin, CreateView):
     # uses template "book_form.html"
     model = Book
     fields = '__all__'
     permission_required = 'catalog.can_edit_books'
+    query_budget = 20
 
+@method_decorator(read_from_primary, name='dispatch')
 class BookUpdate(PermissionRequiredMixin, UpdateView):
     # uses template "book_form.html"
     model = Book
     fields = '__all__'
     permission_required = 'catalog.can_edit_books'
+    query_budget = 20
 
+@method_decorator(read_from_primary, name='dispatch')
 class BookDelete(PermissionRequiredMixin, DeleteView):
     # uses template "book_confirm_delete.html"
     model = Book
     success_url = reverse_lazy('books') # reverse_lazy used because a URL to a class-based view attribute is used
-    permission_required = 'catalog.can_edit_books'
\ No newline at end of file
+    permission_required = 'catalog.can_edit_books'
+    query_budget = 11
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""Visit counts that don't write to the database on every visit.
+
+Each visitor's own count of visits to a page is kept in a signed cookie, so
+counting a visit neither creates nor saves a session: anonymous visitors,
+crawlers included, get no session row at all.
+
+The number of visits to each page across the site is added up in memory and
+written to PageVisits in batches, one UPDATE per page, after every
+FLUSH_VISITS visits or FLUSH_SECONDS seconds. The write is made by a
+request counting a visit, once its response has been sent (on
+request_finished), so it is not part of the request's queries, and other
+requests never write. Visits not yet written are lost if the process stops.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.core.signals import request_finished
+from django.db import DatabaseError
+from django.db.models import F
+from django.dispatch import receiver
+
+from catalog.models import PageVisits
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+COOKIE_SALT = 'catalog.visits'
+
+# Keep a visitor's counts for a year
+COOKIE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Visits (across all pages) and seconds after which the counts are written
+FLUSH_VISITS = 100
+FLUSH_SECONDS = 10
+
+
+def cookie_name(page):
+    return f'visits_{page}'
+
+
+def visitor_visits(request, page):
+    """Return how many times the visitor has visited page before."""
+    try:
+        return int(request.get_signed_cookie(cookie_name(page), default=0, salt=COOKIE_SALT))
+    except ValueError:
+        return 0
+
+
+def count_visit(request, response, page, visits):
+    """Count a visit to page, the visitor's previous visits being visits."""
+    response.set_signed_cookie(cookie_name(page), visits + 1, salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE,
+                               httponly=True, samesite='Lax')
+    page_visits.add(page)
+    _state.counted = True
+
+
+class VisitCounter:
+    """Visits per page, added up in memory until they are written."""
+
+    def __init__(self, flush_visits=FLUSH_VISITS, flush_seconds=FLUSH_SECONDS):
+        self.flush_visits = flush_visits
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.flushed_at = time.monotonic()
+
+    def add(self, page, visits=1):
+        with self.lock:
+            self.pending[page] += visits
+
+    def due(self):
+        with self.lock:
+            return bool(self.pending) and (
+                sum(self.pending.values()) >= self.flush_visits
+                or time.monotonic() - self.flushed_at >= self.flush_seconds
+            )
+
+    def flush(self):
+        """Write the pending visits, and return how many were written."""
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.flushed_at = time.monotonic()
+        written = 0
+        try:
+            for page, visits in pending.items():
+                if not PageVisits.objects.filter(page=page).update(count=F('count') + visits):
+                    PageVisits.objects.get_or_create(page=page)
+                    PageVisits.objects.filter(page=page).update(count=F('count') + visits)
+                written += visits
+                pending[page] = 0
+        except DatabaseError:
+            # Keep what wasn't written for the next flush
+            with self.lock:
+                self.pending.update(+pending)
+            raise
+        return written
+
+
+page_visits = VisitCounter()
+
+
+@receiver(request_finished)
+def flush_page_visits(sender, **kwargs):
+    counted, _state.counted = getattr(_state, 'counted', False), False
+    if counted and page_visits.due():
+        try:
+            page_visits.flush()
+        except DatabaseError:
+            logger.warning('Could not write the page visit counts', exc_info=True)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,6 +42,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it counts the queries of all the other middleware
+    'catalog.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,13 +51,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'catalog.middleware.PrimaryPinningMiddleware',
 ]
 
 ROOT_URLCONF = 'locallibrary.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend, timing renders (see catalog.template_backend)
+        'BACKEND': 'catalog.template_backend.DjangoTemplates',
+        'NAME': 'django',
         'DIRS': [
             os.path.join(BASE_DIR, 'templates'),
         ],
@@ -70,19 +76,98 @@ TEMPLATES = [
     },
 ]
 
+# Set LOCALLIBRARY_TEMPLATE_MODE to 'production' to keep compiled templates in memory with
+# the cached loader, which Django only does by itself when DEBUG is off, and to compile all
+# of the site's templates when a worker starts rather than on the first request using them.
+TEMPLATE_MODE = os.environ.get('LOCALLIBRARY_TEMPLATE_MODE', 'default')
+
+if TEMPLATE_MODE == 'production':
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS'].update({
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+        'preload': True,
+    })
+
 WSGI_APPLICATION = 'locallibrary.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# Databases the catalog's reads are spread over (see catalog.routers), e.g. LOCALLIBRARY_READ_REPLICAS=replica
+CATALOG_READ_REPLICAS = [alias for alias in os.environ.get('LOCALLIBRARY_READ_REPLICAS', '').split(',') if alias]
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
+}
+
+# A read replica of default, only configured once listed in LOCALLIBRARY_READ_REPLICAS.
+# Locally it is kept up to date by `manage.py replicate --interval N`.
+if 'replica' in CATALOG_READ_REPLICAS:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
     }
+
+DATABASE_ROUTERS = ['catalog.routers.PrimaryReplicaRouter']
+
+# Seconds a user reads from the primary after changing something, so they see their change before the replicas do
+CATALOG_PRIMARY_PIN_SECONDS = 10
+
+# Tuning profiles for the SQLite database, picked with the LOCALLIBRARY_DATABASE_PROFILE
+# environment variable. 'production' keeps connections open between requests and runs
+# PRAGMAS on every new connection (see catalog.db): WAL lets requests read while another
+# writes, and writers wait for the lock instead of failing with "database is locked".
+DATABASE_PROFILES = {
+    'default': {},
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # Seconds to wait for another connection's write lock
+            'timeout': 20,
+            # Prepared statements kept by each connection (the sqlite3 module keeps 128)
+            'cached_statements': 512,
+        },
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            # Safe with WAL: a power loss may lose the last commits, but can't corrupt the database
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'busy_timeout': 20000,
+            'temp_store': 'MEMORY',
+        },
+    },
 }
 
+DATABASE_PROFILE = os.environ.get('LOCALLIBRARY_DATABASE_PROFILE', 'default')
+
+for database in DATABASES.values():
+    database.update(DATABASE_PROFILES[DATABASE_PROFILE])
+
+# The catalog keeps pages, API responses, counts and the versions invalidating them in the
+# default cache. Local memory is one cache per process, fine for runserver. The production
+# profile is for several workers, which share a file-based cache so that a change made
+# through one worker invalidates what the others cached (see catalog.checks).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+if DATABASE_PROFILE == 'production':
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('LOCALLIBRARY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'locallibrary-cache')),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -122,6 +207,24 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Page the catalog list views with opaque cursors (keyset pagination) instead of page numbers
+CATALOG_CURSOR_PAGINATION = False
+
+# Search backend for /catalog/search/ (None picks SQLite FTS5 when available, else the in-memory index)
+CATALOG_SEARCH_BACKEND = None
+
+# Seconds the JSON API keeps a response body in the cache (keyed on its ETag), 0 to disable
+CATALOG_API_CACHE_TIMEOUT = 300
+
+# Cache (an alias in CACHES) keeping whole catalog pages for anonymous users, and for how many seconds (0 to disable)
+CATALOG_PAGE_CACHE = 'default'
+CATALOG_PAGE_CACHE_TIMEOUT = 600
+
+# Django's model backend, with users' permissions loaded in one query and cached (see catalog.permissions).
+# Only with a cache the workers share, or a worker would go on granting permissions revoked through another.
+if CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache':
+    AUTHENTICATION_BACKENDS = ['catalog.permissions.CachedPermissionBackend']
+
 # Redirect to home URL after login (Default redirects to /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
 